@@ -0,0 +1,151 @@
+import os
+import csv
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from utils.benchmarking import (
+    TF_RUNTIME_FORMATS,
+    artifact_format,
+    tf_graph_source,
+    sample_images,
+    benchmark_artifact,
+    validate_artifact
+)
+from utils.export_targets import EXPORT_INDEX_FILENAME
+from utils.packed_dataset import unpacked_dir, unpack_split
+
+
+def load_config(config_path):
+    with open(config_path, "r") as f:
+        return json.load(f)
+
+
+def list_artifacts(run_dir):
+    """
+    Return the trained best.pt followed by every artifact recorded by export.py and every accepted
+    quantized artifact of quantize.py, as a dict name -> path.
+    """
+    artifacts = {"pt": os.path.join(run_dir, "weights", "best.pt")}
+    index_path = os.path.join(run_dir, "exports", EXPORT_INDEX_FILENAME)
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            for group in json.load(f).values():
+                artifacts.update(group["artifacts"])
+    report_path = os.path.join(run_dir, "quantized", "quantization_report.json")
+    if os.path.exists(report_path):
+        with open(report_path, "r") as f:
+            for fmt, result in json.load(f)["results"].items():
+                if result.get("accepted"):
+                    artifacts[f"{fmt}_int8_ptq"] = result["path"]
+    return artifacts
+
+
+def main(config_path):
+    config = load_config(config_path)
+    training_config = config.get("training", {})
+    benchmark_config = config.get("benchmark", {})
+    output_dataset_dir = config["output_dataset_dir"]
+
+    project = training_config.get("project", "default_project")
+    experiment_name = training_config.get("experiment_name", "default_experiment")
+    imgsz = training_config.get("imgsz", 640)
+    run_dir = os.path.join(project, experiment_name)
+
+    cores = os.cpu_count() or 1
+    batch_sizes = benchmark_config.get("batch_sizes", [1, 4])
+    thread_counts = benchmark_config.get("threads", sorted({1, cores}))
+    warmup = benchmark_config.get("warmup", 3)
+    runs = benchmark_config.get("runs", 20)
+    data_yaml = os.path.join(output_dataset_dir, "data.yaml")
+    val_images = os.path.join(output_dataset_dir, "val", "images")
+    if config.get("dataset_format", "files") == "packed":
+        # Ultralytics validation can't read the pack: time and validate on a files copy of the val split.
+        data_yaml = unpack_split(output_dataset_dir, config["tags"])
+        val_images = os.path.join(unpacked_dir(output_dataset_dir), "val", "images")
+    image_paths = sample_images(val_images, benchmark_config.get("samples", 32)) if os.path.isdir(val_images) else []
+    if not image_paths:
+        print("No validation images found. Please prepare the dataset first.")
+        return
+
+    rows = []
+    accuracy = {}
+    # One fresh process per artifact: runtimes don't share state and peak memory is per artifact.
+    context = multiprocessing.get_context("spawn")
+    for name, path in list_artifacts(run_dir).items():
+        fmt = artifact_format(path)
+        if not os.path.exists(path):
+            print(f"Skipping {name}: {path} not found.")
+            continue
+        if fmt in ("pb", "tfjs"):
+            print(f"Warning: {name} is timed through {tf_graph_source(path)} on the TensorFlow CPU runtime, "
+                  f"its latency in the {'TF.js' if fmt == 'tfjs' else 'target'} runtime will differ.")
+        print(f"Benchmarking {name} ({path})...")
+        # TensorFlow sizes its thread pools once per process, so each thread count gets its own process.
+        thread_groups = [[threads] for threads in thread_counts] if fmt in TF_RUNTIME_FORMATS else [thread_counts]
+        try:
+            artifact_rows = []
+            for threads in thread_groups:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    artifact_rows.extend(executor.submit(
+                        benchmark_artifact, path, image_paths, imgsz, batch_sizes, threads, warmup, runs
+                    ).result())
+            if benchmark_config.get("map", True):
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    accuracy[name] = executor.submit(validate_artifact, path, data_yaml, imgsz).result()
+        except Exception as e:
+            print(f"Benchmark of {name} failed: {e}")
+            continue
+        for row in artifact_rows:
+            row["name"] = name
+        rows.extend(artifact_rows)
+
+    if not rows:
+        print("Nothing was benchmarked.")
+        return
+
+    # mAP drift of every artifact relative to the PyTorch weights
+    reference = accuracy.get("pt")
+    for row in rows:
+        metrics = accuracy.get(row["name"], {})
+        row["map50"] = metrics.get("map50")
+        row["map"] = metrics.get("map")
+        row["map_drift"] = metrics["map"] - reference["map"] if metrics and reference else None
+
+    benchmarks_dir = os.path.join(run_dir, "benchmarks")
+    os.makedirs(benchmarks_dir, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    json_path = os.path.join(benchmarks_dir, f"benchmark_{stamp}.json")
+    csv_path = os.path.join(benchmarks_dir, f"benchmark_{stamp}.csv")
+    columns = ["name", "format", "threads", "batch", "batched", "p50_ms", "p95_ms", "p99_ms", "throughput",
+               "peak_rss_mb", "size_mb", "map50", "map", "map_drift", "artifact"]
+    with open(json_path, "w") as f:
+        json.dump({"imgsz": imgsz, "samples": len(image_paths), "results": rows}, f, indent=4)
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    print(f"{'name':<16} {'thr':>4} {'batch':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'img/s':>8} {'MB':>7} {'RSS MB':>8} {'mAP drift':>10}")
+    for row in rows:
+        drift = f"{row['map_drift']:+.4f}" if row["map_drift"] is not None else "-"
+        print(f"{row['name']:<16} {row['threads']:>4} {row['batch']:>5} {row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} "
+              f"{row['p99_ms']:>9.1f} {row['throughput']:>8.1f} {row['size_mb']:>7.1f} "
+              f"{row['peak_rss_mb']:>8.0f} {drift:>10}")
+    print(f"Benchmark results written to {json_path} and {csv_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the exported models of a configuration on the CPU"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=os.path.join("configs", "config.json"),
+        help="Path to configuration JSON file"
+    )
+    args = parser.parse_args()
+    main(args.config)
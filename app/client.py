@@ -37,6 +37,20 @@ def export_model(config_file):
     except subprocess.CalledProcessError as e:
         print(f"Error during model export: {e}")
 
+def quantize_model(config_file):
+    """Run quantize.py with the selected configuration file."""
+    try:
+        subprocess.run(["python", "app/quantize.py", "--config", "./configs/"+config_file], check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error during quantization: {e}")
+
+def benchmark_model(config_file):
+    """Run benchmark.py with the selected configuration file."""
+    try:
+        subprocess.run(["python", "app/benchmark.py", "--config", "./configs/"+config_file], check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"Error during benchmark: {e}")
+
 def main_menu():
     while True:
         config_files = list_config_files()
@@ -48,7 +62,9 @@ def main_menu():
                 "Create a new configuration",
                 "Prepare dataset",
                 "Train based on configuration",
-                "Export model to tfjs",
+                "Export model",
+                "Quantize model to int8",
+                "Benchmark exported models",
                 "Quit"
             ]
         answer = inquirer.prompt([
@@ -80,7 +96,7 @@ def main_menu():
             ])
             if selected and selected.get("config_file"):
                 train_model(selected["config_file"])
-        elif option == "Export model to tfjs":
+        elif option == "Export model":
             config_files = list_config_files()
             if not config_files:
                 print("No configuration files found. Please create one first.")
@@ -90,6 +106,26 @@ def main_menu():
             ])
             if selected and selected.get("config_file"):
                 export_model(selected["config_file"])
+        elif option == "Quantize model to int8":
+            config_files = list_config_files()
+            if not config_files:
+                print("No configuration files found. Please create one first.")
+                continue
+            selected = inquirer.prompt([
+                inquirer.List('config_file', message="Select a configuration file for quantization", choices=config_files)
+            ])
+            if selected and selected.get("config_file"):
+                quantize_model(selected["config_file"])
+        elif option == "Benchmark exported models":
+            config_files = list_config_files()
+            if not config_files:
+                print("No configuration files found. Please create one first.")
+                continue
+            selected = inquirer.prompt([
+                inquirer.List('config_file', message="Select a configuration file for benchmark", choices=config_files)
+            ])
+            if selected and selected.get("config_file"):
+                benchmark_model(selected["config_file"])
         elif option == "Quit":
             print("Exiting...")
             break
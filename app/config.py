@@ -1,7 +1,7 @@
 import os
 import json
 import inquirer
-import requests
+from utils.labelstudio_client import LabelStudioClient
 
 API_KEY_FILE = ".apikey"
 CONFIGS_DIR = "configs"
@@ -18,29 +18,19 @@ def save_api_key(key):
         f.write(key)
 
 
-def get_label_studio_projects(api_key, base_url):
-    headers = {"Authorization": f"Token {api_key}"}
-    url = f"{base_url}/api/projects"
-    response = requests.get(url, headers=headers)
-    if response.ok:
-        data = response.json()
-        if isinstance(data, dict) and "results" in data:
-            return data["results"]
-        else:
-            return data
-    else:
-        raise Exception(f"Failed to fetch projects: {response.status_code} {response.text}")
+def get_label_studio_projects(client):
+    try:
+        return client.list_projects()
+    except Exception as e:
+        raise Exception(f"Failed to fetch projects: {e}")
 
 
-def get_project_detail(api_key, base_url, project_id):
-    headers = {"Authorization": f"Token {api_key}"}
-    url = f"{base_url}/api/projects/{project_id}"
-    response = requests.get(url, headers=headers)
-    if response.ok:
-        return response.json()
-    else:
-        raise Exception(
-            f"Failed to fetch project detail for project {project_id}: {response.status_code} {response.text}")
+def get_project_detail(client, project_id):
+    try:
+        detail, _ = client.get_project(project_id)
+        return detail
+    except Exception as e:
+        raise Exception(f"Failed to fetch project detail for project {project_id}: {e}")
 
 
 def main():
@@ -60,8 +50,9 @@ def main():
         api_key = input("Enter your Label Studio API Key: ")
         save_api_key(api_key)
 
+    client = LabelStudioClient(api_key, base_url)
     try:
-        projects = get_label_studio_projects(api_key, base_url)
+        projects = get_label_studio_projects(client)
     except Exception as e:
         print("Error fetching projects:", e)
         return
@@ -90,7 +81,7 @@ def main():
 
     selected_project_id = project_answer["project_id"]
     try:
-        selected_project_detail = get_project_detail(api_key, base_url, selected_project_id)
+        selected_project_detail = get_project_detail(client, selected_project_id)
     except Exception as e:
         print("Error fetching project detail:", e)
         return
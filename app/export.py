@@ -1,7 +1,10 @@
 import json
 import os
 import argparse
-from ultralytics import YOLO
+from utils.export_targets import export_targets, DEFAULT_TARGETS
+from utils.benchmarking import artifact_size
+from utils.packed_dataset import unpack_split
+from utils.instrumentation import configure_metrics, stage, count
 
 def load_config(config_path):
     with open(config_path, "r") as f:
@@ -9,7 +12,13 @@ def load_config(config_path):
 
 def main(config_path):
     config = load_config(config_path)
+    configure_metrics(config)
+    with stage("export"):
+        export(config)
+
+def export(config):
     training_config = config.get("training", {})
+    export_config = config.get("export", {})
     output_dataset_dir = config["output_dataset_dir"]
 
     project = training_config.get("project", "default_project")
@@ -19,13 +28,40 @@ def main(config_path):
     model_path = os.path.join(project, experiment_name, "weights", "best.pt")
     print(f"Loading model from: {model_path}")
 
-    model = YOLO(model_path)
-    # Export the model to TFJS format
-    model.export(format='tfjs')
+    # int8 targets calibrate on the prepared dataset unless they name their own data.yaml
+    targets = []
+    data_yaml = None
+    for target in export_config.get("targets", DEFAULT_TARGETS):
+        target = dict(target)
+        if target.get("int8") and "data" not in target:
+            if data_yaml is None and config.get("dataset_format", "files") == "packed":
+                # The exporters calibrate on the val entry, which they can only read as files.
+                data_yaml = unpack_split(output_dataset_dir, config["tags"])
+            elif data_yaml is None:
+                data_yaml = os.path.join(output_dataset_dir, "data.yaml")
+            target["data"] = data_yaml
+        targets.append(target)
+
+    # Export every target, building independent targets in parallel processes
+    exports_dir = os.path.join(project, experiment_name, "exports")
+    artifacts, failures = export_targets(
+        model_path,
+        targets,
+        exports_dir,
+        imgsz=training_config.get("imgsz", 640),
+        workers=export_config.get("workers")
+    )
+
+    for name, path in sorted(artifacts.items()):
+        print(f"  {name}: {path}")
+        if os.path.exists(path):
+            count(size=artifact_size(path), files=1)
+    for name, error in sorted(failures.items()):
+        print(f"  {name}: FAILED ({error})")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Export YOLO model to TensorFlow.js format using a configuration file"
+        description="Export YOLO model to the formats listed in a configuration file"
     )
     parser.add_argument(
         "--config",
@@ -34,4 +70,4 @@ if __name__ == "__main__":
         help="Path to configuration JSON file"
     )
     args = parser.parse_args()
-    main(args.config)
\ No newline at end of file
+    main(args.config)
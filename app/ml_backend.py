@@ -0,0 +1,184 @@
+import os
+import json
+import argparse
+import threading
+from urllib.parse import urljoin
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+from utils.prediction import (
+    LRUCache,
+    MicroBatcher,
+    YOLOPredictor,
+    StubPredictor,
+    image_hash,
+    decode_image,
+    parse_label_config,
+    to_labelstudio_results
+)
+
+
+def load_config(config_path):
+    with open(config_path, "r") as f:
+        return json.load(f)
+
+
+class PredictionService:
+    """
+    Pre-labels Label Studio tasks: downloads task images, serves repeated images from an LRU cache
+    keyed by image hash, and micro-batches the others across concurrent requests.
+    """
+
+    def __init__(self, predictor, names, api_key=None, max_batch_size=8, max_wait_ms=20, cache_size=1024):
+        self.predictor = predictor
+        self.names = names
+        self.api_key = api_key
+        self.base_url = os.environ.get("LABEL_STUDIO_URL", "http://localhost:8080")
+        self.session = requests.Session()
+        self.cache = LRUCache(cache_size)
+        self.batcher = MicroBatcher(self._predict_batch, max_batch_size, max_wait_ms)
+        self.requests = 0
+        self.tasks = 0
+        self.lock = threading.Lock()
+
+    def _predict_batch(self, images):
+        return self.predictor.predict(images)
+
+    def fetch_image(self, url):
+        headers = {}
+        if url.startswith("/") or url.startswith(self.base_url):
+            url = urljoin(self.base_url, url)
+            if self.api_key:
+                headers["Authorization"] = f"Token {self.api_key}"
+        response = self.session.get(url, headers=headers, timeout=30)
+        response.raise_for_status()
+        return response.content
+
+    def predict_tasks(self, tasks, label_config=None):
+        from_name, to_name, _ = parse_label_config(label_config) or ("label", "image", self.names)
+        with self.lock:
+            self.requests += 1
+            self.tasks += len(tasks)
+
+        pending = []
+        for task in tasks:
+            data = task.get("data", {})
+            url = data.get(to_name) or data.get("image") or next(iter(data.values()), None)
+            content = self.fetch_image(url)
+            key = image_hash(content)
+            cached = self.cache.get(key)
+            if cached is not None:
+                pending.append((key, None, cached))
+                continue
+            image = decode_image(content)
+            pending.append((key, image, self.batcher.submit(image)))
+
+        predictions = []
+        for key, image, result in pending:
+            if image is not None:
+                detections = result.result()
+                result = {"detections": detections, "width": image.width, "height": image.height}
+                self.cache.put(key, result)
+            results, score = to_labelstudio_results(
+                result["detections"], result["width"], result["height"], self.names, from_name, to_name
+            )
+            predictions.append({"result": results, "score": score, "model_version": self.predictor.version})
+        return predictions
+
+    def metrics(self):
+        with self.lock:
+            metrics = {"requests": self.requests, "tasks": self.tasks}
+        metrics.update(self.batcher.metrics())
+        metrics["cache"] = {"size": len(self.cache.items), "hits": self.cache.hits, "misses": self.cache.misses}
+        return metrics
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        """
+        Label Studio ML backend protocol: /health, /setup, /predict and /webhook, plus /metrics.
+        """
+
+        def _send(self, payload, status=200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            return json.loads(self.rfile.read(length) or b"{}")
+
+        def do_GET(self):
+            if self.path in ("/", "/health"):
+                self._send({"status": "UP", "model_class": "YOLOBackend"})
+            elif self.path == "/metrics":
+                self._send(service.metrics())
+            else:
+                self._send({"error": "not found"}, 404)
+
+        def do_POST(self):
+            try:
+                payload = self._read_json()
+                if self.path == "/setup":
+                    self._send({"model_version": service.predictor.version})
+                elif self.path == "/predict":
+                    predictions = service.predict_tasks(payload.get("tasks", []), payload.get("label_config"))
+                    self._send({"results": predictions, "model_version": service.predictor.version})
+                elif self.path == "/webhook":
+                    self._send({"status": "ok"}, 201)
+                else:
+                    self._send({"error": "not found"}, 404)
+            except Exception as e:
+                self._send({"error": str(e)}, 500)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(config_path, model_path=None, host="0.0.0.0", port=9090, max_batch_size=8, max_wait_ms=20,
+         cache_size=1024, stub=False):
+    config = load_config(config_path)
+    training_config = config.get("training", {})
+    project = training_config.get("project", "default_project")
+    experiment_name = training_config.get("experiment_name", "default_experiment")
+    model_path = model_path or os.path.join(project, experiment_name, "weights", "best.pt")
+
+    if stub:
+        predictor = StubPredictor()
+    else:
+        print(f"Loading model from: {model_path}")
+        predictor = YOLOPredictor(model_path, imgsz=training_config.get("imgsz", 640))
+
+    service = PredictionService(predictor, config["tags"], config.get("api_key"), max_batch_size, max_wait_ms,
+                                cache_size)
+    server = ThreadingHTTPServer((host, port), make_handler(service))
+    print(f"ML backend listening on http://{host}:{port} (model version: {predictor.version})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("Stopping ML backend...")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve a trained YOLO model as a Label Studio ML backend"
+    )
+    parser.add_argument("--config", type=str, default=os.path.join("configs", "config.json"),
+                        help="Path to configuration JSON file")
+    parser.add_argument("--model", type=str, default=None,
+                        help="Model to serve (best.pt or exported .onnx), defaults to the config's best.pt")
+    parser.add_argument("--host", type=str, default="0.0.0.0", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=9090, help="Port to listen on")
+    parser.add_argument("--max-batch-size", type=int, default=8, help="Maximum number of images per batch")
+    parser.add_argument("--max-wait-ms", type=float, default=20, help="Maximum time to wait for a batch to fill")
+    parser.add_argument("--cache-size", type=int, default=1024, help="Number of predictions kept in the LRU cache")
+    parser.add_argument("--stub", action="store_true", help="Serve fixed predictions instead of loading a model")
+    args = parser.parse_args()
+    main(args.config, args.model, args.host, args.port, args.max_batch_size, args.max_wait_ms, args.cache_size,
+         args.stub)
@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import importlib
+import traceback
+from utils.manifest import hash_file
+from utils.checkpoints import training_fingerprint
+from utils.export_targets import EXPORT_INDEX_FILENAME
+
+STAGES = ("prepare", "train", "export")
+STATE_FILENAME = "pipeline_state.json"
+
+
+def load_config(config_path):
+    with open(config_path, "r") as f:
+        return json.load(f)
+
+
+def _digest(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def run_dir_of(config):
+    training_config = config.get("training", {})
+    return os.path.join(training_config.get("project", "default_project"),
+                        training_config.get("experiment_name", "default_experiment"))
+
+
+def stage_inputs(stage, config):
+    """
+    Return a digest of everything a stage depends on, or None when the stage has to run anyway.
+
+    - prepare always runs: its input lives in Label Studio, and prepare.py already skips unchanged projects.
+    - train depends on the dataset manifest and the training hyperparameters.
+    - export depends on the export targets, the image size and the hash of best.pt.
+    """
+    run_dir = run_dir_of(config)
+    if stage == "train":
+        fingerprint = training_fingerprint(config)
+        return fingerprint["digest"] if fingerprint["dataset"] else None
+    if stage == "export":
+        weights = os.path.join(run_dir, "weights", "best.pt")
+        if not os.path.exists(weights):
+            return None
+        return _digest({
+            "export": config.get("export", {}),
+            "imgsz": config.get("training", {}).get("imgsz", 640),
+            "weights": hash_file(weights),
+        })
+    return None
+
+
+def stage_outputs_exist(stage, config):
+    run_dir = run_dir_of(config)
+    if stage == "train":
+        return os.path.exists(os.path.join(run_dir, "weights", "best.pt"))
+    if stage == "export":
+        return os.path.exists(os.path.join(run_dir, "exports", EXPORT_INDEX_FILENAME))
+    return False
+
+
+def load_state(run_dir):
+    path = os.path.join(run_dir, STATE_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_state(run_dir, state):
+    os.makedirs(run_dir, exist_ok=True)
+    path = os.path.join(run_dir, STATE_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def run_stage(stage, config_path, force=False):
+    # Stage modules are imported once per process, so ultralytics and TensorFlow load a single time.
+    module = importlib.import_module(stage)
+    if force and stage == "prepare":
+        # prepare.py skips the projects that did not change in Label Studio unless told otherwise.
+        module.main(config_path, force_export=True)
+    else:
+        module.main(config_path)
+
+
+def run_config(config_path, stages, force=False):
+    """
+    Run the given stages of one configuration in order, skipping the stages whose inputs match
+    the last successful run recorded in <project>/<experiment_name>/pipeline_state.json.
+    Stops at the first failing stage. Returns a list of (stage, status, seconds) rows.
+    """
+    config = load_config(config_path)
+    run_dir = run_dir_of(config)
+    state = load_state(run_dir)
+    rows = []
+    for stage in stages:
+        inputs = stage_inputs(stage, config)
+        previous = state.get(stage, {})
+        if not force and inputs and previous.get("inputs") == inputs and stage_outputs_exist(stage, config):
+            print(f"[{config_path}] {stage}: inputs unchanged since {previous.get('completed_at')}, skipping.")
+            rows.append((stage, "skipped", 0.0))
+            continue
+
+        print(f"[{config_path}] {stage}: running...")
+        start = time.perf_counter()
+        try:
+            run_stage(stage, config_path, force)
+        except (Exception, SystemExit) as e:
+            elapsed = time.perf_counter() - start
+            traceback.print_exc()
+            print(f"[{config_path}] {stage}: failed after {elapsed:.1f}s ({e}), skipping the remaining stages.")
+            rows.append((stage, "failed", elapsed))
+            break
+        elapsed = time.perf_counter() - start
+        rows.append((stage, "ran", elapsed))
+
+        state[stage] = {
+            "inputs": inputs,
+            "completed_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "seconds": round(elapsed, 3),
+        }
+        save_state(run_dir, state)
+    return rows
+
+
+def print_summary(results):
+    print(f"{'config':<40} {'stage':<10} {'status':<8} {'time':>10}")
+    for config_path, rows in results:
+        for stage, status, seconds in rows:
+            print(f"{config_path:<40} {stage:<10} {status:<8} {seconds:>9.1f}s")
+    total = sum(seconds for _, rows in results for _, _, seconds in rows)
+    print(f"Total: {total:.1f}s")
+
+
+def main(config_paths, stages=STAGES, force=False):
+    results = [(config_path, run_config(config_path, stages, force)) for config_path in config_paths]
+    print_summary(results)
+    failed = any(status == "failed" for _, rows in results for _, status, _ in rows)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run the prepare, train and export stages of one or more configurations without prompts"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        action="append",
+        required=True,
+        help="Path to configuration JSON file (can be repeated)"
+    )
+    parser.add_argument(
+        "--stages",
+        type=str,
+        default=",".join(STAGES),
+        help=f"Comma-separated stages to run (default: {','.join(STAGES)})"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Run every stage even if its inputs are unchanged, and export every Label Studio project again"
+    )
+    args = parser.parse_args()
+    requested = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = [stage for stage in requested if stage not in STAGES]
+    if unknown:
+        parser.error(f"Unknown stages {unknown}, expected a subset of {list(STAGES)}")
+    # Stages always run in pipeline order.
+    sys.exit(main(args.config, [stage for stage in STAGES if stage in requested], args.force))
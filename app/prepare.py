@@ -1,13 +1,25 @@
 import os
 import json
+import time
 import shutil
+import asyncio
 import argparse
-from  utils.labelstudio_export import export_annotations
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.labelstudio_client import LabelStudioClient, AsyncLabelStudioClient, project_fingerprint, is_transient_error
+from utils.labelstudio_export import export_annotations, export_snapshot
+from utils.manifest import project_states, load_manifest
 from utils.dataset_preparation import (
-    merge_extracted_exports,
-    split_dataset_from_extracted,
+    index_extracted_export,
+    merge_indices,
+    sync_dataset,
+    validate_labels,
     generate_data_yaml
 )
+from utils.image_cache import build_resized_cache
+from utils.sweeping import search_space
+from utils.packed_dataset import DATASET_FORMATS, DEFAULT_SHARD_SIZE, packed_dir, sync_packed_dataset
+from utils.dedup import DEFAULT_MAX_DISTANCE, find_duplicates
+from utils.instrumentation import configure_metrics, stage, in_current_stages
 
 
 def load_config(config_path):
@@ -15,59 +27,277 @@ def load_config(config_path):
         return json.load(f)
 
 
-def main(config_path):
+def export_with_retry(project_id, api_key, export_format, client, retries=3, backoff=2.0, export_mode="sync",
+                      snapshot_options=None, extract_dir=None):
+    """
+    Export a single project, retrying attempts that failed with a transient error (see is_transient_error)
+    with exponential backoff.
+    `export_mode` is "sync" for the synchronous export endpoint or "snapshot" for the snapshot export API.
+    """
+    for attempt in range(retries + 1):
+        try:
+            if export_mode == "snapshot":
+                return export_snapshot(project_id, api_key, export_format, client=client, extract_dir=extract_dir,
+                                       **(snapshot_options or {}))
+            return export_annotations(project_id, api_key, export_format, client=client, extract_dir=extract_dir)
+        except Exception as e:
+            if attempt == retries or not is_transient_error(e):
+                raise
+            delay = backoff * (2 ** attempt)
+            print(f"Export of project {project_id} failed ({e}), retrying in {delay:.0f}s...")
+            time.sleep(delay)
+
+
+def fetch_project_states(client, project_ids, previous_states, export_format):
+    """
+    Fetch the detail of every project concurrently and return the current state of each one
+    (None when it couldn't be fetched). Projects with a known ETag are requested conditionally.
+    """
+    etags = {
+        project_id: previous_states.get(str(project_id), {}).get("etag")
+        for project_id in project_ids
+        if previous_states.get(str(project_id), {}).get("export_format") == export_format
+    }
+
+    async def fetch():
+        async with AsyncLabelStudioClient(client) as async_client:
+            return await async_client.get_projects(project_ids, etags)
+
+    states = {}
+    for project_id, result in zip(project_ids, asyncio.run(fetch())):
+        if isinstance(result, Exception):
+            print(f"Could not check project {project_id} for changes: {result}")
+            states[str(project_id)] = None
+            continue
+        detail, etag = result
+        if detail is None:
+            # 304 Not Modified
+            states[str(project_id)] = previous_states[str(project_id)]
+        else:
+            states[str(project_id)] = {
+                "fingerprint": project_fingerprint(detail),
+                "etag": etag,
+                "export_format": export_format,
+            }
+    return states
+
+
+def export_dir_of(output_dataset_dir, project_id):
+    return os.path.join(output_dataset_dir, "exports", f"project_{project_id}")
+
+
+def main(config_path, force_export=False):
     config = load_config(config_path)
+    configure_metrics(config)
+    with stage("prepare"):
+        prepare_dataset(config, force_export)
+
+
+def prepare_dataset(config, force_export=False):
     api_key = config["api_key"]
     projects = config["projects"]
     valid_tags = config["tags"]
     output_dataset_dir = config["output_dataset_dir"]
     train_ratio = config.get("train_ratio", 0.8)
     export_format = config.get("export_format", "YOLO_OBB_WITH_IMAGES")
+    materialize = config.get("materialize", "hardlink")
+    dataset_format = config.get("dataset_format", "files")
+    if dataset_format not in DATASET_FORMATS:
+        raise Exception(f"Unknown dataset_format '{dataset_format}', expected one of {DATASET_FORMATS}")
+    label_validation = config.get("label_validation", "report")
+    split_options = {
+        "mode": config.get("split_mode", "hash"),
+        "seed": config.get("split_seed", 0),
+        "stratify": config.get("stratify", False),
+        "names": valid_tags,
+    }
 
-    extracted_paths = []
+    concurrency = max(1, min(config.get("export_concurrency", 4), len(projects)))
+    retries = config.get("export_retries", 3)
+    backoff = config.get("export_retry_backoff", 2.0)
+    export_mode = config.get("export_mode", "sync")
+    if export_mode not in ("sync", "snapshot"):
+        raise Exception(f"Unknown export_mode '{export_mode}', expected 'sync' or 'snapshot'")
+    snapshot_options = {
+        "reuse": config.get("reuse_snapshots", True) and not force_export,
+        "timeout": config.get("snapshot_timeout", 3600),
+    }
+    full_export_interval = config.get("full_export_interval_hours", 24)
+    if full_export_interval is not None:
+        snapshot_options["max_age"] = full_export_interval * 3600
 
-    for project in projects:
-        project_id = project["id"]
-        print(f"Exporting annotations for project {project_id}...")
-        try:
-            result = export_annotations(project_id, api_key, export_format)
-            if isinstance(result, str):
-                extracted_paths.append(result)
-            else:
+    extracted_paths = {}
+    failed_projects = {}
+    project_indices = {}
+    client = LabelStudioClient(
+        api_key,
+        pool_size=max(concurrency, config.get("request_concurrency", 10)),
+        timeout=(10, config.get("request_timeout", 300)),
+        retries=config.get("request_retries", 3)
+    )
+
+    # Projects that haven't changed since the last sync keep their items and aren't exported again.
+    previous_states = project_states(output_dataset_dir)
+    project_ids = [project["id"] for project in projects]
+    with stage("check_projects"):
+        current_states = fetch_project_states(client, project_ids, previous_states, export_format)
+    unchanged_projects = set()
+    # Edits of existing annotations don't change the project counters, so every project is exported
+    # again once its last export is older than the interval.
+    now = time.time()
+    if config.get("skip_unchanged_projects", True) and not force_export:
+        for project_id in project_ids:
+            state, previous = current_states[str(project_id)], previous_states.get(str(project_id))
+            if not (state and previous and (state["fingerprint"], state["export_format"]) ==
+                    (previous["fingerprint"], previous.get("export_format"))):
+                continue
+            if full_export_interval is not None and \
+                    now - previous.get("exported_at", 0) >= full_export_interval * 3600:
+                print(f"Project {project_id} looks unchanged, but its last export is older than "
+                      f"{full_export_interval}h, exporting it again.")
+                continue
+            print(f"Project {project_id} is unchanged since the last sync, skipping its export.")
+            unchanged_projects.add(project_id)
+
+    # Run the exports concurrently and index each one as soon as it is extracted.
+    with client, ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {}
+        for project_id in project_ids:
+            if project_id in unchanged_projects:
+                continue
+            print(f"Exporting annotations for project {project_id}...")
+            # Exports are extracted inside the dataset directory, so that configurations prepared
+            # concurrently don't share export directories. Every export gets a new directory: a symlinked
+            # dataset keeps pointing at the previous one until it has been synced against the new one.
+            extract_dir = os.path.join(export_dir_of(output_dataset_dir, project_id),
+                                       f"export_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}")
+            future = executor.submit(in_current_stages(export_with_retry), project_id, api_key, export_format,
+                                     client, retries, backoff, export_mode, snapshot_options, extract_dir)
+            futures[future] = project_id
+
+        for future in as_completed(futures):
+            project_id = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Export failed for project {project_id}: {e}")
+                failed_projects[project_id] = str(e)
+                continue
+            if not isinstance(result, str):
                 print("Unsupported JSON export - please use ZIP export for now.")
-        except Exception as e:
-            print(e)
+                failed_projects[project_id] = "Unsupported JSON export"
+                continue
+            extracted_paths[project_id] = result
+            project_indices[project_id] = index_extracted_export(result, project_id=project_id)
+
+    if failed_projects:
+        print("The following projects could not be exported:")
+        for project_id, error in failed_projects.items():
+            print(f"  - project {project_id}: {error}")
 
-    if not extracted_paths:
+    if not extracted_paths and not unchanged_projects:
         print("No export data found. Please check your Label Studio projects and export format.")
         return
 
-    # If there are multiple exports, merge them; otherwise, use the single extracted directory.
-    if len(extracted_paths) > 1:
-        merged_dir = "merged_exports"
-        print(f"Merging exports into {merged_dir}...")
-        merge_extracted_exports(extracted_paths, merged_dir)
-        extracted_dir = merged_dir
+    # Merge the exports in configuration order and sync them into the train and validation sets in a single pass.
+    # Only the items that changed since the last run are written.
+    keep_projects = list(failed_projects) + list(unchanged_projects)
+    manifest_files = load_manifest(output_dataset_dir)["files"]
+    kept_files = {
+        name: entry for name, entry in manifest_files.items()
+        if str(entry["project"]) in {str(project_id) for project_id in keep_projects}
+    }
+    # Images whose name is already taken (by an earlier project or a kept item) are renamed, not overwritten.
+    # Names already in the dataset stay with the project that holds them.
+    index, renamed = merge_indices([(project_id, project_indices.get(project_id, {})) for project_id in project_ids],
+                                   reserved=kept_files,
+                                   owners={name: entry["project"] for name, entry in manifest_files.items()})
+    for rename in renamed:
+        print(f"Image {rename['name']} of project {rename['project']} clashes with another image, "
+              f"renamed to {rename['renamed_to']}.")
+
+    # Identical and near-identical images (e.g. consecutive video frames) are kept in the same split,
+    # so that the validation set doesn't contain copies of training images.
+    dedup_config = config.get("dedup", {})
+    groups, image_hashes = [], None
+    if dedup_config.get("enabled", True):
+        with stage("deduplicate"):
+            duplicates = find_duplicates(
+                index, output_dataset_dir,
+                kept=kept_files,
+                max_distance=dedup_config.get("max_distance", DEFAULT_MAX_DISTANCE),
+                drop_exact=dedup_config.get("drop_exact", False),
+                workers=dedup_config.get("workers"),
+                io_workers=config.get("io_workers"),
+                renamed=renamed,
+                packed=dataset_format == "packed"
+            )
+        groups, image_hashes = duplicates["groups"], duplicates["image_hashes"]
+        for name in duplicates["dropped"]:
+            del index[name]
+
+    # Failed and unchanged projects keep the state of their last successful sync.
+    states = {}
+    for project_id in project_ids:
+        if project_id in project_indices:
+            state = current_states[str(project_id)]
+            state = dict(state, exported_at=now) if state else None
+        else:
+            state = previous_states.get(str(project_id))
+        if state:
+            states[str(project_id)] = state
+    if dataset_format == "packed":
+        # Images go straight from the exports into the shards; labels are checked while they are packed.
+        with stage("sync_dataset", format="packed"):
+            sync_packed_dataset(index, output_dataset_dir, train_ratio, keep_projects=keep_projects,
+                                split_options=split_options, workers=config.get("io_workers"), project_states=states,
+                                shard_size=config.get("pack_shard_size_mb", DEFAULT_SHARD_SIZE // 1024 ** 2) * 1024 ** 2,
+                                label_validation=label_validation, groups=groups, image_hashes=image_hashes)
     else:
-        extracted_dir = extracted_paths[0]
+        with stage("sync_dataset"):
+            sync_dataset(index, output_dataset_dir, train_ratio, materialize, keep_projects=keep_projects,
+                         split_options=split_options, workers=config.get("io_workers"), project_states=states,
+                         groups=groups, image_hashes=image_hashes)
+
+    # Check the label files before they reach the training dataloader.
+    if label_validation != "off" and dataset_format == "files":
+        with stage("validate_labels"):
+            validate_labels(output_dataset_dir, valid_tags, fix=label_validation == "fix")
 
-    # Split the dataset into train and validation sets
-    split_dataset_from_extracted(extracted_dir, output_dataset_dir, train_ratio)
+    # Optionally pre-resize the images to the training size, so the dataloader doesn't decode full size images.
+    dataset_root = packed_dir(output_dataset_dir) if dataset_format == "packed" else output_dataset_dir
+    training_config = config.get("training", {})
+    if training_config.get("resize_cache", False) and dataset_format == "packed":
+        print("resize_cache doesn't apply to packed datasets, the packed images are resized while loading.")
+    elif training_config.get("resize_cache", False):
+        imgsz = training_config.get("imgsz", 640)
+        cache_roots = {}
+        with stage("resize_cache"):
+            # A sweep over image sizes gets one cache per size, data.yaml uses the training size.
+            for size in sorted({imgsz} | set(search_space(config).get("imgsz", []))):
+                cache_roots[size] = build_resized_cache(output_dataset_dir, size, workers=config.get("resize_workers"))
+        dataset_root = cache_roots[imgsz]
 
     # Generate the data.yaml file
     data_yaml_path = os.path.join(output_dataset_dir, "data.yaml")
-    generate_data_yaml(output_dataset_dir, data_yaml_path, nc=len(valid_tags), names=valid_tags)
-
-    # Cleanup: remove the merged directory if it was created
-    if len(extracted_paths) > 1 and os.path.exists(merged_dir):
-        print(f"Removing merged directory: {merged_dir}")
-        shutil.rmtree(merged_dir)
+    with stage("data_yaml"):
+        generate_data_yaml(output_dataset_dir, data_yaml_path, nc=len(valid_tags), names=valid_tags,
+                           dataset_root=dataset_root, packed=dataset_format == "packed")
 
-    # Also remove each individual export directory if they still exist
-    for path in extracted_paths:
-        if os.path.exists(path):
-            print(f"Removing temporary export directory: {path}")
-            shutil.rmtree(path)
+    # Cleanup: remove the export directories of the exported projects. A symlinked dataset now points into
+    # the latest export of each project, so only the earlier ones are removed in that case.
+    symlinked = materialize == "symlink" and dataset_format != "packed"
+    for project_id, path in extracted_paths.items():
+        project_dir = export_dir_of(output_dataset_dir, project_id)
+        for entry in os.listdir(project_dir):
+            stale = os.path.join(project_dir, entry)
+            if symlinked and stale == path:
+                continue
+            print(f"Removing export directory: {stale}")
+            if os.path.isdir(stale) and not os.path.islink(stale):
+                shutil.rmtree(stale)
+            else:
+                os.unlink(stale)
 
     print("Dataset automation complete. You can now run yolo-custom/train.py to train your model.")
 
@@ -82,5 +312,10 @@ if __name__ == "__main__":
         default=os.path.join("configs", "config.json"),
         help="Path to configuration JSON file"
     )
+    parser.add_argument(
+        "--force-export",
+        action="store_true",
+        help="Export every project, even the ones that haven't changed since the last sync"
+    )
     args = parser.parse_args()
-    main(args.config)
\ No newline at end of file
+    main(args.config, args.force_export)
\ No newline at end of file
@@ -0,0 +1,120 @@
+import os
+import json
+import shutil
+import argparse
+from utils.quantization import build_calibration_set, quantize_onnx
+from utils.export_targets import run_export_group
+from utils.benchmarking import artifact_size, validate_artifact
+from utils.packed_dataset import unpack_split
+
+
+def load_config(config_path):
+    with open(config_path, "r") as f:
+        return json.load(f)
+
+
+def main(config_path):
+    config = load_config(config_path)
+    training_config = config.get("training", {})
+    quantization_config = config.get("quantization", {})
+    output_dataset_dir = config["output_dataset_dir"]
+    valid_tags = config["tags"]
+
+    project = training_config.get("project", "default_project")
+    experiment_name = training_config.get("experiment_name", "default_experiment")
+    imgsz = training_config.get("imgsz", 640)
+    formats = quantization_config.get("formats", ["tflite", "onnx"])
+    tolerance = quantization_config.get("tolerance", 0.02)
+
+    run_dir = os.path.join(project, experiment_name)
+    model_path = os.path.join(run_dir, "weights", "best.pt")
+    quantized_dir = os.path.join(run_dir, "quantized")
+    packed = config.get("dataset_format", "files") == "packed"
+    data_yaml = os.path.join(output_dataset_dir, "data.yaml")
+    if packed:
+        # Ultralytics validation can't read the pack: validate on a files copy of the val split.
+        data_yaml = unpack_split(output_dataset_dir, valid_tags)
+
+    # Calibrate on a sample of the prepared training images
+    calibration_yaml, calibration_images = build_calibration_set(
+        output_dataset_dir,
+        valid_tags,
+        size=quantization_config.get("calibration_size", 200),
+        strategy=quantization_config.get("calibration_strategy", "stratified"),
+        seed=quantization_config.get("seed", 0),
+        packed=packed
+    )
+
+    print(f"Validating the fp32 model {model_path}...")
+    baseline = validate_artifact(model_path, data_yaml, imgsz)
+
+    results = {}
+    for fmt in formats:
+        work_dir = os.path.join(quantized_dir, f"{fmt}_int8")
+        print(f"Quantizing {model_path} to int8 {fmt}...")
+        try:
+            if fmt == "tflite":
+                target = {"format": "tflite", "int8": True, "imgsz": imgsz}
+                artifacts = run_export_group(model_path, work_dir, "saved_model",
+                                             {"imgsz": imgsz, "int8": True, "data": calibration_yaml}, [target])
+                int8_path = artifacts["tflite_int8"]
+                fp32_path = int8_path.replace("_full_integer_quant.tflite", "_float32.tflite")
+            elif fmt == "onnx":
+                target = {"format": "onnx", "imgsz": imgsz}
+                fp32_path = run_export_group(model_path, work_dir, "onnx", {"imgsz": imgsz, "simplify": True},
+                                             [target])["onnx"]
+                int8_path = quantize_onnx(fp32_path, fp32_path.replace(".onnx", "_int8.onnx"),
+                                          calibration_images, imgsz)
+            else:
+                print(f"int8 quantization is not supported for {fmt}, skipping.")
+                continue
+            metrics = validate_artifact(int8_path, data_yaml, imgsz)
+        except Exception as e:
+            print(f"Quantization to {fmt} failed: {e}")
+            results[fmt] = {"error": str(e)}
+            continue
+
+        # Reject artifacts that lose more accuracy than the configured tolerance
+        drop = baseline["map"] - metrics["map"]
+        accepted = drop <= tolerance
+        if not accepted:
+            rejected_dir = os.path.join(quantized_dir, "rejected")
+            os.makedirs(rejected_dir, exist_ok=True)
+            rejected_path = os.path.join(rejected_dir, os.path.basename(int8_path))
+            shutil.move(int8_path, rejected_path)
+            int8_path = rejected_path
+        size = artifact_size(int8_path)
+        fp32_size = artifact_size(fp32_path) if os.path.exists(fp32_path) else None
+        results[fmt] = {
+            "path": int8_path,
+            "accepted": accepted,
+            "map50": metrics["map50"],
+            "map": metrics["map"],
+            "map_drop": drop,
+            "size_mb": size / (1024 * 1024),
+            "fp32_size_mb": fp32_size / (1024 * 1024) if fp32_size else None,
+            "compression": fp32_size / size if fp32_size else None,
+        }
+        status = "accepted" if accepted else f"REJECTED (tolerance {tolerance})"
+        print(f"  {fmt} int8: mAP50-95 {metrics['map']:.4f} (drop {drop:+.4f}), "
+              f"{size / (1024 * 1024):.1f} MB -> {status}")
+
+    os.makedirs(quantized_dir, exist_ok=True)
+    report_path = os.path.join(quantized_dir, "quantization_report.json")
+    with open(report_path, "w") as f:
+        json.dump({"baseline": baseline, "tolerance": tolerance, "results": results}, f, indent=4)
+    print(f"Quantization report written to {report_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Quantize a trained YOLO model to int8 using a configuration file"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=os.path.join("configs", "config.json"),
+        help="Path to configuration JSON file"
+    )
+    args = parser.parse_args()
+    main(args.config)
@@ -0,0 +1,280 @@
+import os
+import sys
+import time
+import fcntl
+import signal
+import argparse
+import subprocess
+from pipeline import STAGES
+from utils.resources import CONCURRENT_RUNS_ENV, probe_host, describe_host
+from utils.job_queue import (
+    JOB_STATUSES,
+    STAGE_SLOT_KINDS,
+    locked_queue,
+    submit_job,
+    current_stage,
+    find_job,
+    pid_alive
+)
+
+DEFAULT_QUEUE_DIR = "scheduler"
+POLL_INTERVAL = 2.0
+# Without a GPU, one training job per group of this many cores.
+CORES_PER_CPU_SLOT = 8
+PIPELINE_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline.py")
+
+
+def plan_slots(host, cpu_slots=None, io_slots=2):
+    """
+    Split the host into execution slots. Compute slots (for training) get one GPU each, or a share of the
+    cores on CPU-only hosts; the cores are divided between the compute slots so that concurrent trainings
+    don't oversubscribe the CPU. I/O slots run the prepare and export stages next to the trainings.
+    Compute slots tell their trainings how many of them share the host memory through CONCURRENT_RUNS_ENV.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = sorted(os.sched_getaffinity(0))
+    else:
+        cores = list(range(host["cores"]))
+
+    if host["accelerator"] == "cuda":
+        devices = [{"CUDA_VISIBLE_DEVICES": str(i)} for i in range(len(host["gpus"]))]
+        names = [f"gpu{i}" for i in range(len(host["gpus"]))]
+    elif host["accelerator"] == "mps":
+        devices, names = [{}], ["mps"]
+    else:
+        count = min(len(cores), cpu_slots or max(1, len(cores) // CORES_PER_CPU_SLOT))
+        devices, names = [{} for _ in range(count)], [f"cpu{i}" for i in range(count)]
+
+    slots = []
+    for i, (name, env) in enumerate(zip(names, devices)):
+        cpus = cores[i * len(cores) // len(names):(i + 1) * len(cores) // len(names)] or cores
+        env = dict(env, OMP_NUM_THREADS=str(len(cpus)), **{CONCURRENT_RUNS_ENV: str(len(names))})
+        slots.append({"name": name, "kind": "compute", "cpus": cpus, "env": env})
+    for i in range(io_slots):
+        slots.append({"name": f"io{i}", "kind": "io", "cpus": None, "env": {}})
+    return slots
+
+
+def start_on_slot(command, slot, log_path, header):
+    """
+    Start `command` in its own process group, pinned to the slot's cores and devices,
+    appending its output to `log_path` after a `header` line.
+    """
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    env = dict(os.environ, **slot["env"])
+    cpus = slot["cpus"]
+    preexec_fn = None
+    if cpus and hasattr(os, "sched_setaffinity"):
+        def preexec_fn():
+            os.sched_setaffinity(0, cpus)
+    with open(log_path, "a") as log:
+        log.write(f"=== {header} on {slot['name']} at {time.strftime('%Y-%m-%d %H:%M:%S')} ===\n")
+        log.flush()
+        return subprocess.Popen(
+            command,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            env=env,
+            preexec_fn=preexec_fn,
+            start_new_session=True
+        )
+
+
+def launch_stage(job, slot, queue_dir):
+    """
+    Start the current stage of a job through pipeline.py on a slot.
+    Output is appended to <queue_dir>/logs/job_<id>.log.
+    """
+    stage = current_stage(job)
+    return start_on_slot(
+        [sys.executable, PIPELINE_SCRIPT, "--config", job["config"], "--stages", stage],
+        slot,
+        os.path.join(queue_dir, "logs", f"job_{job['id']}.log"),
+        stage
+    )
+
+
+def recover_jobs(queue):
+    """
+    Handle jobs left running by a previous scheduler: still running processes are adopted,
+    the others run their current stage again (stages skip work that is already done).
+    Returns {job id: pid} of the adopted processes.
+    """
+    adopted = {}
+    for job in queue["jobs"]:
+        if job["status"] != "running":
+            continue
+        if pid_alive(job["pid"]):
+            adopted[job["id"]] = job["pid"]
+        else:
+            print(f"Job {job['id']} was interrupted during {current_stage(job)}, queuing it again.")
+            job.update(status="queued", slot=None, pid=None)
+    return adopted
+
+
+def finish_stage(job, returncode, elapsed):
+    job["history"].append({
+        "stage": current_stage(job),
+        "slot": job["slot"],
+        "returncode": returncode,
+        "seconds": round(elapsed, 1),
+    })
+    job.update(slot=None, pid=None)
+    if job["status"] == "cancelled":
+        return
+    if returncode is None:
+        # Adopted process whose exit status is unknown: run the stage again.
+        job["status"] = "queued"
+    elif returncode != 0:
+        job.update(status="failed", finished_at=time.time())
+    elif job["stage_index"] + 1 == len(job["stages"]):
+        job.update(status="done", finished_at=time.time())
+    else:
+        job["stage_index"] += 1
+        job["status"] = "queued"
+    print(f"Job {job['id']} ({job['config']}): {job['history'][-1]['stage']} exited with {returncode}, "
+          f"job is now {job['status']}.")
+
+
+def run(queue_dir, slots, follow=False):
+    """
+    Schedule the queued jobs onto the slots until the queue is drained (or forever with `follow`).
+    Only one scheduler can run per queue directory. Stopping the scheduler leaves running stages alone;
+    the next scheduler adopts them.
+    """
+    os.makedirs(queue_dir, exist_ok=True)
+    scheduler_lock = open(os.path.join(queue_dir, "scheduler.lock"), "w")
+    try:
+        fcntl.flock(scheduler_lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        raise Exception(f"Another scheduler is already running on {queue_dir}")
+
+    print("Slots: " + ", ".join(
+        f"{slot['name']} ({slot['kind']}{', cores ' + str(len(slot['cpus'])) if slot['cpus'] else ''})"
+        for slot in slots
+    ))
+    processes = {}
+    with locked_queue(queue_dir) as queue:
+        adopted = recover_jobs(queue)
+        for job_id, pid in adopted.items():
+            processes[job_id] = (None, pid, time.monotonic())
+
+    while True:
+        with locked_queue(queue_dir) as queue:
+            # Reap the finished stages
+            for job_id, (process, pid, started) in list(processes.items()):
+                if process is not None:
+                    returncode = process.poll()
+                    if returncode is None:
+                        continue
+                elif pid_alive(pid):
+                    continue
+                else:
+                    returncode = None
+                del processes[job_id]
+                job = find_job(queue, job_id)
+                if job is not None:
+                    finish_stage(job, returncode, time.monotonic() - started)
+
+            # Start queued stages in submission order on free slots of the right kind
+            busy = {find_job(queue, job_id)["slot"] for job_id in processes if find_job(queue, job_id)}
+            free = [slot for slot in slots if slot["name"] not in busy]
+            for job in queue["jobs"]:
+                if job["status"] != "queued" or job["id"] in processes:
+                    continue
+                kind = STAGE_SLOT_KINDS[current_stage(job)]
+                slot = next((slot for slot in free if slot["kind"] == kind), None)
+                if slot is None:
+                    continue
+                free.remove(slot)
+                process = launch_stage(job, slot, queue_dir)
+                processes[job["id"]] = (process, process.pid, time.monotonic())
+                job.update(status="running", slot=slot["name"], pid=process.pid)
+                job["started_at"] = job["started_at"] or time.time()
+                print(f"Job {job['id']} ({job['config']}): {current_stage(job)} started on {slot['name']}.")
+
+            pending = any(job["status"] == "queued" for job in queue["jobs"])
+        if not follow and not pending and not processes:
+            print("Queue drained.")
+            return
+        time.sleep(POLL_INTERVAL)
+
+
+def print_status(queue):
+    print(f"{'id':>4}  {'status':<10} {'stage':<16} {'slot':<6} {'time':>8}  config")
+    now = time.time()
+    for job in queue["jobs"]:
+        stage = f"{current_stage(job)} ({job['stage_index'] + 1}/{len(job['stages'])})"
+        end = job["finished_at"] or now
+        elapsed = f"{(end - job['started_at']) / 60:.1f}m" if job["started_at"] else "-"
+        print(f"{job['id']:>4}  {job['status']:<10} {stage:<16} {job['slot'] or '-':<6} {elapsed:>8}  {job['config']}")
+    counts = {status: sum(1 for job in queue["jobs"] if job["status"] == status) for status in JOB_STATUSES}
+    print(", ".join(f"{count} {status}" for status, count in counts.items() if count))
+
+
+def cancel(queue, job_id):
+    job = find_job(queue, job_id)
+    if job is None:
+        raise Exception(f"No job with id {job_id}")
+    if job["status"] in ("done", "failed", "cancelled"):
+        print(f"Job {job_id} is already {job['status']}.")
+        return
+    if job["status"] == "running" and pid_alive(job["pid"]):
+        # Stages run in their own process group, which includes their dataloader and export workers.
+        os.killpg(job["pid"], signal.SIGTERM)
+    job.update(status="cancelled", finished_at=time.time())
+    print(f"Job {job_id} cancelled.")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Queue the pipelines of many configurations and run them concurrently on this host"
+    )
+    parser.add_argument("--queue-dir", type=str, default=DEFAULT_QUEUE_DIR, help="Directory of the job queue")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit_parser = commands.add_parser("submit", help="Add configurations to the queue")
+    submit_parser.add_argument("--config", type=str, action="append", required=True,
+                               help="Path to configuration JSON file (can be repeated)")
+    submit_parser.add_argument("--stages", type=str, default=",".join(STAGES),
+                               help=f"Comma-separated stages to run (default: {','.join(STAGES)})")
+
+    commands.add_parser("status", help="Show the jobs of the queue")
+
+    run_parser = commands.add_parser("run", help="Run the queued jobs")
+    run_parser.add_argument("--cpu-slots", type=int, default=None,
+                            help=f"Concurrent trainings on a CPU-only host (default: one per {CORES_PER_CPU_SLOT} cores)")
+    run_parser.add_argument("--io-slots", type=int, default=2,
+                            help="Concurrent prepare and export stages (default: 2)")
+    run_parser.add_argument("--follow", action="store_true", help="Keep waiting for new jobs once the queue is drained")
+
+    cancel_parser = commands.add_parser("cancel", help="Cancel a job, stopping its running stage")
+    cancel_parser.add_argument("job_id", type=int)
+
+    args = parser.parse_args()
+    if args.command == "submit":
+        requested = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+        unknown = [stage for stage in requested if stage not in STAGES]
+        if unknown:
+            parser.error(f"Unknown stages {unknown}, expected a subset of {list(STAGES)}")
+        stages = [stage for stage in STAGES if stage in requested]
+        with locked_queue(args.queue_dir) as queue:
+            for config_path in args.config:
+                if not os.path.exists(config_path):
+                    parser.error(f"Configuration {config_path} not found")
+                job = submit_job(queue, os.path.abspath(config_path), stages)
+                print(f"Submitted job {job['id']}: {config_path} ({', '.join(stages)})")
+    elif args.command == "status":
+        with locked_queue(args.queue_dir) as queue:
+            print_status(queue)
+    elif args.command == "cancel":
+        with locked_queue(args.queue_dir) as queue:
+            cancel(queue, args.job_id)
+    elif args.command == "run":
+        host = probe_host(".")
+        print(f"Host: {describe_host(host)}")
+        run(args.queue_dir, plan_slots(host, args.cpu_slots, args.io_slots), args.follow)
+
+
+if __name__ == "__main__":
+    main()
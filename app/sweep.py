@@ -0,0 +1,299 @@
+import os
+import sys
+import csv
+import copy
+import json
+import time
+import signal
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import yaml
+from ultralytics import YOLO
+from pipeline import run_dir_of
+from scheduler import plan_slots, start_on_slot
+from train import train
+from utils.resources import probe_host, describe_host
+from utils.image_cache import build_resized_cache
+from utils.dataset_preparation import generate_data_yaml
+from utils.benchmarking import sample_images, benchmark_artifact
+from utils.packed_dataset import PackedDataset, packed_dir, extract_images
+from utils.instrumentation import configure_metrics, stage
+from utils.sweeping import (
+    search_space,
+    expand_trials,
+    progress_path,
+    load_progress,
+    median_stopping_callbacks,
+    pareto_front,
+    rank_trials
+)
+
+POLL_INTERVAL = 2.0
+SWEEP_SCRIPT = os.path.abspath(__file__)
+
+
+def load_config(config_path):
+    with open(config_path, "r") as f:
+        return json.load(f)
+
+
+def sweep_dir_of(config):
+    return os.path.join(run_dir_of(config), "sweep")
+
+
+def trial_config(config, overrides, sweep_dir, name):
+    """
+    The configuration of one trial: the fixed training values with the trial's choices, trained into
+    <sweep_dir>/<name> so that train.py resumes or skips it like any other run.
+    """
+    trial = copy.deepcopy(config)
+    training_config = dict(config.get("training", {}))
+    training_config.update(overrides)
+    training_config.update(project=sweep_dir, experiment_name=name)
+    trial["training"] = training_config
+    return trial
+
+
+def dataset_yaml(config, imgsz, sweep_dir):
+    """
+    Point a data.yaml at the prepared dataset for a trial image size. With resize_cache, every image size
+    uses its own resized cache, which is only updated for the images that changed since prepare.py built it.
+    """
+    output_dataset_dir = config["output_dataset_dir"]
+    data_yaml_path = os.path.join(output_dataset_dir, "data.yaml")
+    if not os.path.exists(data_yaml_path):
+        raise Exception(f"{data_yaml_path} not found, prepare the dataset first.")
+    if not config.get("training", {}).get("resize_cache", False) or config.get("dataset_format") == "packed":
+        return data_yaml_path
+    with open(data_yaml_path, "r") as f:
+        names = yaml.safe_load(f)["names"]
+    cache_root = build_resized_cache(output_dataset_dir, imgsz, workers=config.get("resize_workers"))
+    sized_yaml_path = os.path.join(sweep_dir, f"data_{imgsz}.yaml")
+    generate_data_yaml(output_dataset_dir, sized_yaml_path, nc=len(names), names=names, dataset_root=cache_root)
+    return sized_yaml_path
+
+
+def run_trial(spec_path):
+    """
+    Train one trial described by a spec file written by `main`, with median early stopping.
+    """
+    with open(spec_path, "r") as f:
+        spec = json.load(f)
+    config = spec["config"]
+    configure_metrics(config)
+    callbacks = median_stopping_callbacks(
+        spec["sweep_dir"], spec["name"], spec["metric"], spec["grace_epochs"], spec["min_trials"]
+    )
+    with stage("sweep_trial", trial=spec["name"]):
+        train(config, data_yaml=spec["data_yaml"], callbacks=callbacks, concurrent_runs=spec["concurrent_runs"])
+
+
+def run_trials(specs, slots, sweep_dir):
+    """
+    Run the trial specs on the compute slots, one trial per slot at a time.
+    Returns {trial name: exit code}.
+    """
+    pending = list(specs)
+    running = {}
+    returncodes = {}
+    free = list(slots)
+    try:
+        while pending or running:
+            for name, (process, slot) in list(running.items()):
+                returncode = process.poll()
+                if returncode is None:
+                    continue
+                del running[name]
+                free.append(slot)
+                returncodes[name] = returncode
+                status = "done" if returncode == 0 else f"failed with exit code {returncode}"
+                print(f"{name}: {status}.")
+            while pending and free:
+                name, spec_path = pending.pop(0)
+                slot = free.pop(0)
+                process = start_on_slot(
+                    [sys.executable, SWEEP_SCRIPT, "--trial", spec_path],
+                    slot,
+                    os.path.join(sweep_dir, "logs", f"{name}.log"),
+                    name
+                )
+                running[name] = (process, slot)
+                print(f"{name}: started on {slot['name']}.")
+            time.sleep(POLL_INTERVAL)
+    except KeyboardInterrupt:
+        # Trials run in their own process groups, so they have to be stopped explicitly.
+        for process, _ in running.values():
+            os.killpg(process.pid, signal.SIGTERM)
+        raise
+    return returncodes
+
+
+def measure_latencies(rows, image_paths, threads, warmup, runs):
+    """
+    Time the best weights of every trial on the CPU at batch size 1, one trial at a time in a fresh process.
+    """
+    context = multiprocessing.get_context("spawn")
+    for row in rows:
+        row.update(p50_ms=None, p95_ms=None, throughput=None, size_mb=None)
+        if not image_paths or not os.path.exists(row["weights_path"]):
+            continue
+        print(f"Measuring the CPU latency of {row['trial']}...")
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(
+                    benchmark_artifact, row["weights_path"], image_paths, row["imgsz"], [1], [threads], warmup, runs
+                ).result()[0]
+        except Exception as e:
+            print(f"Latency measurement of {row['trial']} failed: {e}")
+            continue
+        row.update(p50_ms=result["p50_ms"], p95_ms=result["p95_ms"], throughput=result["throughput"],
+                   size_mb=result["size_mb"])
+
+
+def main(config_path, cpu_slots=None):
+    config = load_config(config_path)
+    configure_metrics(config)
+    training_config = config.get("training", {})
+    sweep_config = config.get("sweep", {})
+    benchmark_config = config.get("benchmark", {})
+    metric = sweep_config.get("metric", "map")
+    min_accuracy = sweep_config.get("min_accuracy")
+
+    space = search_space(config)
+    if not space:
+        raise Exception("The sweep block has no search_space, nothing to sweep.")
+    trials = expand_trials(space, sweep_config.get("max_trials"), sweep_config.get("seed", 0))
+    print(f"Search space: {', '.join(f'{key}={values}' for key, values in sorted(space.items()))}, "
+          f"{len(trials)} trials.")
+
+    sweep_dir = os.path.abspath(sweep_dir_of(config))
+    os.makedirs(sweep_dir, exist_ok=True)
+    host = probe_host(config["output_dataset_dir"])
+    print(f"Host: {describe_host(host)}")
+    slots = plan_slots(host, cpu_slots, io_slots=0)[:len(trials)]
+
+    with stage("sweep_prepare"):
+        # One dataset view per image size, shared by the trials using it.
+        data_yamls = {}
+        for imgsz in sorted({trial.get("imgsz", training_config.get("imgsz", 640)) for trial in trials}):
+            data_yamls[imgsz] = dataset_yaml(config, imgsz, sweep_dir)
+        # Fetch the pretrained weights once, rather than in every trial at the same time.
+        for weights in sorted({trial.get("weights", training_config.get("weights", "yolov8n.pt")) for trial in trials}):
+            YOLO(weights)
+
+    specs = []
+    rows = []
+    for index, overrides in enumerate(trials, 1):
+        name = f"trial_{index:03d}"
+        trial = trial_config(config, overrides, sweep_dir, name)
+        imgsz = trial["training"].get("imgsz", 640)
+        spec_path = os.path.join(sweep_dir, f"{name}.json")
+        with open(spec_path, "w") as f:
+            json.dump({
+                "name": name,
+                "config": trial,
+                "data_yaml": data_yamls[imgsz],
+                "sweep_dir": sweep_dir,
+                "metric": metric,
+                "grace_epochs": sweep_config.get("grace_epochs", 5),
+                "min_trials": sweep_config.get("min_trials", 3),
+                "concurrent_runs": len(slots),
+            }, f, indent=4)
+        specs.append((name, spec_path))
+        rows.append({
+            "trial": name,
+            "params": overrides,
+            "imgsz": imgsz,
+            "weights_path": os.path.join(sweep_dir, name, "weights", "best.pt"),
+        })
+
+    # Progress left by trials of an earlier, larger search space would skew the median stopping rule.
+    names = {name for name, _ in specs}
+    progress_dir = os.path.dirname(progress_path(sweep_dir, "trial"))
+    if os.path.isdir(progress_dir):
+        for filename in os.listdir(progress_dir):
+            if os.path.splitext(filename)[0] not in names:
+                os.remove(os.path.join(progress_dir, filename))
+
+    print(f"Running {len(trials)} trials on {len(slots)} slots: {', '.join(slot['name'] for slot in slots)}")
+    with stage("sweep_trials"):
+        returncodes = run_trials(specs, slots, sweep_dir)
+
+    for row in rows:
+        progress = load_progress(progress_path(sweep_dir, row["trial"]))
+        row["status"] = "ok" if returncodes.get(row["trial"]) == 0 else "failed"
+        row["accuracy"] = max(progress["values"]) if progress["values"] else None
+        row["epochs"] = len(progress["values"])
+        row["stopped_early"] = progress["stopped_at"] is not None
+
+    samples = benchmark_config.get("samples", 32)
+    if config.get("dataset_format") == "packed":
+        pack = PackedDataset(packed_dir(config["output_dataset_dir"]))
+        image_paths = extract_images(pack, pack.split_indices("val")[:samples], os.path.join(sweep_dir, "latency_images"))
+        pack.close()
+    else:
+        image_paths = sample_images(os.path.join(config["output_dataset_dir"], "val", "images"), samples)
+    with stage("sweep_latency"):
+        if not image_paths:
+            print("No validation images found, skipping the latency measurements.")
+        measure_latencies(rows, image_paths, sweep_config.get("latency_threads", 1),
+                          benchmark_config.get("warmup", 3), benchmark_config.get("runs", 20))
+
+    ranked = rank_trials(pareto_front(rows), min_accuracy)
+    recommended = next((row for row in ranked if row["meets_bar"] and row["p50_ms"] is not None), None)
+    json_path = os.path.join(sweep_dir, "sweep_results.json")
+    csv_path = os.path.join(sweep_dir, "sweep_results.csv")
+    with open(json_path, "w") as f:
+        json.dump({
+            "metric": metric,
+            "min_accuracy": min_accuracy,
+            "recommended": recommended["trial"] if recommended else None,
+            "results": ranked,
+        }, f, indent=4)
+    keys = sorted(space)
+    columns = ["rank", "trial"] + keys + ["accuracy", "p50_ms", "p95_ms", "throughput", "size_mb", "epochs",
+                                          "stopped_early", "pareto", "meets_bar", "status", "weights_path"]
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for row in ranked:
+            writer.writerow({**{column: row.get(column) for column in columns}, **row["params"]})
+
+    print(f"{'#':>3} {'trial':<10} {'params':<40} {metric:>7} {'p50 ms':>8} {'img/s':>7} {'epochs':>6}  notes")
+    for row in ranked:
+        params = ", ".join(f"{key}={row['params'][key]}" for key in keys)
+        accuracy = f"{row['accuracy']:.4f}" if row["accuracy"] is not None else "-"
+        p50 = f"{row['p50_ms']:.1f}" if row["p50_ms"] is not None else "-"
+        throughput = f"{row['throughput']:.1f}" if row["throughput"] is not None else "-"
+        notes = [note for note, flag in (("meets bar", row["meets_bar"]), ("pareto", row["pareto"]),
+                                         ("stopped early", row["stopped_early"]),
+                                         ("failed", row["status"] != "ok")) if flag]
+        print(f"{row['rank']:>3} {row['trial']:<10} {params:<40} {accuracy:>7} {p50:>8} {throughput:>7} "
+              f"{row['epochs']:>6}  {', '.join(notes)}")
+    if recommended:
+        print(f"Fastest trial with {metric} >= {min_accuracy}: {recommended['trial']} ({recommended['weights_path']})")
+    elif min_accuracy is not None:
+        print(f"No trial with a measured latency reached {metric} >= {min_accuracy}.")
+    print(f"Sweep results written to {json_path} and {csv_path}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Train every combination of the search spaces of a configuration's training block in parallel "
+                    "and rank them by accuracy and CPU latency"
+    )
+    parser.add_argument(
+        "--config",
+        type=str,
+        default=os.path.join("configs", "config.json"),
+        help="Path to configuration JSON file"
+    )
+    parser.add_argument("--cpu-slots", type=int, default=None,
+                        help="Concurrent trials on a CPU-only host (default: one per 8 cores)")
+    parser.add_argument("--trial", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.trial:
+        run_trial(args.trial)
+    else:
+        main(args.config, args.cpu_slots)
@@ -2,6 +2,23 @@ import json
 import os
 import argparse
 from ultralytics import YOLO
+from utils.resources import (
+    CONCURRENT_RUNS_ENV,
+    probe_host,
+    count_dataset_images,
+    choose_training_settings,
+    describe_host
+)
+from utils.checkpoints import (
+    training_fingerprint,
+    load_fingerprint,
+    save_fingerprint,
+    archive_run,
+    checkpoint_state,
+    fingerprint_changes
+)
+from utils.instrumentation import configure_metrics, stage, instrument_training
+from utils.packed_training import packed_trainer
 
 def load_config(config_path):
     with open(config_path, "r") as f:
@@ -11,27 +28,89 @@ def main(config_path):
     # Load configuration from the given file path
     print(config_path)
     config = load_config(config_path)
+    configure_metrics(config)
+    # Trainings started by the job scheduler share the host with the other compute slots.
+    concurrent_runs = int(os.environ.get(CONCURRENT_RUNS_ENV) or 1)
+    with stage("train"):
+        train(config, concurrent_runs=concurrent_runs)
+
+def train(config, data_yaml=None, callbacks=None, concurrent_runs=1):
+    """
+    Train the model of a configuration. `data_yaml` replaces <output_dataset_dir>/data.yaml, `callbacks` maps
+    ultralytics events to extra callbacks, and the host memory is shared between `concurrent_runs` trainings.
+    """
     training_config = config.get("training", {})
     output_dataset_dir = config["output_dataset_dir"]
-
+    packed = config.get("dataset_format", "files") == "packed"
     # Read training parameters
     project = training_config.get("project", "default_project")
     experiment_name = training_config.get("experiment_name", "default_experiment")
     epochs = training_config.get("epochs", 100)
     imgsz = training_config.get("imgsz", 640)
     weights = training_config.get("weights", "yolov8n.pt")
+    save_period = training_config.get("save_period", -1)
+
+    # Look for a previous run of this experiment to resume or skip.
+    run_dir = os.path.join(project, experiment_name)
+    last_checkpoint = os.path.join(run_dir, "weights", "last.pt")
+    fingerprint = training_fingerprint(config)
+    state = checkpoint_state(last_checkpoint) if training_config.get("resume", True) else "missing"
+    if state != "missing":
+        changes = fingerprint_changes(load_fingerprint(run_dir), fingerprint)
+        if state == "interrupted" and changes:
+            raise Exception(
+                f"Refusing to resume {last_checkpoint}, its inputs changed: {'; '.join(changes)}. "
+                "Use a new training.experiment_name or set training.resume to false to start over."
+            )
+        if state == "interrupted":
+            print(f"Resuming interrupted training from {last_checkpoint}")
+            model = YOLO(last_checkpoint)
+            instrument_training(model)
+            for event, callback in (callbacks or {}).items():
+                model.add_callback(event, callback)
+            model.train(resume=True, trainer=packed_trainer(model.task) if packed else None)
+            print("Training complete.")
+            return
+        if not changes:
+            print(f"Training in {run_dir} already completed with the same dataset and parameters, skipping.")
+            return
+        print(f"Inputs changed since the last run in {run_dir} ({'; '.join(changes)}), training again.")
+    if os.path.exists(last_checkpoint):
+        # Keep the weights and results of the previous run instead of overwriting them.
+        print(f"Previous run moved to {archive_run(run_dir)}")
+
+    # Size batch, workers, device and image caching for this host (overridable in the training block)
+    host = probe_host(output_dataset_dir)
+    print(f"Host: {describe_host(host)}")
+    if concurrent_runs > 1 and host["ram_available"]:
+        host["ram_available"] //= concurrent_runs
+    settings, sources = choose_training_settings(
+        host, count_dataset_images(output_dataset_dir, packed), imgsz, training_config
+    )
+    if packed and settings["cache"] == "disk":
+        # The disk cache writes one .npy file per image next to the images, packed images only live in shards.
+        settings["cache"] = False
+    for key, value in settings.items():
+        print(f"  {key}: {value} ({sources[key]})")
 
     # Initialize the model with pre-trained weights
     model = YOLO(weights)
+    instrument_training(model)
+    for event, callback in (callbacks or {}).items():
+        model.add_callback(event, callback)
+    save_fingerprint(run_dir, fingerprint)
 
     # Train the model using the dataset specified in data.yaml
     results = model.train(
-        data=output_dataset_dir+"/data.yaml",  # Path to the generated data.yaml file
+        data=data_yaml or output_dataset_dir+"/data.yaml",  # Path to the generated data.yaml file
         epochs=epochs,
         imgsz=imgsz,
         project=project,
         name=experiment_name,
-        batch=8
+        exist_ok=True,  # Keep writing to project/experiment_name so the run can be resumed
+        save_period=save_period,
+        trainer=packed_trainer(model.task) if packed else None,
+        **settings
     )
 
     # The trained weights (.pt file) will be saved under project/experiment_name.
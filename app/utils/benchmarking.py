@@ -0,0 +1,215 @@
+import os
+import time
+import random
+import numpy as np
+from PIL import Image
+from .instrumentation import peak_rss_bytes
+
+LETTERBOX_COLOR = (114, 114, 114)
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+# Formats run by the TensorFlow runtime, whose thread pools can only be sized once per process.
+TF_RUNTIME_FORMATS = ("saved_model", "pb", "tfjs")
+
+
+def artifact_format(path):
+    """
+    Guess the runtime format of a model artifact from its path.
+    """
+    name = os.path.basename(path.rstrip(os.sep))
+    for suffix, fmt in ((".pt", "pt"), (".onnx", "onnx"), (".tflite", "tflite"), (".torchscript", "torchscript"),
+                        ("_openvino_model", "openvino"), ("_saved_model", "saved_model"), (".pb", "pb"),
+                        ("_web_model", "tfjs")):
+        if name.endswith(suffix):
+            return fmt
+    return None
+
+
+def tf_graph_source(path):
+    """
+    SavedModel a TensorFlow artifact was converted from. TF.js and frozen graph exports have no CPU runtime in
+    Python, so they are benchmarked through the SavedModel that ultralytics writes next to them.
+    """
+    fmt = artifact_format(path)
+    path = path.rstrip(os.sep)
+    if fmt == "saved_model":
+        return path
+    name = os.path.basename(path)
+    stem = name[:-len("_web_model")] if fmt == "tfjs" else os.path.splitext(name)[0]
+    return os.path.join(os.path.dirname(path), f"{stem}_saved_model")
+
+
+def artifact_size(path):
+    """
+    Size in bytes of a model file or directory.
+    """
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names
+    )
+
+
+def letterbox(path, imgsz):
+    """
+    Load an image, resize its longest side to `imgsz` and pad it to a square, as ultralytics does.
+    Returns a float32 CHW array in [0, 1].
+    """
+    with Image.open(path) as im:
+        im = im.convert("RGB")
+        scale = imgsz / max(im.size)
+        resized = im.resize((max(1, round(im.size[0] * scale)), max(1, round(im.size[1] * scale))), Image.BILINEAR)
+    canvas = Image.new("RGB", (imgsz, imgsz), LETTERBOX_COLOR)
+    canvas.paste(resized, ((imgsz - resized.size[0]) // 2, (imgsz - resized.size[1]) // 2))
+    return np.asarray(canvas, dtype=np.float32).transpose(2, 0, 1) / 255.0
+
+
+def sample_images(images_dir, count, seed=0):
+    """
+    Pick a reproducible sample of image paths from a directory.
+    """
+    names = sorted(name for name in os.listdir(images_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+    random.Random(seed).shuffle(names)
+    return [os.path.join(images_dir, name) for name in names[:count]]
+
+
+def load_runner(path, fmt, threads):
+    """
+    Load an artifact with its native CPU runtime limited to `threads` threads.
+    Returns (run, fixed_batch): `run` takes an NCHW float32 batch, `fixed_batch` is the batch size
+    baked into the model, or None when any batch size is accepted.
+    """
+    if fmt in ("pt", "torchscript"):
+        import torch
+        torch.set_num_threads(threads)
+        if fmt == "pt":
+            from ultralytics import YOLO
+            model = YOLO(path).model.float().eval()
+        else:
+            model = torch.jit.load(path, map_location="cpu").eval()
+
+        def run(batch):
+            with torch.inference_mode():
+                return model(torch.from_numpy(batch))
+        return run, (1 if fmt == "torchscript" else None)
+
+    if fmt == "onnx":
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        model_input = session.get_inputs()[0]
+        fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        return (lambda batch: session.run(None, {model_input.name: batch})), fixed_batch
+
+    if fmt == "tflite":
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite.python.interpreter import Interpreter
+        interpreter = Interpreter(model_path=path, num_threads=threads)
+        interpreter.allocate_tensors()
+        model_input = interpreter.get_input_details()[0]
+        output = interpreter.get_output_details()[0]
+
+        def run(batch):
+            batch = batch.transpose(0, 2, 3, 1)
+            if model_input["dtype"] != np.float32:
+                scale, zero_point = model_input["quantization"]
+                batch = (batch / scale + zero_point).astype(model_input["dtype"])
+            interpreter.set_tensor(model_input["index"], batch)
+            interpreter.invoke()
+            return interpreter.get_tensor(output["index"])
+        return run, int(model_input["shape"][0])
+
+    if fmt in TF_RUNTIME_FORMATS:
+        import tensorflow as tf
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except RuntimeError:
+            raise Exception("TensorFlow artifacts need a new process for every thread count")
+        source = tf_graph_source(path)
+        if not os.path.isdir(source):
+            raise Exception(f"{fmt} artifacts are benchmarked through their SavedModel, {source} not found")
+        infer = tf.saved_model.load(source).signatures["serving_default"]
+        input_name, spec = next(iter(infer.structured_input_signature[1].items()))
+
+        def run(batch):
+            return infer(**{input_name: tf.constant(batch.transpose(0, 2, 3, 1))})
+        return run, spec.shape[0]
+
+    if fmt == "openvino":
+        import openvino as ov
+        core = ov.Core()
+        xml = next(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".xml"))
+        compiled = core.compile_model(core.read_model(xml), "CPU", {"INFERENCE_NUM_THREADS": threads})
+        shape = compiled.inputs[0].get_partial_shape()[0]
+        return (lambda batch: compiled(batch)), (shape.get_length() if shape.is_static else None)
+
+    raise Exception(f"CPU benchmarking is not supported for {fmt} artifacts")
+
+
+def time_runner(run, images, batch_size, fixed_batch, warmup=3, runs=20):
+    """
+    Time `run` over batches of `images` (NCHW array). Models with a fixed batch size are called
+    once per sample. Returns latency percentiles (ms per batch) and throughput (images/s).
+    """
+    batch = images[np.arange(batch_size) % len(images)]
+    batched = fixed_batch is None or fixed_batch == batch_size
+
+    def call():
+        if batched:
+            run(batch)
+        else:
+            for i in range(batch_size):
+                run(batch[i:i + 1])
+
+    for _ in range(warmup):
+        call()
+    latencies = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        call()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies = np.asarray(latencies)
+    return {
+        "batched": batched,
+        "p50_ms": float(np.percentile(latencies, 50)),
+        "p95_ms": float(np.percentile(latencies, 95)),
+        "p99_ms": float(np.percentile(latencies, 99)),
+        "throughput": float(batch_size * 1000 / latencies.mean()),
+    }
+
+
+def benchmark_artifact(path, image_paths, imgsz, batch_sizes, thread_counts, warmup=3, runs=20):
+    """
+    Benchmark one artifact at every (threads, batch size) combination. Meant to run in its own
+    process, so that the reported peak memory belongs to this artifact only.
+    Returns a list of result rows.
+    """
+    fmt = artifact_format(path)
+    images = np.stack([letterbox(image_path, imgsz) for image_path in image_paths])
+    rows = []
+    for threads in thread_counts:
+        run, fixed_batch = load_runner(path, fmt, threads)
+        for batch_size in batch_sizes:
+            result = time_runner(run, images, batch_size, fixed_batch, warmup, runs)
+            rows.append({"artifact": path, "format": fmt, "threads": threads, "batch": batch_size, **result})
+    peak = peak_rss_bytes()
+    for row in rows:
+        row["peak_rss_mb"] = peak / (1024 * 1024)
+        row["size_mb"] = artifact_size(path) / (1024 * 1024)
+    return rows
+
+
+def validate_artifact(path, data_yaml, imgsz):
+    """
+    Run the ultralytics validation of an artifact on the CPU and return its mAP50 and mAP50-95.
+    """
+    from ultralytics import YOLO
+    # Ultralytics can't run TF.js models, their SavedModel holds the same graph.
+    if artifact_format(path) == "tfjs":
+        path = tf_graph_source(path)
+    metrics = YOLO(path).val(data=data_yaml, imgsz=imgsz, batch=1, device="cpu", plots=False, verbose=False)
+    return {"map50": float(metrics.box.map50), "map": float(metrics.box.map)}
@@ -0,0 +1,88 @@
+import os
+import json
+import hashlib
+from .manifest import manifest_digest
+
+FINGERPRINT_FILENAME = "run_fingerprint.json"
+# Training keys that don't change the result of a run, so they may differ when resuming.
+RUNTIME_KEYS = ("workers", "device", "cache", "resume", "save_period")
+
+
+def training_fingerprint(config):
+    """
+    Identify the inputs of a training run: the dataset content (manifest digest), how its labels were
+    validated and the training hyperparameters.
+    """
+    training_config = {
+        key: value for key, value in config.get("training", {}).items() if key not in RUNTIME_KEYS
+    }
+    fingerprint = {
+        "dataset": manifest_digest(config["output_dataset_dir"]),
+        # The manifest records the source labels; in fix mode the dataset holds their fixed version.
+        "labels": {"tags": config.get("tags"), "fixed": config.get("label_validation", "report") == "fix"},
+        "training": training_config,
+    }
+    fingerprint["digest"] = hashlib.sha256(json.dumps(fingerprint, sort_keys=True).encode("utf-8")).hexdigest()
+    return fingerprint
+
+
+def load_fingerprint(run_dir):
+    path = os.path.join(run_dir, FINGERPRINT_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_fingerprint(run_dir, fingerprint):
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(run_dir, FINGERPRINT_FILENAME), "w") as f:
+        json.dump(fingerprint, f, indent=4)
+
+
+def archive_run(run_dir):
+    """
+    Move a previous run out of the way before training again with different inputs, so its weights and
+    results are kept. The run is renamed after the digest of its fingerprint. Returns the new path.
+    """
+    previous = load_fingerprint(run_dir)
+    suffix = previous["digest"][:8] if previous and previous.get("digest") else "previous"
+    archive_dir = f"{run_dir}_{suffix}"
+    attempt = 2
+    while os.path.exists(archive_dir):
+        archive_dir = f"{run_dir}_{suffix}_{attempt}"
+        attempt += 1
+    os.rename(run_dir, archive_dir)
+    return archive_dir
+
+
+def checkpoint_state(checkpoint_path):
+    """
+    Return "missing", "finished" or "interrupted" for an ultralytics checkpoint (e.g. last.pt).
+    Ultralytics strips the optimizer and sets the epoch to -1 once a run has completed.
+    """
+    if not os.path.exists(checkpoint_path):
+        return "missing"
+    import torch
+    checkpoint = torch.load(checkpoint_path, map_location="cpu", weights_only=False)
+    if checkpoint.get("epoch", -1) == -1 or checkpoint.get("optimizer") is None:
+        return "finished"
+    return "interrupted"
+
+
+def fingerprint_changes(previous, current):
+    """
+    List the parts of a training fingerprint that differ between two runs.
+    """
+    if previous is None:
+        return ["no fingerprint recorded for the previous run"]
+    changes = []
+    if previous.get("dataset") != current["dataset"]:
+        changes.append("dataset manifest")
+    if previous.get("labels") != current["labels"]:
+        changes.append("label classes or validation")
+    old_training, new_training = previous.get("training", {}), current["training"]
+    for key in sorted(set(old_training) | set(new_training)):
+        if old_training.get(key) != new_training.get(key):
+            changes.append(f"training.{key}: {old_training.get(key)!r} -> {new_training.get(key)!r}")
+    return changes
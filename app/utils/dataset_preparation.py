@@ -1,79 +1,663 @@
 import os
-import random
+import sys
+import json
+import errno
+import ctypes
 import shutil
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from .manifest import load_manifest, save_manifest, hash_file
+from .splitting import split_items, split_class_report, group_splits
+from .instrumentation import count
 
 
-def merge_extracted_exports(extracted_paths, merged_dir):
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png")
+MATERIALIZE_MODES = ("copy", "hardlink", "reflink", "symlink", "move")
+
+# Linux ioctl request number used to clone a file (FICLONE).
+FICLONE = 0x40049409
+# Errors meaning the filesystem (or the pair of filesystems) can't do the requested operation.
+_UNSUPPORTED_ERRNOS = {
+    errno.EXDEV, errno.EPERM, errno.EMLINK, errno.EINVAL, errno.ENOTTY,
+    errno.EOPNOTSUPP, getattr(errno, "ENOTSUP", errno.EOPNOTSUPP), errno.ENOSYS,
+}
+# How often (in seconds) placement progress is printed.
+PROGRESS_INTERVAL = 2.0
+_unsupported_modes = set()
+_unsupported_lock = threading.Lock()
+
+
+def place_file(src, dst, mode="copy"):
     """
-    Merge multiple extracted directories (each with subdirectories 'images' and 'labels')
-    into a single directory.
+    Materialize `src` at `dst` using one of MATERIALIZE_MODES.
+    When the filesystem doesn't support the requested mode, the file is copied instead
+    and the mode is skipped for the remaining files of the run. Returns the mode actually used.
     """
-    images_merged = os.path.join(merged_dir, "images")
-    labels_merged = os.path.join(merged_dir, "labels")
-    os.makedirs(images_merged, exist_ok=True)
-    os.makedirs(labels_merged, exist_ok=True)
+    if mode not in MATERIALIZE_MODES:
+        raise ValueError(f"Unknown materialization mode '{mode}', expected one of {MATERIALIZE_MODES}")
+    # Never write through a link left by a previous run.
+    _unlink_quiet(dst)
+    if mode != "copy" and mode not in _unsupported_modes:
+        try:
+            if mode == "hardlink":
+                os.link(src, dst)
+            elif mode == "symlink":
+                os.symlink(os.path.abspath(src), dst)
+            elif mode == "reflink":
+                _reflink(src, dst)
+            elif mode == "move":
+                shutil.move(src, dst)
+            return mode
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED_ERRNOS:
+                raise
+            with _unsupported_lock:
+                if mode not in _unsupported_modes:
+                    _unsupported_modes.add(mode)
+                    print(f"'{mode}' is not supported here ({e.strerror}), falling back to copy.")
+            _unlink_quiet(dst)
+    shutil.copy2(src, dst)
+    return "copy"
+
 
-    for path in extracted_paths:
-        images_dir = os.path.join(path, "images")
-        labels_dir = os.path.join(path, "labels")
-        if os.path.exists(images_dir):
-            for file in os.listdir(images_dir):
-                src = os.path.join(images_dir, file)
-                dst = os.path.join(images_merged, file)
-                shutil.copy2(src, dst)
-        if os.path.exists(labels_dir):
-            for file in os.listdir(labels_dir):
-                src = os.path.join(labels_dir, file)
-                dst = os.path.join(labels_merged, file)
-                shutil.copy2(src, dst)
-    print(f"Exports merged into {merged_dir}")
+def _unlink_quiet(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
 
 
-def split_dataset_from_extracted(extracted_dir, output_dataset_dir, train_ratio=0.8):
+def default_io_workers():
     """
-    Given an extracted directory (with subdirectories 'images' and 'labels'),
-    randomly split the images (and corresponding label files) into training and validation sets.
+    Number of threads used for file placement; I/O bound, so more than the number of cores.
     """
-    train_images_dir, train_labels_dir, val_images_dir, val_labels_dir = create_dirs(output_dataset_dir)
-    images_dir = os.path.join(extracted_dir, "images")
-    labels_dir = os.path.join(extracted_dir, "labels")
+    return min(32, (os.cpu_count() or 1) * 4)
 
-    image_files = [f for f in os.listdir(images_dir) if f.lower().endswith((".jpg", ".jpeg", ".png"))]
-    random.shuffle(image_files)
-    split_index = int(len(image_files) * train_ratio)
-    train_list = image_files[:split_index]
-    val_list = image_files[split_index:]
 
-    for image_filename in train_list:
-        src_img = os.path.join(images_dir, image_filename)
-        dst_img = os.path.join(train_images_dir, image_filename)
-        shutil.copy2(src_img, dst_img)
-        label_filename = os.path.splitext(image_filename)[0] + ".txt"
-        src_label = os.path.join(labels_dir, label_filename)
-        if os.path.exists(src_label):
-            dst_label = os.path.join(train_labels_dir, label_filename)
-            shutil.copy2(src_label, dst_label)
-
-    for image_filename in val_list:
-        src_img = os.path.join(images_dir, image_filename)
-        dst_img = os.path.join(val_images_dir, image_filename)
-        shutil.copy2(src_img, dst_img)
+def place_files(operations, mode="copy", workers=None):
+    """
+    Materialize a planned list of (src, dst) operations with a thread pool sized for I/O,
+    printing progress and throughput. Destination directories must already exist.
+    Returns the number of placed files.
+    """
+    operations = list(operations)
+    total = len(operations)
+    if not total:
+        return 0
+    workers = workers or default_io_workers()
+    progress = {"files": 0, "bytes": 0, "last_report": time.monotonic()}
+    lock = threading.Lock()
+    start = time.monotonic()
+
+    def place(operation):
+        src, dst = operation
+        size = os.stat(src).st_size
+        place_file(src, dst, mode)
+        with lock:
+            progress["files"] += 1
+            progress["bytes"] += size
+            now = time.monotonic()
+            if now - progress["last_report"] >= PROGRESS_INTERVAL:
+                progress["last_report"] = now
+                _print_placement(progress["files"], total, progress["bytes"], now - start)
+
+    if workers <= 1:
+        for operation in operations:
+            place(operation)
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            # Consume the results so that errors raised by a worker are propagated.
+            for _ in executor.map(place, operations):
+                pass
+    _print_placement(progress["files"], total, progress["bytes"], time.monotonic() - start)
+    count(size=progress["bytes"], files=progress["files"])
+    return progress["files"]
+
+
+def _print_placement(done, total, size, elapsed):
+    rate = done / elapsed if elapsed > 0 else 0.0
+    mb_rate = size / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+    print(f"Placed {done}/{total} files ({size / (1024 * 1024):.1f} MB) "
+          f"at {rate:.0f} files/s, {mb_rate:.1f} MB/s")
+
+
+def _reflink(src, dst):
+    """
+    Create a copy-on-write clone of `src` at `dst` (Linux FICLONE or macOS clonefile).
+    """
+    if sys.platform == "darwin":
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        return
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflink is not supported on this platform")
+    import fcntl
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def index_extracted_export(extracted_path, index=None, project_id=None):
+    """
+    Add the images of an extracted export (with subdirectories 'images' and 'labels') to `index`,
+    a dict mapping image filename to {"image": path, "label": path or None, "project": project_id}.
+    Images with the same filename as an already indexed one replace it; use merge_indices to combine
+    the indices of several exports without losing images.
+    """
+    index = {} if index is None else index
+    images_dir = os.path.join(extracted_path, "images")
+    labels_dir = os.path.join(extracted_path, "labels")
+    if not os.path.isdir(images_dir):
+        return index
+    # Listing the labels once avoids an exists() call per image.
+    labels = set(_list_files(labels_dir)) if os.path.isdir(labels_dir) else set()
+    for file in _list_files(images_dir):
+        if not file.lower().endswith(IMAGE_EXTENSIONS):
+            continue
+        label_filename = os.path.splitext(file)[0] + ".txt"
+        label_path = os.path.join(labels_dir, label_filename) if label_filename in labels else None
+        index[file] = {"image": os.path.join(images_dir, file), "label": label_path, "project": project_id}
+    return index
+
+
+def merge_indices(indices, reserved=(), owners=None):
+    """
+    Combine the image indices of several exports, given as (project_id, index) pairs in priority order.
+    Images whose name stem is already taken (by an earlier export, or by one of the `reserved` names,
+    e.g. items kept from projects that weren't exported) are renamed to <stem>_p<project_id><ext> instead of
+    replacing the earlier image. Stems are compared because images sharing one would share a label file.
+    `owners` maps the names of the current dataset (e.g. the manifest files) to their project: an image first
+    gets back the name, plain or renamed, that its project holds there, so names don't move between projects
+    when an image is added or removed or the project order changes.
+    Returns (merged index, list of renames).
+    """
+    owners = {name: str(project) for name, project in (owners or {}).items()}
+    taken = {os.path.splitext(name)[0] for name in reserved}
+    suffixes = [f"_p{project_id if project_id is not None else position}"
+                for position, (project_id, _) in enumerate(indices, 1)]
+    held = {}
+    for position, (project_id, index) in enumerate(indices):
+        for name in index:
+            for candidate in _rename_candidates(name, suffixes[position]):
+                if candidate not in owners:
+                    break
+                stem = os.path.splitext(candidate)[0]
+                if owners[candidate] == str(project_id) and stem not in taken:
+                    taken.add(stem)
+                    held[(position, name)] = candidate
+                    break
+
+    merged = {}
+    renamed = []
+    for position, (project_id, index) in enumerate(indices):
+        for name, item in index.items():
+            new_name = held.get((position, name))
+            if new_name is None:
+                new_name = next(candidate for candidate in _rename_candidates(name, suffixes[position])
+                                if os.path.splitext(candidate)[0] not in taken)
+                taken.add(os.path.splitext(new_name)[0])
+            merged[new_name] = item
+            if new_name != name:
+                renamed.append({"name": name, "project": project_id, "renamed_to": new_name})
+    return merged, renamed
+
+
+def _rename_candidates(name, suffix):
+    """
+    The names an image can get in merge_indices, in order: its own, then <stem><suffix>, <stem><suffix>_2, ...
+    """
+    stem, ext = os.path.splitext(name)
+    yield name
+    attempt = 1
+    while True:
+        yield f"{stem}{suffix}" + (f"_{attempt}" if attempt > 1 else "") + ext
+        attempt += 1
+
+
+def _existing(path):
+    return path if os.path.exists(path) else None
+
+
+def _list_files(directory):
+    with os.scandir(directory) as entries:
+        return [entry.name for entry in entries if entry.is_file()]
+
+
+def assign_splits(index, names, train_ratio=0.8, split_options=None, placed=None, placed_labels=None):
+    """
+    Run the split engine (see utils.splitting.split_items) over `names` of an image index.
+    `split_options` may hold "mode", "seed", "stratify" and "names" (the class names).
+    `placed` maps the items already in the dataset to their split and `placed_labels` to their label
+    (a path, or an array of class ids), so that the new items fill the quotas of the whole dataset.
+    """
+    options = split_options or {}
+    class_names = options.get("names")
+    stratify = options.get("stratify", False)
+    label_paths = {name: index[name]["label"] for name in names}
+    if stratify and placed:
+        label_paths.update(placed_labels or {})
+    return split_items(
+        names,
+        train_ratio,
+        mode=options.get("mode", "hash"),
+        seed=options.get("seed", 0),
+        label_paths=label_paths,
+        stratify=stratify,
+        nc=len(class_names) if class_names else None,
+        placed=placed,
+    )
+
+
+def sync_dataset(index, output_dataset_dir, train_ratio=0.8, mode="copy", keep_projects=(), split_options=None,
+                 workers=None, project_states=None, groups=None, image_hashes=None):
+    """
+    Incrementally bring `output_dataset_dir` in line with an image index (see index_extracted_export).
+    Content hashes, source project and split of every item are recorded in the dataset manifest,
+    so only added, updated or removed items touch the dataset and existing items keep their split.
+    Items of projects listed in `keep_projects` (e.g. projects whose export failed) are left untouched.
+    New items are assigned by the split engine (see assign_splits). The members of each of `groups`
+    (e.g. near-duplicate images) are then kept in a single split, moving existing items if needed.
+    `project_states`, when given, is stored in the manifest (see project_states). `image_hashes` holds
+    already known image content hashes. Returns a summary dict of the changes.
+    """
+    create_dirs(output_dataset_dir)
+    manifest = load_manifest(output_dataset_dir)
+    previous = manifest["files"]
+    keep_projects = {str(project_id) for project_id in keep_projects}
+    present = {
+        split: set(_list_files(os.path.join(output_dataset_dir, split, "images")))
+        for split in ("train", "val")
+    }
+
+    def hash_item(name):
+        item = index[name]
+        image_hash = (image_hashes or {}).get(name) or hash_file(item["image"])
+        return image_hash, hash_file(item["label"]) if item["label"] else None
+
+    # hashlib releases the GIL on large buffers, so hashing scales with the I/O thread pool.
+    with ThreadPoolExecutor(max_workers=workers or default_io_workers()) as executor:
+        hashes = dict(zip(index, executor.map(hash_item, index)))
+
+    files = {}
+    added, updated, unchanged = [], [], []
+    for name, item in index.items():
+        entry = {
+            "image_hash": hashes[name][0],
+            "label_hash": hashes[name][1],
+            "project": item["project"],
+            "split": None,
+        }
+        old = previous.get(name)
+        if old is None or name not in present.get(old["split"], ()):
+            added.append(name)
+        else:
+            entry["split"] = old["split"]
+            if (entry["image_hash"], entry["label_hash"]) != (old["image_hash"], old["label_hash"]):
+                updated.append(name)
+            else:
+                unchanged.append(name)
+        files[name] = entry
+
+    removed, kept = [], []
+    for name, old in previous.items():
+        if name in files:
+            continue
+        if str(old["project"]) in keep_projects:
+            files[name] = old
+            kept.append(name)
+            continue
+        removed.append(name)
+        _remove_item(name, output_dataset_dir, old["split"])
+
+    placed = {name: entry["split"] for name, entry in files.items() if entry["split"] is not None}
+    placed_labels = {
+        name: index[name]["label"] if name in index else
+        _existing(os.path.join(output_dataset_dir, placed[name], "labels", os.path.splitext(name)[0] + ".txt"))
+        for name in placed
+    } if (split_options or {}).get("stratify") else None
+    for name, split in assign_splits(index, added, train_ratio, split_options, placed, placed_labels).items():
+        files[name]["split"] = split
+
+    # Kept items have no source to be placed from, so their groups follow them.
+    moves = group_splits({name: entry["split"] for name, entry in files.items()}, groups or [],
+                         established=set(files) - set(added), fixed=set(kept))
+    for name, split in moves.items():
+        files[name]["split"] = split
+    moved = [name for name in unchanged if name in moves]
+    # Symlinks follow unchanged items to their new export directory, so that the previous one can be deleted.
+    relinked = [
+        name for name in unchanged if name not in moves and mode == "symlink"
+        and _links_elsewhere(index[name], name, output_dataset_dir, files[name]["split"])
+    ]
+
+    operations = []
+    for name in added + updated + moved + relinked:
+        entry = files[name]
+        old = previous.get(name)
+        if old is not None and old["split"] != entry["split"]:
+            _remove_item(name, output_dataset_dir, old["split"])
+        if old is not None and old["split"] == entry["split"] and old["label_hash"] and not entry["label_hash"]:
+            _remove_item(name, output_dataset_dir, entry["split"], image=False)
+        operations.extend(_item_operations(index[name], name, output_dataset_dir, entry["split"]))
+    place_files(operations, mode, workers)
+
+    # Drop leftovers that the manifest doesn't know about (e.g. from runs before the manifest existed).
+    for split, names in present.items():
+        for name in names:
+            if files.get(name, {}).get("split") != split:
+                _remove_item(name, output_dataset_dir, split)
+
+    manifest["files"] = files
+    if project_states is not None:
+        manifest["projects"] = project_states
+    save_manifest(manifest, output_dataset_dir)
+
+    summary = {
+        "added": len(added),
+        "updated": len(updated),
+        "removed": len(removed),
+        "unchanged": len(unchanged),
+        "moved": len(moved),
+        "train": sum(1 for entry in files.values() if entry["split"] == "train"),
+        "val": sum(1 for entry in files.values() if entry["split"] == "val"),
+    }
+    print(f"Dataset synced: {summary['added']} added, {summary['updated']} updated, "
+          f"{summary['removed']} removed, {summary['unchanged']} unchanged "
+          f"({summary['train']} training items, {summary['val']} validation items).")
+    if moved:
+        print(f"{len(moved)} items moved to the split of their duplicate group.")
+    if relinked:
+        print(f"{len(relinked)} unchanged items relinked to their new export directory.")
+
+    class_names = (split_options or {}).get("names")
+    if class_names:
+        summary["classes"] = split_class_report({
+            split: [
+                os.path.join(output_dataset_dir, split, "labels", os.path.splitext(name)[0] + ".txt")
+                for name, entry in files.items() if entry["split"] == split and entry["label_hash"]
+            ]
+            for split in ("train", "val")
+        }, class_names)
+    return summary
+
+
+def _links_elsewhere(item, image_filename, output_dataset_dir, split):
+    """
+    Whether the dataset image or label of an item is a symlink to another file than its indexed source.
+    """
+    for src, dst in _item_operations(item, image_filename, output_dataset_dir, split):
+        if os.path.islink(dst) and os.readlink(dst) != os.path.abspath(src):
+            return True
+    return False
+
+
+def _item_operations(item, image_filename, output_dataset_dir, split):
+    operations = [(item["image"], os.path.join(output_dataset_dir, split, "images", image_filename))]
+    if item["label"]:
         label_filename = os.path.splitext(image_filename)[0] + ".txt"
-        src_label = os.path.join(labels_dir, label_filename)
-        if os.path.exists(src_label):
-            dst_label = os.path.join(val_labels_dir, label_filename)
-            shutil.copy2(src_label, dst_label)
+        operations.append((item["label"], os.path.join(output_dataset_dir, split, "labels", label_filename)))
+    return operations
+
+
+def _remove_item(image_filename, output_dataset_dir, split, image=True):
+    label_filename = os.path.splitext(image_filename)[0] + ".txt"
+    paths = [os.path.join(output_dataset_dir, split, "labels", label_filename)]
+    if image:
+        paths.append(os.path.join(output_dataset_dir, split, "images", image_filename))
+    for path in paths:
+        _unlink_quiet(path)
+
+
+# Number of values per label row: class + xywh for boxes, class + 4 corner points for oriented boxes.
+BOX_COLUMNS = 5
+OBB_COLUMNS = 9
+LABEL_ISSUES = ("malformed", "non_numeric", "bad_class", "out_of_range", "degenerate", "duplicate")
+
+
+def parse_label_files(label_paths):
+    """
+    Parse YOLO / YOLO-OBB label files in bulk.
+    Returns a dict with, for every well-formed row of each format ("box" and "obb"),
+    a float array of values and the index of the owning file, plus the (file index, issue)
+    of the rows that could not be parsed ("invalid").
+    """
+    rows = {BOX_COLUMNS: ([], []), OBB_COLUMNS: ([], [])}
+    invalid = []
+    for i, path in enumerate(label_paths):
+        with open(path, "r") as f:
+            for line in f.read().splitlines():
+                tokens = line.split()
+                if not tokens:
+                    continue
+                if len(tokens) not in rows:
+                    invalid.append((i, "malformed"))
+                    continue
+                lines, owners = rows[len(tokens)]
+                lines.append(line)
+                owners.append(i)
+
+    parsed = {}
+    for columns, name in ((BOX_COLUMNS, "box"), (OBB_COLUMNS, "obb")):
+        lines, owners = rows[columns]
+        try:
+            values = np.array(" ".join(lines).split(), dtype=np.float64).reshape(-1, columns)
+            owners = np.asarray(owners, dtype=np.int64)
+        except ValueError:
+            # Some rows are not numeric: fall back to row by row conversion for this format.
+            good_values, good_owners = [], []
+            for line, owner in zip(lines, owners):
+                try:
+                    good_values.append([float(token) for token in line.split()])
+                    good_owners.append(owner)
+                except ValueError:
+                    invalid.append((owner, "non_numeric"))
+            values = np.asarray(good_values, dtype=np.float64).reshape(-1, columns)
+            owners = np.asarray(good_owners, dtype=np.int64)
+        parsed[name] = {"values": values, "owners": owners}
+    parsed["invalid"] = invalid
+    return parsed
+
+
+def check_label_rows(values, nc, obb=False, min_size=1e-6):
+    """
+    Run the geometry and class checks over an array of label rows.
+    Returns a dict issue -> boolean mask of the rows having that issue.
+    """
+    classes = values[:, 0]
+    coords = values[:, 1:]
+    checks = {
+        "bad_class": (classes != np.floor(classes)) | (classes < 0) | (classes >= nc),
+        "out_of_range": ~np.isfinite(coords).all(axis=1) | (coords < 0).any(axis=1) | (coords > 1).any(axis=1),
+    }
+    if obb:
+        checks["degenerate"] = polygon_areas(coords) < min_size ** 2
+    else:
+        checks["degenerate"] = (coords[:, 2] < min_size) | (coords[:, 3] < min_size)
+    return checks
+
+
+def polygon_areas(coords):
+    """
+    Shoelace area of every polygon row (x1, y1, ..., xn, yn).
+    """
+    x, y = coords[:, 0::2], coords[:, 1::2]
+    return 0.5 * np.abs((x * np.roll(y, -1, axis=1) - np.roll(x, -1, axis=1) * y).sum(axis=1))
+
+
+def box_sizes(values, obb=False):
+    """
+    Width and height (normalized) of every label row; for oriented boxes, the lengths of the first two sides.
+    """
+    coords = values[:, 1:]
+    if not obb:
+        return coords[:, 2], coords[:, 3]
+    points = coords.reshape(-1, 4, 2)
+    width = np.linalg.norm(points[:, 1] - points[:, 0], axis=1)
+    height = np.linalg.norm(points[:, 2] - points[:, 1], axis=1)
+    return width, height
+
+
+def validate_labels(output_dataset_dir, names, fix=False, report_path=None):
+    """
+    Validate every label file of the train and val splits of `output_dataset_dir`.
+    Checks for malformed or non-numeric rows, class ids outside `names`, out-of-range coordinates,
+    degenerate boxes/polygons, duplicate rows and labels without an image.
+    With `fix`, out-of-range coordinates are clipped, other bad rows and orphaned labels are dropped,
+    and the label files are rewritten. A JSON report with per-class statistics is written to
+    `report_path` (default: <output_dataset_dir>/label_report.json) and returned.
+    """
+    nc = len(names)
+    report_path = report_path or os.path.join(output_dataset_dir, "label_report.json")
+    report = {"fixed": fix, "issues": dict.fromkeys(LABEL_ISSUES, 0), "files_with_issues": {}, "splits": {}}
+
+    for split in ("train", "val"):
+        images_dir = os.path.join(output_dataset_dir, split, "images")
+        labels_dir = os.path.join(output_dataset_dir, split, "labels")
+        if not os.path.isdir(labels_dir):
+            continue
+        image_stems = {os.path.splitext(name)[0] for name in _list_files(images_dir)}
+        label_files = sorted(name for name in _list_files(labels_dir) if name.endswith(".txt"))
+        orphans = [name for name in label_files if os.path.splitext(name)[0] not in image_stems]
+        label_files = [name for name in label_files if os.path.splitext(name)[0] in image_stems]
+        label_paths = [os.path.join(labels_dir, name) for name in label_files]
+
+        parsed = parse_label_files(label_paths)
+        # Issues per file index, and the files that need to be rewritten in fix mode.
+        file_issues = {}
+        dropped = {}
+        for owner, issue in parsed["invalid"]:
+            file_issues.setdefault(owner, {}).setdefault(issue, 0)
+            file_issues[owner][issue] += 1
+            dropped[owner] = True
+
+        kept = {}
+        for kind in ("box", "obb"):
+            values, owners = parsed[kind]["values"], parsed[kind]["owners"]
+            obb = kind == "obb"
+            checks = check_label_rows(values, nc, obb)
+            checks["duplicate"] = _duplicate_rows(values, owners)
+            for issue, mask in checks.items():
+                for owner in owners[mask]:
+                    file_issues.setdefault(int(owner), {}).setdefault(issue, 0)
+                    file_issues[int(owner)][issue] += 1
+
+            if fix:
+                # Clip out-of-range coordinates, then drop the rows that are still unusable.
+                changed = checks["out_of_range"]
+                values = values.copy()
+                values[:, 1:] = np.clip(np.nan_to_num(values[:, 1:], nan=0.0), 0.0, 1.0)
+                fixed_checks = check_label_rows(values, nc, obb)
+                bad = fixed_checks["bad_class"] | fixed_checks["degenerate"] | _duplicate_rows(values, owners)
+                for owner in np.unique(owners[bad | changed]):
+                    dropped[int(owner)] = True
+            else:
+                bad = np.logical_or.reduce(list(checks.values())) if len(values) else np.zeros(0, dtype=bool)
+            kept[kind] = (values[~bad], owners[~bad])
+
+        for owner, issues in file_issues.items():
+            report["files_with_issues"][os.path.join(split, "labels", label_files[owner])] = issues
+            for issue, count in issues.items():
+                report["issues"][issue] += count
+
+        if fix:
+            for owner in dropped:
+                _rewrite_label_file(label_paths[owner], kept, owner)
+            for name in orphans:
+                _unlink_quiet(os.path.join(labels_dir, name))
+
+        report["splits"][split] = {
+            "label_files": len(label_files),
+            "images_without_labels": len(image_stems) - len(label_files),
+            "orphaned_labels": orphans,
+            "classes": _class_statistics(kept, names),
+        }
+
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+
+    total_issues = sum(report["issues"].values())
+    orphan_count = sum(len(split["orphaned_labels"]) for split in report["splits"].values())
+    print(f"Label validation: {total_issues} issues in {len(report['files_with_issues'])} files, "
+          f"{orphan_count} orphaned labels" + (" (fixed)" if fix and (total_issues or orphan_count) else "") + ".")
+    for issue, count in report["issues"].items():
+        if count:
+            print(f"  - {issue}: {count}")
+    print(f"Label report written to {report_path}")
+    return report
+
+
+def _duplicate_rows(values, owners):
+    duplicate = np.ones(len(values), dtype=bool)
+    if len(values):
+        first = np.unique(np.column_stack([owners, values]), axis=0, return_index=True)[1]
+        duplicate[first] = False
+    return duplicate
+
+
+def _rewrite_label_file(path, kept, owner):
+    lines = []
+    for kind in ("box", "obb"):
+        values, owners = kept[kind]
+        for row in values[owners == owner]:
+            lines.append(" ".join([str(int(row[0]))] + [f"{value:.6g}" for value in row[1:]]))
+    # Write a new file instead of modifying it in place, so hardlinked or symlinked sources are left intact.
+    _unlink_quiet(path)
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + ("\n" if lines else ""))
+
+
+def _class_statistics(rows, names):
+    statistics = {}
+    for class_id, name in enumerate(names):
+        widths, heights, images = [], [], []
+        for kind in ("box", "obb"):
+            values, owners = rows[kind]
+            mask = values[:, 0] == class_id
+            width, height = box_sizes(values[mask], kind == "obb")
+            widths.append(width)
+            heights.append(height)
+            images.append(owners[mask])
+        widths, heights = np.concatenate(widths), np.concatenate(heights)
+        statistics[name] = {
+            "instances": int(len(widths)),
+            "images": int(len(np.unique(np.concatenate(images)))),
+            "width": _describe(widths),
+            "height": _describe(heights),
+            "area": _describe(widths * heights),
+        }
+    return statistics
+
 
-    print(f"Dataset created: {len(train_list)} training items, {len(val_list)} validation items.")
+def _describe(values):
+    if not len(values):
+        return None
+    return {
+        "min": float(values.min()),
+        "mean": float(values.mean()),
+        "median": float(np.median(values)),
+        "max": float(values.max()),
+    }
 
 
-def generate_data_yaml(output_dataset_dir, data_yaml_path, nc, names):
+def generate_data_yaml(output_dataset_dir, data_yaml_path, nc, names, dataset_root=None, packed=False):
     """
     Generates a data.yaml file with absolute paths for the train and val image directories,
     the number of classes (nc), and the class names (names) in valid YAML format.
+    The image directories are looked up under `dataset_root` (e.g. a resized cache) when given.
+    With `packed`, both splits point at the packed dataset directory `dataset_root`.
     """
-    train_images_path = os.path.join(os.path.abspath(output_dataset_dir), "train", "images")
-    val_images_path = os.path.join(os.path.abspath(output_dataset_dir), "val", "images")
+    dataset_root = os.path.abspath(dataset_root or output_dataset_dir)
+    train_images_path = dataset_root if packed else os.path.join(dataset_root, "train", "images")
+    val_images_path = dataset_root if packed else os.path.join(dataset_root, "val", "images")
     # Create a YAML list for names
     names_yaml = "\n".join(["  - " + name for name in names])
     yaml_content = f'''train: "{train_images_path}"
@@ -0,0 +1,244 @@
+import io
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import numpy as np
+from PIL import Image
+from .manifest import hash_file
+from .dataset_preparation import default_io_workers
+from .packed_dataset import PackedDataset, PACK_FILENAME, packed_dir
+from .instrumentation import count
+
+DEDUP_CACHE_FILENAME = "dedup_cache.json"
+DEDUP_REPORT_FILENAME = "dedup_report.json"
+# dHash compares horizontally adjacent pixels of a (HASH_SIZE + 1) x HASH_SIZE thumbnail: 64 bits.
+HASH_SIZE = 8
+# Hashes at most this many bits apart are near-duplicates (consecutive video frames are typically within 2-5).
+DEFAULT_MAX_DISTANCE = 5
+# Upper bound on the size of the pairwise distance blocks computed at once.
+PAIR_BLOCK = 4 * 1024 * 1024
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def dhash(source):
+    """
+    Difference hash of an image (a path, or its encoded bytes) as a 16 hex digit string, or None when
+    the image can't be decoded. Similar images get hashes a few bits apart, whatever their size and compression.
+    """
+    try:
+        with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as im:
+            # Let the JPEG decoder downscale while decoding, the thumbnail is tiny anyway.
+            im.draft("L", ((HASH_SIZE + 1) * 8, HASH_SIZE * 8))
+            thumbnail = im.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return f"{int(np.packbits(bits).view('>u8')[0]):016x}"
+
+
+def hamming_distances(a, b):
+    """
+    Number of differing bits between uint64 arrays (broadcast).
+    """
+    x = np.ascontiguousarray(np.bitwise_xor(a, b))
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(x)
+    return _POPCOUNT8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1)
+
+
+def _find(parent, nodes):
+    roots = parent[nodes]
+    while True:
+        up = parent[roots]
+        if np.array_equal(up, roots):
+            break
+        roots = up
+    parent[nodes] = roots
+    return roots
+
+
+def _union(parent, left, right):
+    """
+    Merge the components of every (left[k], right[k]) pair, vectorized: each pass links the larger root
+    to the smaller one, until every pair shares a root.
+    """
+    while len(left):
+        left_roots, right_roots = _find(parent, left), _find(parent, right)
+        differ = left_roots != right_roots
+        if not differ.any():
+            return
+        parent[np.maximum(left_roots, right_roots)[differ]] = np.minimum(left_roots, right_roots)[differ]
+        left, right = left[differ], right[differ]
+
+
+def near_duplicate_components(hashes, max_distance=DEFAULT_MAX_DISTANCE):
+    """
+    Group 64-bit perceptual hashes (uint64 array) that are within `max_distance` bits of each other, transitively.
+    Instead of comparing all pairs, the bits are split into max_distance + 1 bands: two hashes within the
+    distance agree exactly on at least one band, so only hashes sharing a band value are compared.
+    Returns the component id of every hash.
+    """
+    values, inverse = np.unique(hashes, return_inverse=True)
+    parent = np.arange(len(values))
+    edges = np.linspace(0, 64, min(max_distance, 63) + 2).astype(np.uint64)
+    for low, high in zip(edges[:-1], edges[1:]):
+        keys = (values >> low) & np.uint64((1 << int(high - low)) - 1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], len(order)]
+        for start, end in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            members = order[start:end]
+            bucket = values[members]
+            rows = max(1, PAIR_BLOCK // len(members))
+            for row in range(0, len(members), rows):
+                distances = hamming_distances(bucket[row:row + rows, None], bucket[None, :])
+                i, j = np.nonzero(distances <= max_distance)
+                i += row
+                close = j > i
+                _union(parent, members[i[close]], members[j[close]])
+    return _find(parent, np.arange(len(values)))[inverse]
+
+
+def load_dedup_cache(output_dataset_dir):
+    path = os.path.join(output_dataset_dir, DEDUP_CACHE_FILENAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_dedup_cache(output_dataset_dir, cache):
+    os.makedirs(output_dataset_dir, exist_ok=True)
+    path = os.path.join(output_dataset_dir, DEDUP_CACHE_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_path, path)
+
+
+def dataset_images(output_dataset_dir, files, packed=False):
+    """
+    Locate the images of items already in the prepared dataset (`files` maps name -> manifest entry):
+    <output_dataset_dir>/<split>/images/<name>, or with `packed` their encoded bytes read from the shards.
+    Returns a dict name -> path or bytes, without the items whose image can't be found.
+    """
+    if packed:
+        pack_dir = packed_dir(output_dataset_dir)
+        if not files or not os.path.exists(os.path.join(pack_dir, PACK_FILENAME)):
+            return {}
+        pack = PackedDataset(pack_dir)
+        try:
+            rows = {name: i for i, name in enumerate(pack.names)}
+            return {name: bytes(pack.image_bytes(rows[name])) for name in files if name in rows}
+        finally:
+            pack.close()
+    images = {}
+    for name, entry in files.items():
+        path = os.path.join(output_dataset_dir, str(entry.get("split")), "images", name)
+        if os.path.exists(path):
+            images[name] = path
+    return images
+
+
+def find_duplicates(index, output_dataset_dir, kept=None, max_distance=DEFAULT_MAX_DISTANCE,
+                    drop_exact=False, workers=None, io_workers=None, renamed=(), packed=False):
+    """
+    Find the exact and near-duplicate images of an image index (see index_extracted_export).
+
+    Content hashes are computed with `io_workers` threads; perceptual hashes (dhash) only for content
+    that isn't in <output_dataset_dir>/dedup_cache.json yet, in a process pool of `workers`. `kept` maps
+    names of items that are not in the index (e.g. kept from projects that weren't exported) to their
+    manifest entry: they are compared through the cache by content hash, and read from the prepared dataset
+    (see dataset_images) when their hash isn't cached. Kept items that can't be read are reported as unhashed.
+    Near-duplicates are grouped with near_duplicate_components. With `drop_exact`, one image of each set of
+    identical images is kept. A report (including the `renamed` name collisions) is written to
+    <output_dataset_dir>/dedup_report.json.
+
+    Returns {"groups": lists of names, "image_hashes": name -> content hash, "dropped": names}.
+    """
+    names = list(index)
+    with ThreadPoolExecutor(max_workers=io_workers or default_io_workers()) as executor:
+        content = dict(zip(names, executor.map(hash_file, (index[name]["image"] for name in names))))
+    kept = {name: entry for name, entry in (kept or {}).items() if name not in content}
+    content.update({name: entry["image_hash"] for name, entry in kept.items()})
+    count(size=sum(os.path.getsize(index[name]["image"]) for name in names), files=len(names))
+
+    cache = load_dedup_cache(output_dataset_dir)
+    missing = {}
+    for name in names:
+        if content[name] not in cache:
+            missing.setdefault(content[name], index[name]["image"])
+    uncached = {}
+    for name in sorted(kept):
+        if content[name] not in cache and content[name] not in missing:
+            uncached.setdefault(content[name], name)
+    if uncached:
+        images = dataset_images(output_dataset_dir, {name: kept[name] for name in uncached.values()}, packed)
+        missing.update({content[name]: image for name, image in images.items()})
+    if missing:
+        print(f"Computing perceptual hashes of {len(missing)} images "
+              f"({len(set(content.values())) - len(missing)} cached)...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            cache.update(zip(missing, executor.map(dhash, missing.values(), chunksize=64)))
+    # Only keep the hashes of the current dataset.
+    cache = {image_hash: cache[image_hash] for image_hash in set(content.values()) if image_hash in cache}
+    save_dedup_cache(output_dataset_dir, cache)
+
+    hashed = sorted(name for name in content if cache.get(content[name]))
+    unreadable = sorted(name for name in names if not cache.get(content[name]))
+    unhashed = sorted(name for name in kept if not cache.get(content[name]))
+    components = near_duplicate_components(
+        np.array([int(cache[content[name]], 16) for name in hashed], dtype=np.uint64), max_distance
+    )
+    members = {}
+    for name, component in zip(hashed, components):
+        members.setdefault(int(component), []).append(name)
+    groups = [group for group in members.values() if len(group) > 1]
+
+    report_groups = []
+    dropped = []
+    for group in groups:
+        by_content = {}
+        for name in group:
+            by_content.setdefault(content[name], []).append(name)
+        identical = [same for same in by_content.values() if len(same) > 1]
+        if drop_exact:
+            # Keep the first identical image, preferring one that can't be dropped (not in the index).
+            for same in identical:
+                keep = next((name for name in same if name not in index), same[0])
+                dropped.extend(name for name in same if name != keep and name in index)
+        report_groups.append({
+            "members": group,
+            "identical": identical,
+            "projects": sorted({str(index[name]["project"]) for name in group if name in index}),
+            "max_distance": int(hamming_distances(
+                np.array([int(cache[content[name]], 16) for name in group], dtype=np.uint64)[:, None],
+                np.array([int(cache[content[name]], 16) for name in group], dtype=np.uint64)[None, :]
+            ).max()),
+        })
+
+    report = {
+        "images": len(content),
+        "hashed": len(missing),
+        "max_distance": max_distance,
+        "duplicate_groups": len(groups),
+        "images_in_groups": sum(len(group) for group in groups),
+        "identical_sets": sum(len(group["identical"]) for group in report_groups),
+        "dropped": sorted(dropped),
+        "renamed": list(renamed),
+        "unreadable": unreadable,
+        "unhashed": unhashed,
+        "groups": sorted(report_groups, key=lambda group: -len(group["members"])),
+    }
+    report_path = os.path.join(output_dataset_dir, DEDUP_REPORT_FILENAME)
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Deduplication: {report['duplicate_groups']} groups of near-duplicate images "
+          f"({report['images_in_groups']} images, {report['identical_sets']} sets of identical images), "
+          f"{len(renamed)} renamed name collisions, {len(unreadable)} unreadable images"
+          + (f", {len(unhashed)} kept images that couldn't be hashed" if unhashed else "")
+          + (f", {len(dropped)} identical copies dropped" if drop_exact else "") + ".")
+    print(f"Deduplication report written to {report_path}")
+    return {"groups": groups, "image_hashes": {name: content[name] for name in names}, "dropped": dropped}
@@ -0,0 +1,183 @@
+import os
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from .manifest import hash_file
+from .dataset_preparation import place_file
+
+EXPORT_INDEX_FILENAME = "export_index.json"
+# Formats that ultralytics builds from one ONNX -> TensorFlow SavedModel conversion.
+TF_FORMATS = ("saved_model", "pb", "tflite", "tfjs")
+# Per-target options forwarded to model.export.
+EXPORT_OPTIONS = ("imgsz", "half", "int8", "dynamic", "simplify", "opset", "nms", "batch", "data", "optimize")
+DEFAULT_TARGETS = [{"format": "tfjs"}]
+
+
+def target_name(target, imgsz=None):
+    """
+    Name of an export target, e.g. "onnx", "tflite_int8" or "tflite_fp16", unless the target sets "name".
+    A target whose image size differs from the model's `imgsz` gets it appended, e.g. "onnx_320".
+    """
+    if target.get("name"):
+        return target["name"]
+    suffix = "_int8" if target.get("int8") else "_fp16" if target.get("half") else ""
+    if imgsz is not None and target.get("imgsz", imgsz) != imgsz:
+        suffix += f"_{target['imgsz']}"
+    return f"{target['format']}{suffix}"
+
+
+def plan_export_groups(targets, imgsz):
+    """
+    Group export targets that can be produced by a single ultralytics export call.
+    All TensorFlow formats with the same image size and quantization share one SavedModel conversion,
+    and a plain ONNX target compatible with it reuses the ONNX graph that conversion starts from.
+    Returns a dict group name -> {"format": format to export, "options": ..., "targets": [...]}.
+    Every target gets its final "name"; two targets with the same name raise an exception.
+    """
+    groups = {}
+    names = set()
+    for target in targets:
+        target = dict(target)
+        target["name"] = target_name(target, imgsz)
+        if target["name"] in names:
+            raise Exception(f"Two export targets are named {target['name']!r}, give one of them a \"name\"")
+        names.add(target["name"])
+        target.setdefault("imgsz", imgsz)
+        fmt = target["format"]
+        if fmt in TF_FORMATS:
+            # tfjs quantizes its own weights with half, the other TF formats only pick a file.
+            half = bool(target.get("half")) if fmt == "tfjs" else False
+            name = f"tf_imgsz{target['imgsz']}" + ("_int8" if target.get("int8") else "") + ("_fp16" if half else "")
+            options = {key: target[key] for key in ("imgsz", "int8", "data", "nms") if key in target}
+            if half:
+                options["half"] = True
+        else:
+            options = {key: target[key] for key in EXPORT_OPTIONS if key in target}
+            name = target_name(target) + f"_imgsz{target['imgsz']}"
+        group = groups.setdefault(name, {"format": fmt, "options": options, "targets": []})
+        group["targets"].append(target)
+        if fmt in TF_FORMATS:
+            group["format"] = _main_tf_format([t["format"] for t in group["targets"]])
+
+    # Let plain ONNX targets ride along with a matching TensorFlow conversion.
+    for name, group in list(groups.items()):
+        if group["format"] != "onnx" or len(group["targets"]) != 1:
+            continue
+        target = group["targets"][0]
+        if any(target.get(key) for key in ("dynamic", "half", "int8", "opset", "nms")) or \
+                target.get("simplify", True) is False:
+            continue
+        tf_group = groups.get(f"tf_imgsz{target['imgsz']}")
+        if tf_group:
+            tf_group["targets"].append(target)
+            del groups[name]
+    return groups
+
+
+def _main_tf_format(formats):
+    # tfjs builds the SavedModel and the frozen graph, pb builds the SavedModel, which contains the TFLite files.
+    for fmt in ("tfjs", "pb"):
+        if fmt in formats:
+            return fmt
+    return "saved_model"
+
+
+def expected_artifact(work_dir, stem, target):
+    """
+    Path of the artifact ultralytics writes for a target when exporting `<work_dir>/<stem>.pt`.
+    """
+    fmt = target["format"]
+    if fmt == "tflite":
+        # onnx2tf's <stem>_int8.tflite only has int8 weights (dynamic range quantization); the full integer
+        # model is the one calibrated on the `data` images, with int8 activations and inputs.
+        quantization = "full_integer_quant" if target.get("int8") else "float16" if target.get("half") else "float32"
+        return os.path.join(work_dir, f"{stem}_saved_model", f"{stem}_{quantization}.tflite")
+    paths = {
+        "saved_model": f"{stem}_saved_model",
+        "pb": f"{stem}.pb",
+        "tfjs": f"{stem}_web_model",
+        "onnx": f"{stem}.onnx",
+        "torchscript": f"{stem}.torchscript",
+        "openvino": f"{stem}_openvino_model",
+    }
+    return os.path.join(work_dir, paths[fmt]) if fmt in paths else None
+
+
+def run_export_group(weights_path, work_dir, export_format, options, targets):
+    """
+    Export one group of targets in the current process and return a dict target name -> artifact path.
+    """
+    from ultralytics import YOLO
+
+    os.makedirs(work_dir, exist_ok=True)
+    local_weights = os.path.join(work_dir, os.path.basename(weights_path))
+    place_file(weights_path, local_weights, "hardlink")
+    stem = os.path.splitext(os.path.basename(local_weights))[0]
+
+    exported = YOLO(local_weights).export(format=export_format, **options)
+    artifacts = {}
+    for target in targets:
+        path = expected_artifact(work_dir, stem, target)
+        if target["format"] == export_format and path is None:
+            path = str(exported)
+        if target["format"] == "onnx" and export_format != "onnx" and not os.path.exists(path):
+            # The TensorFlow conversion didn't keep its ONNX graph, export it on its own.
+            YOLO(local_weights).export(format="onnx", imgsz=target["imgsz"])
+        if path is None or not os.path.exists(path):
+            raise Exception(f"Export of {target_name(target)} did not produce {path or 'an artifact'}")
+        artifacts[target_name(target)] = path
+    return artifacts
+
+
+def export_targets(weights_path, targets, exports_dir, imgsz=640, workers=None):
+    """
+    Export `weights_path` to every target, running independent groups of targets in parallel processes.
+    Results are cached by the hash of the weights: groups whose artifacts were already built from
+    the same weights are skipped. Returns a dict target name -> artifact path and a dict of failures.
+    """
+    os.makedirs(exports_dir, exist_ok=True)
+    index_path = os.path.join(exports_dir, EXPORT_INDEX_FILENAME)
+    index = {}
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            index = json.load(f)
+
+    weights_hash = hash_file(weights_path)
+    groups = plan_export_groups(targets, imgsz)
+    artifacts, failures, pending = {}, {}, {}
+    for name, group in groups.items():
+        cached = index.get(name)
+        names = sorted(target_name(target) for target in group["targets"])
+        if cached and cached["weights_hash"] == weights_hash and cached["options"] == group["options"] and \
+                sorted(cached["artifacts"]) == names and all(os.path.exists(p) for p in cached["artifacts"].values()):
+            print(f"Skipping {', '.join(names)}: already exported from these weights.")
+            artifacts.update(cached["artifacts"])
+        else:
+            pending[name] = group
+
+    if pending:
+        workers = workers or min(len(pending), max(1, (os.cpu_count() or 1) // 2))
+        print(f"Exporting {len(pending)} group(s) with {workers} worker(s)...")
+        # Spawned processes keep the torch/TensorFlow state of every export separate.
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = {
+                executor.submit(run_export_group, weights_path, os.path.join(exports_dir, name),
+                                group["format"], group["options"], group["targets"]): name
+                for name, group in pending.items()
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                group = pending[name]
+                try:
+                    group_artifacts = future.result()
+                except Exception as e:
+                    print(f"Export group {name} failed: {e}")
+                    for target in group["targets"]:
+                        failures[target_name(target)] = str(e)
+                    continue
+                artifacts.update(group_artifacts)
+                index[name] = {"weights_hash": weights_hash, "options": group["options"], "artifacts": group_artifacts}
+                with open(index_path, "w") as f:
+                    json.dump(index, f, indent=4)
+    return artifacts, failures
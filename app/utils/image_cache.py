@@ -0,0 +1,127 @@
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from .manifest import load_manifest
+from .dataset_preparation import place_file, create_dirs
+
+CACHE_INDEX_FILENAME = "cache_index.json"
+JPEG_QUALITY = 95
+EXIF_ORIENTATION = 0x0112
+
+
+def resized_cache_dir(output_dataset_dir, imgsz):
+    """
+    Root of the resized copy of the dataset for a given image size.
+    """
+    return os.path.join(output_dataset_dir, "cache", f"imgsz_{imgsz}")
+
+
+def resize_image(src, dst, imgsz):
+    """
+    Write a copy of `src` whose longest side is at most `imgsz`, keeping the aspect ratio so that
+    normalized label coordinates stay valid. Images that are already small enough are hardlinked.
+    Returns True when the image was resized.
+    """
+    # Never write into a previous cache entry, it may be a hardlink to the dataset image.
+    _unlink_quiet(dst)
+    with Image.open(src) as im:
+        width, height = im.size
+        scale = imgsz / max(width, height)
+        if scale >= 1:
+            place_file(src, dst, "hardlink")
+            return False
+        target = (max(1, round(width * scale)), max(1, round(height * scale)))
+        image_format = im.format
+        # EXIF orientations 5 to 8 swap width and height once the image is transposed.
+        if im.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            transposed_target = (target[1], target[0])
+        else:
+            transposed_target = target
+        # Let the JPEG decoder downscale by a power of two while decoding, which is much cheaper.
+        im.draft("RGB", target)
+        im = ImageOps.exif_transpose(im)
+        resized = im.resize(transposed_target, Image.BILINEAR, reducing_gap=3.0)
+    if image_format == "JPEG":
+        resized.convert("RGB").save(dst, "JPEG", quality=JPEG_QUALITY)
+    else:
+        resized.save(dst, image_format)
+    return True
+
+
+def _resize_job(job):
+    return resize_image(*job)
+
+
+def build_resized_cache(output_dataset_dir, imgsz, workers=None):
+    """
+    Build (or update) a copy of the train/val images of `output_dataset_dir` resized to `imgsz`,
+    with the label files hardlinked next to them. Entries are cached by the source content hash
+    recorded in the dataset manifest, so only new or changed images are resized.
+    Resizing runs in a process pool. Returns the root directory of the resized dataset.
+    """
+    cache_root = resized_cache_dir(output_dataset_dir, imgsz)
+    create_dirs(cache_root)
+    index_path = os.path.join(cache_root, CACHE_INDEX_FILENAME)
+    previous = {}
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            previous = json.load(f)
+
+    files = load_manifest(output_dataset_dir)["files"]
+    cache_index = {}
+    jobs = []
+    for name, entry in files.items():
+        split = entry["split"]
+        src = os.path.join(output_dataset_dir, split, "images", name)
+        dst = os.path.join(cache_root, split, "images", name)
+        old = previous.get(name)
+        cache_index[name] = {"image_hash": entry["image_hash"], "split": split, "label": None}
+        if old and old["split"] != split:
+            _remove_cached(cache_root, old["split"], name)
+        if not old or old["image_hash"] != entry["image_hash"] or old["split"] != split:
+            jobs.append((src, dst, imgsz))
+
+        # Labels are tiny, they are refreshed whenever the dataset label file changed on disk.
+        label_filename = os.path.splitext(name)[0] + ".txt"
+        label_src = os.path.join(output_dataset_dir, split, "labels", label_filename)
+        label_dst = os.path.join(cache_root, split, "labels", label_filename)
+        try:
+            stat = os.stat(label_src)
+        except FileNotFoundError:
+            if old and old.get("label"):
+                _unlink_quiet(label_dst)
+            continue
+        label_key = [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+        cache_index[name]["label"] = label_key
+        if not old or old.get("label") != label_key or old["split"] != split:
+            place_file(label_src, label_dst, "hardlink")
+
+    for name, old in previous.items():
+        if name not in cache_index:
+            _remove_cached(cache_root, old["split"], name)
+
+    resized = 0
+    if jobs:
+        print(f"Resizing {len(jobs)} images to {imgsz}px into {cache_root}...")
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            resized = sum(executor.map(_resize_job, jobs, chunksize=16))
+
+    with open(index_path, "w") as f:
+        json.dump(cache_index, f)
+    print(f"Resized cache ready: {resized} images resized, {len(jobs) - resized} linked, "
+          f"{len(cache_index) - len(jobs)} unchanged.")
+    return cache_root
+
+
+def _remove_cached(cache_root, split, name):
+    label_filename = os.path.splitext(name)[0] + ".txt"
+    _unlink_quiet(os.path.join(cache_root, split, "images", name))
+    _unlink_quiet(os.path.join(cache_root, split, "labels", label_filename))
+
+
+def _unlink_quiet(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import functools
+import resource
+import threading
+from contextlib import contextmanager
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# How often (in seconds) the resident memory of a running stage is sampled.
+SAMPLE_INTERVAL = 0.25
+PROMETHEUS_PREFIX = "yolo_pipeline_stage"
+# Labels left out of the Prometheus metrics, so that every epoch updates the same series.
+VOLATILE_LABELS = ("epoch",)
+
+_sink = {"path": None, "prometheus": None, "labels": {}}
+_sink_lock = threading.Lock()
+_local = threading.local()
+
+
+def configure_metrics(config):
+    """
+    Set where the stages of this process are recorded, from the optional "metrics" block of a configuration:
+    "path" (JSON lines, default <output_dataset_dir>/metrics.jsonl), "prometheus" (text file for the node
+    exporter's textfile collector, off by default) and "enabled" (default true).
+    """
+    metrics_config = config.get("metrics", {})
+    with _sink_lock:
+        if not metrics_config.get("enabled", True):
+            _sink.update(path=None, prometheus=None, labels={})
+            return
+        _sink["path"] = metrics_config.get("path", os.path.join(config["output_dataset_dir"], "metrics.jsonl"))
+        _sink["prometheus"] = metrics_config.get("prometheus")
+        _sink["labels"] = {"config": config.get("config_filename", "")}
+
+
+class Stage:
+    """
+    Measure one stage of the pipeline: wall time, CPU time (including finished child processes),
+    peak resident memory and the bytes and files it processed. Use `stage` for blocks of code,
+    or start() and finish() for stages delimited by callbacks.
+    """
+
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+        self.bytes = 0
+        self.files = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.started_at = time.time()
+        self._wall_start = time.perf_counter()
+        self._cpu_start = _cpu_seconds()
+        self._sampler = _MemorySampler()
+        _stack().append(self)
+        return self
+
+    def add(self, size=0, files=0):
+        with self._lock:
+            self.bytes += size
+            self.files += files
+
+    def finish(self, status="ok", **extra):
+        stack = _stack()
+        if self in stack:
+            stack.remove(self)
+        wall = time.perf_counter() - self._wall_start
+        cpu = _cpu_seconds() - self._cpu_start
+        record = {
+            "stage": self.name,
+            "labels": dict(_sink["labels"], **{key: str(value) for key, value in self.labels.items()}),
+            "status": status,
+            "started_at": self.started_at,
+            "wall_seconds": round(wall, 4),
+            "cpu_seconds": round(cpu, 4),
+            "cpu_utilization": round(cpu / wall, 3) if wall > 0 else 0.0,
+            "peak_rss_bytes": self._sampler.stop(),
+            "bytes": self.bytes,
+            "files": self.files,
+            "mb_per_second": round(self.bytes / (1024 * 1024) / wall, 3) if wall > 0 else 0.0,
+            "files_per_second": round(self.files / wall, 3) if wall > 0 else 0.0,
+            "pid": os.getpid(),
+        }
+        record.update(extra)
+        write_record(record)
+        return record
+
+
+@contextmanager
+def stage(name, **labels):
+    """
+    Record the enclosed block as a pipeline stage (see Stage). Stages can be nested.
+    """
+    current = Stage(name, **labels).start()
+    try:
+        yield current
+    except BaseException:
+        current.finish("error")
+        raise
+    current.finish()
+
+
+def count(size=0, files=0):
+    """
+    Add processed bytes (`size`) and files to every stage running in the current thread.
+    Worker threads only see the stages of the thread that created them through in_current_stages.
+    """
+    for running in _stack():
+        running.add(size, files)
+
+
+def in_current_stages(function):
+    """
+    Wrap `function` so that, when it runs in another thread (e.g. submitted to a ThreadPoolExecutor),
+    what it counts also goes to the stages running in the calling thread. Stage.add takes a lock,
+    so the workers and the calling thread can count concurrently.
+    """
+    stages = list(_stack())
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        previous = getattr(_local, "stack", None)
+        _local.stack = list(stages)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.stack = previous if previous is not None else []
+    return wrapper
+
+
+def peak_rss_bytes():
+    """
+    Peak resident memory of the current process.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def instrument_training(model, **labels):
+    """
+    Record every epoch of an ultralytics training run as a "train_epoch" stage, through the model's callbacks.
+    Each record also holds the number of training images and the validation metrics of the epoch.
+    """
+    current = {}
+
+    def on_epoch_start(trainer):
+        current["stage"] = Stage("train_epoch", epoch=trainer.epoch + 1, **labels).start()
+
+    def on_epoch_end(trainer):
+        epoch_stage = current.pop("stage", None)
+        if epoch_stage is None:
+            return
+        epoch_stage.add(files=len(trainer.train_loader.dataset))
+        metrics = {key: float(value) for key, value in (trainer.metrics or {}).items()}
+        epoch_stage.finish(metrics=metrics)
+
+    model.add_callback("on_train_epoch_start", on_epoch_start)
+    model.add_callback("on_fit_epoch_end", on_epoch_end)
+
+
+def write_record(record):
+    """
+    Append a stage record to the JSON lines file and update the Prometheus text file, when configured.
+    """
+    with _sink_lock:
+        path, prometheus_path = _sink["path"], _sink["prometheus"]
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "a") as f:
+                f.write(json.dumps(record, sort_keys=True) + "\n")
+        if prometheus_path:
+            _write_prometheus(prometheus_path, record)
+
+
+def _write_prometheus(path, record):
+    """
+    Merge the gauges of a stage record into a Prometheus text-format file, keeping the series
+    of other stages (possibly written by other processes) as they are.
+    """
+    labels = {key: value for key, value in record["labels"].items() if key not in VOLATILE_LABELS}
+    labels["stage"] = record["stage"]
+    label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+    values = {
+        "wall_seconds": record["wall_seconds"],
+        "cpu_seconds": record["cpu_seconds"],
+        "cpu_utilization": record["cpu_utilization"],
+        "peak_rss_bytes": record["peak_rss_bytes"],
+        "bytes": record["bytes"],
+        "files": record["files"],
+        "success": 1 if record["status"] == "ok" else 0,
+        "last_run_timestamp_seconds": round(record["started_at"], 3),
+    }
+
+    series = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith("#"):
+                    key, value = line.rsplit(" ", 1)
+                    series[key] = value
+    for metric, value in values.items():
+        series[f"{PROMETHEUS_PREFIX}_{metric}{{{label_text}}}"] = value
+
+    lines = []
+    for metric in values:
+        name = f"{PROMETHEUS_PREFIX}_{metric}"
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{key} {value}" for key, value in sorted(series.items()) if key.split("{")[0] == name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp_path, path)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _stack():
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    return _local.stack
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class _MemorySampler:
+    """
+    Track the peak resident memory of this process and its children in a background thread.
+    Without psutil, the peak of the whole process (ru_maxrss) is reported instead.
+    """
+
+    def __init__(self):
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = None
+        if psutil is not None:
+            self._process = psutil.Process()
+            self._sample()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _sample(self):
+        try:
+            rss = self._process.memory_info().rss
+            for child in self._process.children(recursive=True):
+                try:
+                    rss += child.memory_info().rss
+                except psutil.Error:
+                    pass
+        except psutil.Error:
+            return
+        self.peak = max(self.peak, rss)
+
+    def _run(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._sample()
+
+    def stop(self):
+        if self._thread is None:
+            return peak_rss_bytes()
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return self.peak
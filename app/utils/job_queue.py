@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import fcntl
+from contextlib import contextmanager
+
+QUEUE_FILENAME = "queue.json"
+LOCK_FILENAME = "queue.lock"
+JOB_STATUSES = ("queued", "running", "done", "failed", "cancelled")
+# Slot kind used by each pipeline stage: training needs an accelerator or a set of cores, the others are I/O bound.
+STAGE_SLOT_KINDS = {"prepare": "io", "train": "compute", "export": "io"}
+
+
+@contextmanager
+def locked_queue(queue_dir):
+    """
+    Open the persistent job queue of `queue_dir` under an exclusive file lock, so that the
+    scheduler and the CLI commands can update it concurrently. Changes are written back atomically on exit.
+    """
+    os.makedirs(queue_dir, exist_ok=True)
+    path = os.path.join(queue_dir, QUEUE_FILENAME)
+    with open(os.path.join(queue_dir, LOCK_FILENAME), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            queue = {"next_id": 1, "jobs": []}
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    queue = json.load(f)
+            yield queue
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(queue, f, indent=4)
+            os.replace(tmp_path, path)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+def submit_job(queue, config_path, stages):
+    """
+    Append a job running `stages` of a configuration, in order, to the queue. Returns the job.
+    """
+    job = {
+        "id": queue["next_id"],
+        "config": config_path,
+        "stages": list(stages),
+        "stage_index": 0,
+        "status": "queued",
+        "slot": None,
+        "pid": None,
+        "submitted_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "history": [],
+    }
+    queue["next_id"] += 1
+    queue["jobs"].append(job)
+    return job
+
+
+def current_stage(job):
+    return job["stages"][job["stage_index"]]
+
+
+def find_job(queue, job_id):
+    for job in queue["jobs"]:
+        if job["id"] == job_id:
+            return job
+    return None
+
+
+def pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
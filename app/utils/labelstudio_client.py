@@ -0,0 +1,232 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
+
+# (connect, read) timeouts in seconds. Exports of big projects can take minutes before the first byte.
+DEFAULT_TIMEOUT = (10, 300)
+DEFAULT_PAGE_SIZE = 100
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+# Longest Retry-After delay honored, in seconds.
+MAX_RETRY_AFTER = 60
+# Project detail fields that change when tasks or annotations are added, removed or relabeled.
+PROJECT_STATE_FIELDS = (
+    "updated_at",
+    "task_number",
+    "num_tasks_with_annotations",
+    "total_annotations_number",
+    "skipped_annotations_number",
+    "total_predictions_number",
+    "label_config",
+)
+
+
+class LabelStudioHTTPError(Exception):
+    """
+    Error response from the Label Studio API.
+    """
+
+    def __init__(self, message, status_code):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class LabelStudioClient:
+    """
+    Label Studio API client sharing one pooled session between threads.
+    Idempotent requests are retried with exponential backoff on connection errors
+    and on 429/5xx responses (honoring Retry-After), and every request has a timeout.
+    Export requests are not retried here: export_with_retry in prepare retries whole exports.
+    """
+
+    def __init__(self, api_key, base_url=None, pool_size=10, timeout=DEFAULT_TIMEOUT, retries=3, backoff=1.0):
+        self.base_url = (base_url or os.environ.get("LABEL_STUDIO_URL", "http://localhost:8080")).rstrip("/")
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Token {api_key}"
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.session.close()
+
+    def url(self, path):
+        return urljoin(self.base_url + "/", path.lstrip("/"))
+
+    def request(self, method, path, allowed=(), retry=True, **kwargs):
+        """
+        Send a request and raise a LabelStudioHTTPError for error responses, unless their status is in `allowed`.
+        With `retry`, idempotent requests that fail with a transient error (see is_transient_error) are retried.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        attempts = self.retries + 1 if retry and method in IDEMPOTENT_METHODS else 1
+        for attempt in range(attempts):
+            last = attempt == attempts - 1
+            try:
+                response = self.session.request(method, self.url(path), **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+                time.sleep(self.backoff * 2 ** attempt)
+                continue
+            if response.ok or response.status_code in allowed:
+                return response
+            if response.status_code in RETRY_STATUSES and not last:
+                delay = _retry_after(response)
+                response.close()
+                time.sleep(delay if delay is not None else self.backoff * 2 ** attempt)
+                continue
+            text = response.text[:200] if not kwargs.get("stream") else ""
+            response.close()
+            raise LabelStudioHTTPError(f"{method} {path} failed: {response.status_code} {text}", response.status_code)
+
+    def get_json(self, path, **kwargs):
+        return self.request("GET", path, **kwargs).json()
+
+    def paginate(self, path, params=None, page_size=DEFAULT_PAGE_SIZE, retry=True):
+        """
+        Yield every item of a list endpoint, following the `next` links of paginated responses.
+        Endpoints that return a plain list are yielded as is.
+        """
+        params = dict(params or {}, page_size=page_size)
+        while path:
+            data = self.get_json(path, params=params, retry=retry)
+            if not isinstance(data, dict) or "results" not in data:
+                yield from data
+                return
+            yield from data["results"]
+            # `next` is an absolute URL that already carries the query parameters.
+            path, params = data.get("next"), None
+
+    def list_projects(self):
+        return list(self.paginate("/api/projects"))
+
+    def get_project(self, project_id, etag=None, retry=True):
+        """
+        Fetch a project's detail. Returns (detail, etag), or (None, etag) when `etag` is given
+        and the server answers 304 Not Modified.
+        """
+        headers = {"If-None-Match": etag} if etag else {}
+        response = self.request("GET", f"/api/projects/{project_id}", allowed=(304,), retry=retry, headers=headers)
+        if response.status_code == 304:
+            return None, etag
+        return response.json(), response.headers.get("ETag")
+
+    def export(self, project_id, export_format):
+        """
+        Request a synchronous export of a project and return the streaming response.
+        """
+        return self.request("GET", f"/api/projects/{project_id}/export",
+                            params={"exportType": export_format}, retry=False, stream=True)
+
+    def list_exports(self, project_id):
+        return list(self.paginate(f"/api/projects/{project_id}/exports", retry=False))
+
+    def create_export(self, project_id, title=None):
+        """
+        Start a server-side export snapshot of a project and return it.
+        The snapshot is built in the background; poll it with get_export.
+        """
+        payload = {"title": title} if title else {}
+        return self.request("POST", f"/api/projects/{project_id}/exports", json=payload).json()
+
+    def get_export(self, project_id, export_id):
+        return self.get_json(f"/api/projects/{project_id}/exports/{export_id}", retry=False)
+
+    def convert_export(self, project_id, export_id, export_format):
+        """
+        Ask the server to convert a finished snapshot to `export_format`.
+        """
+        return self.request("POST", f"/api/projects/{project_id}/exports/{export_id}/convert",
+                            json={"export_type": export_format}).json()
+
+    def download_export(self, project_id, export_id, export_format):
+        """
+        Download a snapshot in `export_format` and return the streaming response.
+        """
+        return self.request("GET", f"/api/projects/{project_id}/exports/{export_id}/download",
+                            params={"exportType": export_format}, retry=False, stream=True)
+
+
+class AsyncLabelStudioClient:
+    """
+    asyncio variant of LabelStudioClient. Requests run on a thread pool as large as the
+    connection pool of the wrapped client, so many of them can be awaited concurrently.
+    """
+
+    def __init__(self, client, max_workers=None):
+        self.client = client
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or client.pool_size)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.executor.shutdown(wait=True)
+
+    async def _run(self, function, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    async def get_json(self, path, **kwargs):
+        return await self._run(self.client.get_json, path, **kwargs)
+
+    async def list_projects(self):
+        return await self._run(self.client.list_projects)
+
+    async def get_project(self, project_id, etag=None):
+        return await self._run(self.client.get_project, project_id, etag)
+
+    async def get_projects(self, project_ids, etags=None):
+        """
+        Fetch the detail of many projects concurrently. Returns a list of (detail, etag)
+        tuples, or of the raised exception for projects that couldn't be fetched.
+        """
+        etags = etags or {}
+        return await asyncio.gather(
+            *(self.get_project(project_id, etags.get(project_id)) for project_id in project_ids),
+            return_exceptions=True
+        )
+
+
+def project_fingerprint(detail):
+    """
+    Hash the fields of a project detail that change with its tasks and annotations.
+    """
+    state = {field: detail.get(field) for field in PROJECT_STATE_FIELDS}
+    payload = json.dumps(state, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _retry_after(response):
+    try:
+        return min(float(response.headers["Retry-After"]), MAX_RETRY_AFTER)
+    except (KeyError, ValueError):
+        return None
+
+
+def is_transient_error(error):
+    """
+    Whether a failed request is worth retrying: connection errors, timeouts, interrupted downloads
+    and 429/5xx responses. Other errors (e.g. 401, 403 or 404) would fail the same way again.
+    """
+    if isinstance(error, LabelStudioHTTPError):
+        return error.status_code in RETRY_STATUSES
+    return isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError))
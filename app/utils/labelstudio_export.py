@@ -1,40 +1,257 @@
 import os
-import io
 import json
+import time
+import shutil
+import tempfile
 import zipfile
-from urllib.parse import quote
-import requests
+from datetime import datetime
+from .labelstudio_client import LabelStudioClient, is_transient_error
+from .instrumentation import stage, count
 
-def export_annotations(project_id, api_key, export_format="YOLO_OBB_WITH_IMAGES"):
+# Size of each chunk read from the export response.
+CHUNK_SIZE = 1024 * 1024
+# Archives up to this size stay in memory; bigger ones are spooled to disk.
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
+# How often (in seconds) download progress is printed.
+PROGRESS_INTERVAL = 2.0
+# Snapshot exports are polled every POLL_INTERVAL seconds at first, backing off up to MAX_POLL_INTERVAL.
+POLL_INTERVAL = 1.0
+MAX_POLL_INTERVAL = 30.0
+SNAPSHOT_TIMEOUT = 3600
+
+
+def export_annotations(project_id, api_key, export_format="YOLO_OBB_WITH_IMAGES", client=None, extract_dir=None):
     """
     Export annotations from Label Studio using the specified export format.
     If the response is a ZIP archive (as is the case with YOLO_OBB_WITH_IMAGES),
-    it extracts the contents to a directory and returns the directory path.
+    it is streamed to a spooled temporary file and extracted member by member,
+    so memory usage does not grow with the archive size. Returns the directory path
+    (`extract_dir`, export_project_<id> by default).
+    A shared LabelStudioClient can be passed to reuse its pooled connections.
     """
-    base_url = os.environ.get("LABEL_STUDIO_URL", "http://localhost:8080")
-    encoded_format = quote(export_format)
-    url = f"{base_url}/api/projects/{project_id}/export?exportType={encoded_format}"
-    headers = {"Authorization": f"Token {api_key}"}
-    response = requests.get(url, headers=headers)
+    client = client or LabelStudioClient(api_key)
+    with stage("export_annotations", project=project_id, mode="sync"), \
+            client.export(project_id, export_format) as response:
+        return save_export_response(response, project_id, extract_dir)
 
-    print(f"Response status: {response.status_code}")
-    snippet = response.text[:200]
-    print("Response text snippet:", snippet)
 
-    if not response.ok:
-        raise Exception(
-            f"Failed to export annotations for project {project_id}: {response.status_code} {response.text}"
+def export_snapshot(project_id, api_key, export_format="YOLO_OBB_WITH_IMAGES", client=None, reuse=True,
+                    timeout=SNAPSHOT_TIMEOUT, extract_dir=None, max_age=None):
+    """
+    Export annotations through Label Studio's snapshot export API: a snapshot is built by the server
+    in the background, polled with backoff until it is ready, converted to `export_format` and
+    downloaded like export_annotations. With `reuse`, the latest finished snapshot is downloaded
+    again instead when the project hasn't changed since it was made and it is at most `max_age` seconds old.
+    """
+    client = client or LabelStudioClient(api_key)
+    with stage("export_annotations", project=project_id, mode="snapshot"):
+        return _export_snapshot(project_id, export_format, client, reuse, timeout, extract_dir, max_age)
+
+
+def _export_snapshot(project_id, export_format, client, reuse, timeout, extract_dir, max_age=None):
+    snapshot = None
+    if reuse:
+        detail, _ = client.get_project(project_id, retry=False)
+        snapshot = find_reusable_snapshot(client.list_exports(project_id), detail, max_age)
+        if snapshot:
+            print(f"Reusing export snapshot {snapshot['id']} of project {project_id}.")
+    if snapshot is None:
+        snapshot = client.create_export(project_id, title=f"custom-yolo {time.strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"Created export snapshot {snapshot['id']} of project {project_id}.")
+        snapshot = wait_for_snapshot(
+            lambda: client.get_export(project_id, snapshot["id"]),
+            lambda export: export.get("status"),
+            f"snapshot {snapshot['id']} of project {project_id}",
+            timeout
         )
 
+    # JSON is the native snapshot format; other formats are converted on the server first.
+    if export_format != "JSON" and _converted_status(snapshot, export_format) != "completed":
+        converted = client.convert_export(project_id, snapshot["id"], export_format)
+        # Older Label Studio versions convert synchronously and don't report a conversion status.
+        if "converted_formats" in converted or "converted_formats" in snapshot:
+            wait_for_snapshot(
+                lambda: client.get_export(project_id, snapshot["id"]),
+                lambda export: _converted_status(export, export_format),
+                f"{export_format} conversion of snapshot {snapshot['id']}",
+                timeout
+            )
+
+    with client.download_export(project_id, snapshot["id"], export_format) as response:
+        return save_export_response(response, project_id, extract_dir)
+
+
+def find_reusable_snapshot(snapshots, detail, max_age=None):
+    """
+    Return the latest finished snapshot whose task, annotation and prediction counters match the
+    project detail and that was created after the project was last updated, or None.
+    Edits of existing annotations change neither, so snapshots older than `max_age` seconds aren't reused.
+    """
+    finished = [snapshot for snapshot in snapshots if snapshot.get("status") == "completed"]
+    for snapshot in sorted(finished, key=lambda snapshot: snapshot.get("created_at") or "", reverse=True):
+        counters = snapshot.get("counters") or {}
+        if (counters.get("task_number"), counters.get("annotation_number"), counters.get("prediction_number")) != \
+                (detail.get("task_number"), detail.get("total_annotations_number"),
+                 detail.get("total_predictions_number")):
+            continue
+        updated_at = detail.get("updated_at")
+        if updated_at and (snapshot.get("created_at") or "") < updated_at:
+            continue
+        created = _timestamp(snapshot.get("created_at"))
+        if max_age is not None and (created is None or time.time() - created > max_age):
+            continue
+        return snapshot
+    return None
+
+
+def wait_for_snapshot(fetch, status_of, label, timeout=SNAPSHOT_TIMEOUT):
+    """
+    Poll `fetch()` with exponential backoff until `status_of` its result is "completed"
+    and return that result. Raises an Exception if it fails or takes longer than `timeout` seconds.
+    """
+    start = time.monotonic()
+    delay = POLL_INTERVAL
+    while True:
+        try:
+            result = fetch()
+            status = status_of(result)
+        except Exception as e:
+            # A transient error while polling only delays the next poll.
+            if not is_transient_error(e):
+                raise
+            status = f"unreachable: {e}"
+        if status == "completed":
+            return result
+        if status == "failed":
+            raise Exception(f"Label Studio failed to build the {label}")
+        elapsed = time.monotonic() - start
+        if elapsed + delay > timeout:
+            raise Exception(f"Timed out after {elapsed:.0f}s waiting for the {label} (status: {status})")
+        print(f"Waiting for the {label} ({status}, {elapsed:.0f}s)...")
+        time.sleep(delay)
+        delay = min(delay * 2, MAX_POLL_INTERVAL)
+
+
+def save_export_response(response, project_id, extract_dir=None):
+    """
+    Save a streaming export response: ZIP archives are extracted into `extract_dir`
+    (export_project_<id> by default), whose path is returned, and JSON exports are decoded and returned.
+    """
+    print(f"Response status: {response.status_code}")
+    chunks = response.iter_content(chunk_size=CHUNK_SIZE)
+    first_chunk = next((chunk for chunk in chunks if chunk), b"")
+    print("Response snippet:", first_chunk[:200])
+
     # Check if the response is a ZIP file (ZIP files start with "PK")
-    if response.content.startswith(b"PK"):
-        extract_dir = f"export_project_{project_id}"
-        os.makedirs(extract_dir, exist_ok=True)
-        with zipfile.ZipFile(io.BytesIO(response.content)) as z:
-            z.extractall(extract_dir)
+    if first_chunk.startswith(b"PK"):
+        extract_dir = extract_dir or f"export_project_{project_id}"
+        total = int(response.headers.get("Content-Length") or 0)
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+            count(size=download_chunks(first_chunk, chunks, spool, total, label=f"[project {project_id}] "))
+            spool.seek(0)
+            count(files=extract_zip_stream(spool, extract_dir))
         print(f"Exported files extracted to: {extract_dir}")
         return extract_dir
+
+    # Non-ZIP exports (JSON) are small enough to be decoded in memory.
+    body = first_chunk + b"".join(chunks)
     try:
-        return response.json()
+        return json.loads(body)
     except json.decoder.JSONDecodeError as e:
-        raise Exception(f"Error decoding JSON for project {project_id}: {e}\nResponse text: {response.text}")
\ No newline at end of file
+        raise Exception(f"Error decoding JSON for project {project_id}: {e}\nResponse text: {body[:200]!r}")
+
+
+def download_chunks(first_chunk, chunks, destination, total=0, label=""):
+    """
+    Write the first chunk and the remaining chunk iterator to a file object,
+    printing progress and throughput along the way. Returns the number of bytes written.
+    """
+    start = time.monotonic()
+    last_report = start
+    written = 0
+    for chunk in _prepend(first_chunk, chunks):
+        if not chunk:
+            continue
+        destination.write(chunk)
+        written += len(chunk)
+        now = time.monotonic()
+        if now - last_report >= PROGRESS_INTERVAL:
+            _print_progress(written, total, now - start, label)
+            last_report = now
+    _print_progress(written, total, time.monotonic() - start, label)
+    return written
+
+
+def extract_zip_stream(file_obj, extract_dir):
+    """
+    Extract a ZIP archive from a seekable file object one member at a time,
+    copying each member in fixed-size blocks instead of loading it in memory.
+    The archive is extracted into a temporary sibling directory that then replaces `extract_dir`, so files
+    of an earlier export that the archive no longer contains (e.g. deleted tasks) don't linger, and a failed
+    extraction leaves the previous content untouched. Returns the number of extracted files.
+    """
+    parent = os.path.dirname(os.path.abspath(extract_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".extracting_", dir=parent)
+    os.chmod(tmp_dir, 0o755)
+    try:
+        extracted = _extract_members(file_obj, tmp_dir, extract_dir)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    previous = None
+    if os.path.exists(extract_dir):
+        previous = tempfile.mkdtemp(prefix=".previous_", dir=parent)
+        os.replace(extract_dir, os.path.join(previous, "export"))
+    os.replace(tmp_dir, extract_dir)
+    if previous:
+        shutil.rmtree(previous)
+    return extracted
+
+
+def _extract_members(file_obj, root, label):
+    root = os.path.realpath(root)
+    extracted = 0
+    with zipfile.ZipFile(file_obj) as z:
+        for member in z.infolist():
+            target = os.path.realpath(os.path.join(root, member.filename))
+            if os.path.commonpath([root, target]) != root:
+                raise Exception(f"Refusing to extract {member.filename} outside of {label}")
+            if member.is_dir():
+                os.makedirs(target, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with z.open(member) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            extracted += 1
+    return extracted
+
+
+def _converted_status(snapshot, export_format):
+    for converted in snapshot.get("converted_formats") or []:
+        if converted.get("export_type") == export_format:
+            return converted.get("status")
+    return None
+
+
+def _timestamp(value):
+    # Label Studio returns ISO 8601 timestamps, in UTC with a "Z" suffix.
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def _print_progress(written, total, elapsed, label=""):
+    mb = written / (1024 * 1024)
+    rate = mb / elapsed if elapsed > 0 else 0.0
+    if total:
+        print(f"{label}Downloaded {mb:.1f} MB of {total / (1024 * 1024):.1f} MB "
+              f"({100 * written / total:.0f}%) at {rate:.1f} MB/s")
+    else:
+        print(f"{label}Downloaded {mb:.1f} MB at {rate:.1f} MB/s")
@@ -0,0 +1,66 @@
+import os
+import json
+import hashlib
+
+MANIFEST_FILENAME = "manifest.json"
+MANIFEST_VERSION = 1
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(path):
+    """
+    Return the BLAKE2b content hash of a file, read in fixed-size blocks.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(output_dataset_dir):
+    return os.path.join(output_dataset_dir, MANIFEST_FILENAME)
+
+
+def load_manifest(output_dataset_dir):
+    """
+    Load the dataset manifest of `output_dataset_dir`, or return an empty one.
+    The manifest maps each image filename to its image/label hashes, source project and split.
+    """
+    path = manifest_path(output_dataset_dir)
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            manifest = json.load(f)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+        print(f"Ignoring manifest {path} with unsupported version {manifest.get('version')}.")
+    return {"version": MANIFEST_VERSION, "files": {}}
+
+
+def save_manifest(manifest, output_dataset_dir):
+    """
+    Atomically write the dataset manifest into `output_dataset_dir`.
+    """
+    path = manifest_path(output_dataset_dir)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def project_states(output_dataset_dir):
+    """
+    Return the Label Studio project states recorded by the last sync, as a dict
+    project id -> {"fingerprint", "etag"}. Projects whose state is unchanged don't need to be exported again.
+    """
+    return load_manifest(output_dataset_dir).get("projects", {})
+
+
+def manifest_digest(output_dataset_dir):
+    """
+    Return a hash identifying the dataset content recorded in the manifest, or None without a manifest.
+    """
+    if not os.path.exists(manifest_path(output_dataset_dir)):
+        return None
+    files = load_manifest(output_dataset_dir)["files"]
+    return hashlib.sha256(json.dumps(files, sort_keys=True).encode("utf-8")).hexdigest()
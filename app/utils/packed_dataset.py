@@ -0,0 +1,454 @@
+import io
+import os
+import json
+import mmap
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+from .manifest import load_manifest, save_manifest, hash_file
+from .dataset_preparation import (
+    assign_splits,
+    parse_label_files,
+    check_label_rows,
+    default_io_workers,
+    generate_data_yaml,
+    _duplicate_rows
+)
+from .splitting import group_splits
+from .instrumentation import count
+
+DATASET_FORMATS = ("files", "packed")
+PACKED_DIRNAME = "packed"
+# Files-format copy of a packed split, for ultralytics validation and int8 calibration.
+UNPACKED_DIRNAME = "unpacked"
+PACK_FILENAME = "pack.json"
+INDEX_FILENAME = "index.npy"
+LABELS_FILENAME = "labels.npy"
+SHARDS_DIRNAME = "shards"
+PACK_VERSION = 1
+# Shards are closed once they reach this size, so that a dataset is staged as a few large sequential copies.
+DEFAULT_SHARD_SIZE = 1024 ** 3
+# Rewrite the live images into new shards once more than this share of the shard bytes is unreferenced.
+COMPACT_GARBAGE_RATIO = 0.5
+# Images read ahead by the I/O threads while a shard is written.
+READ_CHUNK = 256
+SPLIT_CODES = {"train": 0, "val": 1}
+INDEX_DTYPE = np.dtype([
+    ("shard", "<u4"),
+    ("offset", "<u8"),
+    ("length", "<u8"),
+    ("label_start", "<u8"),
+    ("label_count", "<u4"),
+    ("split", "u1"),
+    ("width", "<u4"),
+    ("height", "<u4"),
+])
+EXIF_ORIENTATION = 0x0112
+
+
+def packed_dir(output_dataset_dir):
+    return os.path.join(output_dataset_dir, PACKED_DIRNAME)
+
+
+def unpacked_dir(output_dataset_dir):
+    return os.path.join(output_dataset_dir, UNPACKED_DIRNAME)
+
+
+def shard_filename(shard_id):
+    return f"shard_{shard_id:05d}.bin"
+
+
+class PackedDataset:
+    """
+    Random access to a packed dataset: the encoded images are stored back to back in a few large shard files,
+    index.npy holds the location, split and size of every image, and labels.npy the YOLO label rows of all
+    images, referenced by index.npy. Both arrays and the shards are memory-mapped, so opening a pack
+    of millions of images is cheap. Image names are listed in pack.json in index order.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, PACK_FILENAME), "r") as f:
+            self.meta = json.load(f)
+        self.names = self.meta["names"]
+        self.columns = self.meta["columns"]
+        self.index = _load_array(os.path.join(path, INDEX_FILENAME))
+        self.labels = _load_array(os.path.join(path, LABELS_FILENAME))
+        self._shards = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, i):
+        row = self.index[i]
+        split = next(name for name, code in SPLIT_CODES.items() if code == row["split"])
+        return {
+            "name": self.names[i],
+            "split": split,
+            "image": self.image_bytes(i),
+            "labels": self.image_labels(i),
+            "size": (int(row["width"]), int(row["height"])),
+        }
+
+    def split_indices(self, split):
+        return np.flatnonzero(self.index["split"] == SPLIT_CODES[split])
+
+    def image_bytes(self, i):
+        row = self.index[i]
+        offset = int(row["offset"])
+        return self._shard(int(row["shard"]))[offset:offset + int(row["length"])]
+
+    def image_labels(self, i):
+        row = self.index[i]
+        start = int(row["label_start"])
+        return self.labels[start:start + int(row["label_count"])]
+
+    def _shard(self, shard_id):
+        shard = self._shards.get(shard_id)
+        if shard is None:
+            with open(os.path.join(self.path, SHARDS_DIRNAME, shard_filename(shard_id)), "rb") as f:
+                shard = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._shards[shard_id] = shard
+        return shard
+
+    def close(self):
+        for shard in self._shards.values():
+            shard.close()
+        self._shards = {}
+
+    def __getstate__(self):
+        # Dataloader workers map the shards again on their side.
+        state = dict(self.__dict__)
+        state["_shards"] = {}
+        return state
+
+
+def _load_array(path):
+    array = np.load(path, mmap_mode="r")
+    return array if array.size else np.load(path)
+
+
+class _ShardWriter:
+    """
+    Append images to new shard files, starting a new shard every `shard_size` bytes.
+    """
+
+    def __init__(self, shards_dir, first_id, shard_size):
+        self.shards_dir = shards_dir
+        self.shard_id = first_id - 1
+        self.shard_size = shard_size
+        self.sizes = {}
+        self._file = None
+
+    def write(self, data):
+        if self._file is None or (self.sizes[self.shard_id] and self.sizes[self.shard_id] + len(data) > self.shard_size):
+            self.close()
+            self.shard_id += 1
+            self.sizes[self.shard_id] = 0
+            self._file = open(os.path.join(self.shards_dir, shard_filename(self.shard_id)), "wb")
+        offset = self.sizes[self.shard_id]
+        self._file.write(data)
+        self.sizes[self.shard_id] += len(data)
+        return self.shard_id, offset
+
+    def close(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+
+def image_size(data):
+    """
+    Width and height of an encoded image as it is displayed, i.e. after its EXIF orientation. Only the header is parsed.
+    """
+    with Image.open(io.BytesIO(data)) as im:
+        width, height = im.size
+        if im.getexif().get(EXIF_ORIENTATION, 1) in (5, 6, 7, 8):
+            return height, width
+    return width, height
+
+
+def _read_image(source):
+    with open(source, "rb") as f:
+        data = f.read()
+    return data, image_size(data)
+
+
+def sync_packed_dataset(index, output_dataset_dir, train_ratio=0.8, keep_projects=(), split_options=None,
+                        workers=None, project_states=None, shard_size=DEFAULT_SHARD_SIZE, label_validation="report",
+                        groups=None, image_hashes=None):
+    """
+    Packed counterpart of sync_dataset: bring <output_dataset_dir>/packed in line with an image index
+    (see index_extracted_export), reading the images straight from the extracted exports.
+    Shards are never modified: new or changed images are appended to new shards, unchanged images keep their
+    location, and the shards are compacted once most of their bytes belong to removed images. Splits, content
+    hashes and project states are recorded in the dataset manifest as for the files layout, and `groups`
+    are kept in a single split (see sync_dataset).
+    Label rows are checked on the way in; with label_validation "fix", bad rows are clipped or dropped.
+    Returns a summary dict of the changes.
+    """
+    pack_dir = packed_dir(output_dataset_dir)
+    shards_dir = os.path.join(pack_dir, SHARDS_DIRNAME)
+    os.makedirs(shards_dir, exist_ok=True)
+    manifest = load_manifest(output_dataset_dir)
+    previous = manifest["files"]
+    keep_projects = {str(project_id) for project_id in keep_projects}
+    old_pack = PackedDataset(pack_dir) if os.path.exists(os.path.join(pack_dir, PACK_FILENAME)) else None
+    old_rows = {name: i for i, name in enumerate(old_pack.names)} if old_pack else {}
+
+    def hash_item(name):
+        item = index[name]
+        image_hash = (image_hashes or {}).get(name) or hash_file(item["image"])
+        return image_hash, hash_file(item["label"]) if item["label"] else None
+
+    with ThreadPoolExecutor(max_workers=workers or default_io_workers()) as executor:
+        hashes = dict(zip(index, executor.map(hash_item, index)))
+
+    files = {}
+    added, updated, unchanged = [], [], []
+    for name, item in index.items():
+        entry = {"image_hash": hashes[name][0], "label_hash": hashes[name][1], "project": item["project"],
+                 "split": None}
+        old = previous.get(name)
+        if old is None:
+            added.append(name)
+        else:
+            entry["split"] = old["split"]
+            if (entry["image_hash"], entry["label_hash"]) != (old["image_hash"], old["label_hash"]) \
+                    or name not in old_rows:
+                updated.append(name)
+            else:
+                unchanged.append(name)
+        files[name] = entry
+
+    # Items of failed or unchanged projects are copied over from the previous pack.
+    kept, removed = [], []
+    for name, old in previous.items():
+        if name in files:
+            continue
+        if str(old["project"]) in keep_projects and name in old_rows:
+            files[name] = old
+            kept.append(name)
+        else:
+            removed.append(name)
+    placed = {name: entry["split"] for name, entry in files.items() if entry["split"] is not None}
+    # Kept items have no label file any more, their class ids come from the previous pack.
+    placed_labels = {
+        name: index[name]["label"] if name in index else
+        np.asarray(old_pack.image_labels(old_rows[name])[:, 0]) if name in old_rows else None
+        for name in placed
+    } if (split_options or {}).get("stratify") else None
+    for name, split in assign_splits(index, added, train_ratio, split_options, placed, placed_labels).items():
+        files[name]["split"] = split
+    # Moving an image between splits only changes its index record.
+    moves = group_splits({name: entry["split"] for name, entry in files.items()}, groups or [],
+                         established=set(files) - set(added))
+    for name, split in moves.items():
+        files[name] = dict(files[name], split=split)
+    moved = [name for name in moves if name not in added]
+
+    names = sorted(files)
+    labels, columns, issues = _pack_labels(index, names, old_pack, old_rows, split_options, label_validation)
+
+    # Unchanged images stay where they are, unless the shards are mostly garbage.
+    reuse = {
+        name for name in names
+        if name in old_rows and (name in kept or old_pack.meta["image_hashes"][old_rows[name]] == files[name]["image_hash"])
+    }
+    old_bytes = sum(old_pack.meta["shards"].values()) if old_pack else 0
+    live_bytes = sum(int(old_pack.index[old_rows[name]]["length"]) for name in reuse)
+    compact = old_bytes > 0 and (old_bytes - live_bytes) / old_bytes > COMPACT_GARBAGE_RATIO
+    if compact:
+        print(f"Compacting the packed dataset: {(old_bytes - live_bytes) / (1024 * 1024):.1f} MB of "
+              f"{old_bytes / (1024 * 1024):.1f} MB belong to removed images.")
+
+    records = np.zeros(len(names), dtype=INDEX_DTYPE)
+    shard_sizes = {} if compact or not old_pack else {int(key): size for key, size in old_pack.meta["shards"].items()}
+    next_shard = max([int(key) for key in old_pack.meta["shards"]] + [-1]) + 1 if old_pack else 0
+    writer = _ShardWriter(shards_dir, next_shard, shard_size)
+    to_write = []
+    for position, name in enumerate(names):
+        if name in reuse and not compact:
+            for field in ("shard", "offset", "length", "width", "height"):
+                records[field][position] = old_pack.index[field][old_rows[name]]
+        else:
+            to_write.append((position, name))
+
+    def read(job):
+        position, name = job
+        if name in reuse:
+            old_record = old_pack.index[old_rows[name]]
+            return old_pack.image_bytes(old_rows[name]), (int(old_record["width"]), int(old_record["height"]))
+        return _read_image(index[name]["image"])
+
+    written = 0
+    with ThreadPoolExecutor(max_workers=workers or default_io_workers()) as executor:
+        for start in range(0, len(to_write), READ_CHUNK):
+            chunk = to_write[start:start + READ_CHUNK]
+            for (position, name), (data, (width, height)) in zip(chunk, executor.map(read, chunk)):
+                shard_id, offset = writer.write(data)
+                records["shard"][position], records["offset"][position] = shard_id, offset
+                records["length"][position] = len(data)
+                records["width"][position], records["height"][position] = width, height
+                written += len(data)
+    writer.close()
+    shard_sizes.update(writer.sizes)
+
+    records["split"] = [SPLIT_CODES[files[name]["split"]] for name in names]
+    records["label_count"] = [len(labels[name]) for name in names]
+    records["label_start"] = np.cumsum(records["label_count"]) - records["label_count"]
+    label_array = np.concatenate([labels[name] for name in names]) if names else np.zeros((0, columns), np.float32)
+
+    referenced = {int(shard_id) for shard_id in np.unique(records["shard"])} if len(records) else set()
+    meta = {
+        "version": PACK_VERSION,
+        "columns": columns,
+        "names": names,
+        "image_hashes": [files[name]["image_hash"] for name in names],
+        "shards": {str(shard_id): size for shard_id, size in sorted(shard_sizes.items()) if shard_id in referenced},
+        "label_issues": issues,
+    }
+    _save_array(os.path.join(pack_dir, INDEX_FILENAME), records)
+    _save_array(os.path.join(pack_dir, LABELS_FILENAME), label_array.astype(np.float32))
+    tmp_path = os.path.join(pack_dir, PACK_FILENAME + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(pack_dir, PACK_FILENAME))
+
+    if old_pack:
+        old_pack.close()
+    for filename in os.listdir(shards_dir):
+        shard_id = int(filename[len("shard_"):-len(".bin")]) if filename.startswith("shard_") else None
+        if shard_id is not None and str(shard_id) not in meta["shards"]:
+            os.unlink(os.path.join(shards_dir, filename))
+    count(size=written, files=len(to_write))
+
+    manifest["files"] = files
+    if project_states is not None:
+        manifest["projects"] = project_states
+    save_manifest(manifest, output_dataset_dir)
+
+    summary = {
+        "added": len(added),
+        "updated": len(updated),
+        "removed": len(removed),
+        "unchanged": len(unchanged),
+        "moved": len(moved),
+        "train": sum(1 for entry in files.values() if entry["split"] == "train"),
+        "val": sum(1 for entry in files.values() if entry["split"] == "val"),
+        "written_bytes": written,
+        "shards": len(meta["shards"]),
+    }
+    print(f"Packed dataset synced: {summary['added']} added, {summary['updated']} updated, "
+          f"{summary['removed']} removed, {summary['unchanged']} unchanged "
+          f"({summary['train']} training items, {summary['val']} validation items), "
+          f"{written / (1024 * 1024):.1f} MB written, {summary['shards']} shards in {pack_dir}.")
+    if moved:
+        print(f"{len(moved)} items moved to the split of their duplicate group.")
+    return summary
+
+
+def _pack_labels(index, names, old_pack, old_rows, split_options, label_validation):
+    """
+    Collect the label rows of every image: parsed from the export for indexed images, copied from the
+    previous pack for kept ones. Returns ({name: float32 array}, number of columns, issue counts).
+    """
+    labeled = [name for name in names if name in index and index[name]["label"]]
+    parsed = parse_label_files([index[name]["label"] for name in labeled])
+    issues = {"malformed": 0, "non_numeric": 0}
+    for _, issue in parsed["invalid"]:
+        issues[issue] += 1
+
+    kinds = [kind for kind in ("box", "obb") if len(parsed[kind]["values"])]
+    if len(kinds) > 1:
+        raise Exception("The exports mix bounding box and oriented bounding box labels, which can't be packed together.")
+    kind = kinds[0] if kinds else ("obb" if old_pack and old_pack.columns == 9 else "box")
+    values, owners = parsed[kind]["values"], parsed[kind]["owners"]
+    columns = values.shape[1]
+    kept = [name for name in names if name not in index]
+    if kept and old_pack.columns != columns:
+        raise Exception("The label format of the exports differs from the packed dataset, delete it to pack again.")
+
+    class_names = (split_options or {}).get("names")
+    if label_validation != "off" and class_names and len(values):
+        checks = check_label_rows(values, len(class_names), kind == "obb")
+        checks["duplicate"] = _duplicate_rows(values, owners)
+        for issue, mask in checks.items():
+            issues[issue] = int(mask.sum())
+        if label_validation == "fix":
+            values = values.copy()
+            values[:, 1:] = np.clip(np.nan_to_num(values[:, 1:], nan=0.0), 0.0, 1.0)
+            fixed_checks = check_label_rows(values, len(class_names), kind == "obb")
+            bad = fixed_checks["bad_class"] | fixed_checks["degenerate"] | _duplicate_rows(values, owners)
+            values, owners = values[~bad], owners[~bad]
+    total = sum(issues.values())
+    if total:
+        print(f"Label validation: {total} issues in the packed labels"
+              + (" (fixed)." if label_validation == "fix" else ".")
+              + "".join(f"\n  - {issue}: {value}" for issue, value in issues.items() if value))
+
+    order = np.argsort(owners, kind="stable")
+    values, owners = values[order].astype(np.float32), owners[order]
+    bounds = np.searchsorted(owners, np.arange(len(labeled) + 1))
+    labels = {name: values[bounds[i]:bounds[i + 1]] for i, name in enumerate(labeled)}
+    empty = np.zeros((0, columns), dtype=np.float32)
+    for name in names:
+        if name in index:
+            labels.setdefault(name, empty)
+        else:
+            labels[name] = np.asarray(old_pack.image_labels(old_rows[name]), dtype=np.float32)
+    return labels, columns, issues
+
+
+def _save_array(path, array):
+    tmp_path = path + ".tmp.npy"
+    np.save(tmp_path, array)
+    os.replace(tmp_path, path)
+
+
+def extract_images(pack, indices, output_dir, labels_dir=None):
+    """
+    Write the images at `indices` of a pack to `output_dir`, for tools that need image files
+    (e.g. latency benchmarks). With `labels_dir`, their YOLO label files are written there too.
+    Returns the image paths.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    if labels_dir:
+        os.makedirs(labels_dir, exist_ok=True)
+    paths = []
+    for i in indices:
+        path = os.path.join(output_dir, pack.names[i])
+        with open(path, "wb") as f:
+            f.write(pack.image_bytes(i))
+        paths.append(path)
+        if labels_dir:
+            label_path = os.path.join(labels_dir, os.path.splitext(pack.names[i])[0] + ".txt")
+            with open(label_path, "w") as f:
+                f.writelines(f"{int(row[0])} " + " ".join(f"{value:.6f}" for value in row[1:]) + "\n"
+                             for row in pack.image_labels(i))
+    return paths
+
+
+def unpack_split(output_dataset_dir, names, split="val"):
+    """
+    Write a split of the packed dataset as image and label files under <output_dataset_dir>/unpacked/<split>
+    and return a data.yaml pointing at them. Ultralytics validation and int8 export calibration only read
+    files-format datasets; the copy is written again on every call, so it follows the pack.
+    """
+    root = unpacked_dir(output_dataset_dir)
+    split_dir = os.path.join(root, split)
+    if os.path.exists(split_dir):
+        shutil.rmtree(split_dir)
+    pack = PackedDataset(packed_dir(output_dataset_dir))
+    try:
+        indices = pack.split_indices(split)
+        extract_images(pack, indices, os.path.join(split_dir, "images"), os.path.join(split_dir, "labels"))
+    finally:
+        pack.close()
+    print(f"Unpacked {len(indices)} {split} images to {split_dir}")
+    data_yaml_path = os.path.join(root, "data.yaml")
+    generate_data_yaml(output_dataset_dir, data_yaml_path, nc=len(names), names=names, dataset_root=root)
+    return data_yaml_path
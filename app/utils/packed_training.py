@@ -0,0 +1,162 @@
+import os
+import math
+import cv2
+import numpy as np
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.models.yolo.obb import OBBTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.ops import segments2boxes
+from .packed_dataset import PackedDataset
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+class PackedYOLODataset(YOLODataset):
+    """
+    YOLODataset reading one split of a packed dataset (see utils.packed_dataset) instead of image and label files.
+    `img_path` is the packed dataset directory. Images are decoded from the memory-mapped shards.
+    """
+
+    def __init__(self, *args, split="train", **kwargs):
+        self.pack = PackedDataset(kwargs["img_path"])
+        self.split = split
+        self.rows = self.pack.split_indices(split)
+        if kwargs.get("cache") == "disk":
+            # The .npy disk cache needs one file per image, which is what packing avoids.
+            print("The disk image cache is not available for packed datasets, images are decoded from the shards.")
+            kwargs["cache"] = None
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        # Virtual paths, only used to name the images in logs and plots.
+        files = [os.path.join(img_path, self.split, self.pack.names[i]) for i in self.rows]
+        if self.fraction < 1:
+            files = files[:round(len(files) * self.fraction)]
+        return files
+
+    def get_labels(self):
+        labels = []
+        for im_file, i in zip(self.im_files, self.rows):
+            rows = np.asarray(self.pack.image_labels(i), dtype=np.float32)
+            record = self.pack.index[i]
+            if self.pack.columns == 9:
+                # Oriented boxes are polygons of 4 points, as ultralytics reads them from label files.
+                segments = [row.reshape(-1, 2) for row in rows[:, 1:]]
+                bboxes = segments2boxes(segments) if segments else np.zeros((0, 4), dtype=np.float32)
+            else:
+                segments, bboxes = [], rows[:, 1:5]
+            labels.append({
+                "im_file": im_file,
+                "shape": (int(record["height"]), int(record["width"])),
+                "cls": rows[:, 0:1],
+                "bboxes": bboxes,
+                "segments": segments,
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        if not labels:
+            raise Exception(f"No {self.split} images in the packed dataset {self.img_path}")
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        """
+        Same as BaseDataset.load_image, decoding the image from its shard.
+        """
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+        data = np.frombuffer(self.pack.image_bytes(self.rows[i]), dtype=np.uint8)
+        im = cv2.imdecode(data, getattr(self, "cv2_flag", cv2.IMREAD_COLOR))
+        if im is None:
+            raise Exception(f"Image {self.im_files[i]} could not be decoded")
+        h0, w0 = im.shape[:2]
+        if rect_mode:
+            ratio = self.imgsz / max(h0, w0)
+            if ratio != 1:
+                w, h = (min(math.ceil(w0 * ratio), self.imgsz), min(math.ceil(h0 * ratio), self.imgsz))
+                im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+        elif not (h0 == w0 == self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        if im.ndim == 2:
+            im = im[..., None]
+
+        if self.augment:
+            # Keep the recent images for mosaic, as BaseDataset does.
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                if self.cache != "ram":
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, (h0, w0), im.shape[:2]
+
+    def check_cache_ram(self, safety_margin=0.5):
+        """
+        Estimate the memory of the RAM image cache from the image sizes stored in the index,
+        without decoding sample images.
+        """
+        if psutil is None:
+            return True
+        records = self.pack.index[self.rows[:self.ni]]
+        width, height = records["width"].astype(np.float64), records["height"].astype(np.float64)
+        ratio = np.minimum(self.imgsz / np.maximum(width, height), 1.0)
+        needed = float((width * ratio * height * ratio * 3).sum()) * (1 + safety_margin)
+        available = psutil.virtual_memory().available
+        if needed > available:
+            print(f"{self.prefix}{needed / 1024 ** 3:.1f} GB of RAM needed to cache the images, "
+                  f"{available / 1024 ** 3:.1f} GB available, not caching.")
+            return False
+        return True
+
+
+class PackedTrainerMixin:
+    """
+    Build the train and val datasets from a packed dataset. The data.yaml points both splits at the
+    packed dataset directory, the split is taken from the dataloader mode.
+    """
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        model = getattr(self.model, "module", self.model)
+        stride = max(int(model.stride.max() if model else 0), 32)
+        return PackedYOLODataset(
+            img_path=img_path,
+            split="train" if mode == "train" else "val",
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=self.args,
+            rect=self.args.rect or mode == "val",
+            cache=self.args.cache or None,
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=self.args.task,
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction if mode == "train" else 1.0,
+        )
+
+
+class PackedDetectionTrainer(PackedTrainerMixin, DetectionTrainer):
+    pass
+
+
+class PackedOBBTrainer(PackedTrainerMixin, OBBTrainer):
+    pass
+
+
+PACKED_TRAINERS = {"detect": PackedDetectionTrainer, "obb": PackedOBBTrainer}
+
+
+def packed_trainer(task):
+    """
+    Trainer class reading a packed dataset for a model task.
+    """
+    if task not in PACKED_TRAINERS:
+        raise Exception(f"Packed datasets support the {', '.join(PACKED_TRAINERS)} tasks, not {task}")
+    return PACKED_TRAINERS[task]
@@ -0,0 +1,230 @@
+import io
+import math
+import time
+import queue
+import hashlib
+import threading
+import xml.etree.ElementTree as ElementTree
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+import numpy as np
+from PIL import Image, ImageOps
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.items = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            if key in self.items:
+                self.items.move_to_end(key)
+                self.hits += 1
+                return self.items[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+
+class MicroBatcher:
+    """
+    Collect items submitted from many threads into batches of at most `max_batch_size`,
+    waiting at most `max_wait_ms` after the first item of a batch, and run `predict_batch`
+    on a single worker thread. `submit` returns a Future resolved with the item's result.
+    """
+
+    def __init__(self, predict_batch, max_batch_size=8, max_wait_ms=10):
+        self.predict_batch = predict_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue()
+        self.batches = 0
+        self.batched_items = 0
+        self.latencies = deque(maxlen=1000)
+        self.lock = threading.Lock()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, item):
+        future = Future()
+        self.queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.perf_counter() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                results = self.predict_batch([item for item, _, _ in batch])
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            now = time.perf_counter()
+            with self.lock:
+                self.batches += 1
+                self.batched_items += len(batch)
+                self.latencies.extend((now - submitted) * 1000 for _, _, submitted in batch)
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+
+    def metrics(self):
+        with self.lock:
+            latencies = np.asarray(self.latencies) if self.latencies else None
+            return {
+                "queue_depth": self.queue.qsize(),
+                "batches": self.batches,
+                "mean_batch_size": self.batched_items / self.batches if self.batches else 0.0,
+                "latency_ms": {
+                    "p50": float(np.percentile(latencies, 50)),
+                    "p95": float(np.percentile(latencies, 95)),
+                    "p99": float(np.percentile(latencies, 99)),
+                } if latencies is not None else None,
+            }
+
+
+class YOLOPredictor:
+    """
+    Run a trained model (best.pt or an exported ONNX file) on batches of PIL images.
+    Each prediction is a list of detections {"class_id", "score", "obb": (cx, cy, w, h, radians)}
+    or {"class_id", "score", "box": (x1, y1, x2, y2)} in pixels of the original image.
+    """
+
+    def __init__(self, model_path, imgsz=640, conf=0.25):
+        from ultralytics import YOLO
+        self.model = YOLO(model_path)
+        self.imgsz = imgsz
+        self.conf = conf
+        self.version = model_path
+        # Exported ONNX models have a fixed batch size of 1 unless exported with dynamic=True.
+        self.batchable = not model_path.endswith(".onnx") or _onnx_dynamic_batch(model_path)
+
+    def predict(self, images):
+        if self.batchable:
+            results = self.model.predict(images, imgsz=self.imgsz, conf=self.conf, verbose=False)
+        else:
+            results = [self.model.predict(image, imgsz=self.imgsz, conf=self.conf, verbose=False)[0]
+                       for image in images]
+        return [_detections(result) for result in results]
+
+
+class StubPredictor:
+    """
+    Stand-in predictor returning one fixed oriented box per image, to exercise the server without a model.
+    """
+    version = "stub"
+
+    def predict(self, images):
+        return [
+            [{"class_id": 0, "score": 0.5, "obb": (image.width / 2, image.height / 2,
+                                                   image.width / 4, image.height / 4, math.pi / 12)}]
+            for image in images
+        ]
+
+
+def _onnx_dynamic_batch(model_path):
+    import onnxruntime
+    session = onnxruntime.InferenceSession(model_path, providers=["CPUExecutionProvider"])
+    return not isinstance(session.get_inputs()[0].shape[0], int)
+
+
+def _detections(result):
+    detections = []
+    if getattr(result, "obb", None) is not None:
+        for xywhr, cls, score in zip(result.obb.xywhr.tolist(), result.obb.cls.tolist(), result.obb.conf.tolist()):
+            detections.append({"class_id": int(cls), "score": float(score), "obb": tuple(xywhr)})
+    elif getattr(result, "boxes", None) is not None:
+        for xyxy, cls, score in zip(result.boxes.xyxy.tolist(), result.boxes.cls.tolist(), result.boxes.conf.tolist()):
+            detections.append({"class_id": int(cls), "score": float(score), "box": tuple(xyxy)})
+    return detections
+
+
+def image_hash(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def decode_image(data):
+    """
+    Decode an image, rotated by its EXIF orientation as Label Studio displays it,
+    so that the predicted boxes match what the annotators see.
+    """
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(data)))
+    return image.convert("RGB")
+
+
+def parse_label_config(label_config):
+    """
+    Find the RectangleLabels control of a Label Studio labeling config.
+    Returns (from_name, to_name, labels) or None when there is none.
+    """
+    if not label_config:
+        return None
+    root = ElementTree.fromstring(label_config)
+    for element in root.iter():
+        if element.tag == "RectangleLabels":
+            labels = [label.get("value") for label in element.iter("Label")]
+            return element.get("name"), element.get("toName"), labels
+    return None
+
+
+def to_labelstudio_results(detections, width, height, names, from_name="label", to_name="image"):
+    """
+    Convert detections in pixels to Label Studio rectanglelabels results (percentages, rotation in degrees
+    clockwise around the top-left corner). Returns (results, mean score).
+    """
+    results = []
+    for detection in detections:
+        if detection["class_id"] >= len(names):
+            continue
+        if "obb" in detection:
+            cx, cy, w, h, angle = detection["obb"]
+            # The top-left corner of the unrotated box, rotated around the center.
+            x = cx - w / 2 * math.cos(angle) + h / 2 * math.sin(angle)
+            y = cy - w / 2 * math.sin(angle) - h / 2 * math.cos(angle)
+            rotation = math.degrees(angle) % 360
+        else:
+            x1, y1, x2, y2 = detection["box"]
+            x, y, w, h, rotation = x1, y1, x2 - x1, y2 - y1, 0.0
+        results.append({
+            "from_name": from_name,
+            "to_name": to_name,
+            "type": "rectanglelabels",
+            "original_width": width,
+            "original_height": height,
+            "image_rotation": 0,
+            "score": detection["score"],
+            "value": {
+                "x": 100 * x / width,
+                "y": 100 * y / height,
+                "width": 100 * w / width,
+                "height": 100 * h / height,
+                "rotation": rotation,
+                "rectanglelabels": [names[detection["class_id"]]],
+            },
+        })
+    score = sum(result["score"] for result in results) / len(results) if results else 0.0
+    return results, score
@@ -0,0 +1,155 @@
+import os
+import random
+import shutil
+import numpy as np
+from .dataset_preparation import place_file, IMAGE_EXTENSIONS
+from .splitting import class_count_matrix, stratum_keys, hash_fraction
+from .benchmarking import letterbox
+from .packed_dataset import PackedDataset, packed_dir, extract_images
+
+CALIBRATION_STRATEGIES = ("random", "hash", "stratified")
+
+
+def select_calibration_images(images_dir, labels_dir, size, strategy="stratified", seed=0, nc=None):
+    """
+    Pick up to `size` image filenames from a prepared split for int8 calibration.
+
+    - "random": seeded random sample.
+    - "hash": the images with the lowest filename hash, stable as the dataset grows.
+    - "stratified": sample every group of images sharing the same rarest class
+      in proportion to its size, so that rare classes are represented.
+    """
+    names = sorted(name for name in os.listdir(images_dir) if name.lower().endswith(IMAGE_EXTENSIONS))
+
+    def label_path(name):
+        path = os.path.join(labels_dir, os.path.splitext(name)[0] + ".txt")
+        return path if os.path.exists(path) else None
+
+    return select_calibration_names(names, label_path, size, strategy, seed, nc)
+
+
+def select_calibration_names(names, label_source, size, strategy="stratified", seed=0, nc=None):
+    """
+    Pick up to `size` of `names` for int8 calibration, see select_calibration_images.
+    `label_source(name)` returns the label path of a name (or None), or the array of its class ids;
+    it is only called by the "stratified" strategy.
+    """
+    if strategy not in CALIBRATION_STRATEGIES:
+        raise ValueError(f"Unknown calibration strategy '{strategy}', expected one of {CALIBRATION_STRATEGIES}")
+    names = sorted(names)
+    if len(names) <= size:
+        return names
+    if strategy == "hash":
+        return sorted(names, key=lambda name: hash_fraction(name, seed))[:size]
+    rng = random.Random(seed)
+    if strategy == "random":
+        return sorted(rng.sample(names, size))
+
+    strata = stratum_keys(class_count_matrix([label_source(name) for name in names], nc))
+    groups = [[names[i] for i in np.flatnonzero(strata == key)] for key in np.unique(strata)]
+    # At least one image per group, so every class gets calibrated (even with more groups than `size`).
+    counts = [max(1, round(size * len(group) / len(names))) for group in groups]
+    # Rounding can overshoot `size`: take the excess from the largest groups, never below one image.
+    while sum(counts) > max(size, len(groups)):
+        largest = max(range(len(counts)), key=lambda i: counts[i])
+        counts[largest] -= 1
+    selected = []
+    for group, count in zip(groups, counts):
+        selected.extend(rng.sample(group, count))
+    return sorted(selected)
+
+
+def build_calibration_set(output_dataset_dir, names, size=200, strategy="stratified", seed=0, packed=False):
+    """
+    Materialize a calibration subset of the prepared train split under <output_dataset_dir>/calibration
+    and write a calibration.yaml pointing ultralytics at it. With `packed`, the subset is sampled from
+    the train split of the packed dataset and its images and labels are written out of the shards.
+    Returns (yaml path, image paths).
+    """
+    calibration_dir = os.path.join(output_dataset_dir, "calibration")
+    if os.path.exists(calibration_dir):
+        shutil.rmtree(calibration_dir)
+    images_dir = os.path.join(calibration_dir, "images")
+    labels_dir = os.path.join(calibration_dir, "labels")
+
+    if packed:
+        pack = PackedDataset(packed_dir(output_dataset_dir))
+        try:
+            rows = {pack.names[i]: i for i in pack.split_indices("train")}
+            selected = select_calibration_names(list(rows), lambda name: pack.image_labels(rows[name])[:, 0],
+                                                size, strategy, seed, nc=len(names))
+            extract_images(pack, [rows[name] for name in selected], images_dir, labels_dir)
+        finally:
+            pack.close()
+    else:
+        train_images = os.path.join(output_dataset_dir, "train", "images")
+        train_labels = os.path.join(output_dataset_dir, "train", "labels")
+        selected = select_calibration_images(train_images, train_labels, size, strategy, seed, nc=len(names))
+        os.makedirs(images_dir)
+        os.makedirs(labels_dir)
+        for name in selected:
+            place_file(os.path.join(train_images, name), os.path.join(images_dir, name), "hardlink")
+            label_filename = os.path.splitext(name)[0] + ".txt"
+            label_path = os.path.join(train_labels, label_filename)
+            if os.path.exists(label_path):
+                place_file(label_path, os.path.join(labels_dir, label_filename), "hardlink")
+
+    # Ultralytics calibrates on the "val" entry of the data file.
+    yaml_path = os.path.join(output_dataset_dir, "calibration.yaml")
+    images_path = os.path.abspath(images_dir)
+    names_yaml = "\n".join(["  - " + name for name in names])
+    with open(yaml_path, "w") as f:
+        f.write(f'train: "{images_path}"\nval: "{images_path}"\n\nnc: {len(names)}\nnames:\n{names_yaml}\n')
+    print(f"Calibration set: {len(selected)} images ({strategy}) in {calibration_dir}")
+    return yaml_path, [os.path.join(images_dir, name) for name in selected]
+
+
+class ImageCalibrationReader:
+    """
+    onnxruntime calibration data reader feeding letterboxed calibration images one at a time.
+    """
+
+    def __init__(self, input_name, image_paths, imgsz):
+        self.input_name = input_name
+        self.image_paths = list(image_paths)
+        self.imgsz = imgsz
+        self.position = 0
+
+    def get_next(self):
+        if self.position >= len(self.image_paths):
+            return None
+        image = letterbox(self.image_paths[self.position], self.imgsz)[np.newaxis]
+        self.position += 1
+        return {self.input_name: image}
+
+    def rewind(self):
+        self.position = 0
+
+
+def quantize_onnx(fp32_path, int8_path, image_paths, imgsz):
+    """
+    Statically quantize an ONNX model to int8 (QDQ, per-channel weights) with onnxruntime,
+    calibrating on `image_paths`. The ultralytics metadata of the fp32 model is kept.
+    """
+    import onnx
+    from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+    import onnxruntime
+
+    session = onnxruntime.InferenceSession(fp32_path, providers=["CPUExecutionProvider"])
+    reader = ImageCalibrationReader(session.get_inputs()[0].name, image_paths, imgsz)
+    quantize_static(
+        fp32_path,
+        int8_path,
+        reader,
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+    )
+
+    fp32_model = onnx.load(fp32_path)
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    return int8_path
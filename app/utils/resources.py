@@ -0,0 +1,132 @@
+import os
+import json
+import shutil
+from .packed_dataset import packed_dir, PACK_FILENAME
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Rough host memory needed per training image at imgsz 640 (augmented sample, gradients and activations).
+CPU_BYTES_PER_SAMPLE_640 = 48 * 1024 ** 2
+# Share of the available RAM the training batch may use on CPU / MPS.
+BATCH_MEMORY_SHARE = 0.25
+MAX_CPU_BATCH = 64
+MAX_WORKERS = 16
+TRAINING_OVERRIDES = ("batch", "workers", "device", "cache", "amp")
+# Set by the job scheduler to the number of trainings that can run on the host at the same time.
+CONCURRENT_RUNS_ENV = "YOLO_CONCURRENT_RUNS"
+
+
+def probe_host(path="."):
+    """
+    Describe the resources of the current host: usable CPU cores, total and available RAM,
+    free disk space under `path` and the available accelerator.
+    """
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+    host = {
+        "cores": cores,
+        "ram_total": None,
+        "ram_available": None,
+        "disk_free": shutil.disk_usage(path if os.path.exists(path) else ".").free,
+        "accelerator": "cpu",
+        "gpus": [],
+    }
+    if psutil is not None:
+        memory = psutil.virtual_memory()
+        host["ram_total"], host["ram_available"] = memory.total, memory.available
+
+    try:
+        import torch
+    except ImportError:
+        return host
+    if torch.cuda.is_available():
+        host["accelerator"] = "cuda"
+        host["gpus"] = [
+            {"name": torch.cuda.get_device_name(i), "memory": torch.cuda.get_device_properties(i).total_memory}
+            for i in range(torch.cuda.device_count())
+        ]
+    elif getattr(torch.backends, "mps", None) is not None and torch.backends.mps.is_available():
+        host["accelerator"] = "mps"
+    return host
+
+
+def count_dataset_images(output_dataset_dir, packed=False):
+    """
+    Number of images in the train and val splits of a prepared dataset (or of its packed version).
+    """
+    if packed:
+        with open(os.path.join(packed_dir(output_dataset_dir), PACK_FILENAME), "r") as f:
+            return len(json.load(f)["names"])
+    total = 0
+    for split in ("train", "val"):
+        images_dir = os.path.join(output_dataset_dir, split, "images")
+        if os.path.isdir(images_dir):
+            with os.scandir(images_dir) as entries:
+                total += sum(1 for entry in entries if entry.is_file())
+    return total
+
+
+def choose_training_settings(host, num_images, imgsz, training_config=None):
+    """
+    Pick batch size, dataloader workers, device, AMP and the ultralytics image cache mode
+    for the given host, dataset size and image size. Any of TRAINING_OVERRIDES present in
+    the config's training block wins over the automatic choice.
+    Returns (settings, sources) where sources tells whether each value is "auto" or "config".
+    """
+    training_config = training_config or {}
+    accelerator = host["accelerator"]
+    gpus = len(host["gpus"])
+    ram_available = host["ram_available"]
+    per_sample = CPU_BYTES_PER_SAMPLE_640 * (imgsz / 640) ** 2
+
+    if accelerator == "cuda":
+        device = ",".join(str(i) for i in range(gpus))
+        # A single GPU can use ultralytics AutoBatch; DDP needs a fixed batch size.
+        batch = -1 if gpus == 1 else 16 * gpus
+        workers = max(1, min(host["cores"] // gpus, MAX_WORKERS))
+        batch_memory = 0
+    else:
+        device = accelerator
+        if ram_available:
+            batch = int(ram_available * BATCH_MEMORY_SHARE // per_sample)
+            batch = max(1, min(2 ** (batch.bit_length() - 1) if batch else 1, MAX_CPU_BATCH))
+        else:
+            batch = 8
+        # Leave most cores to the model itself when training on the CPU.
+        workers = max(2, min(host["cores"] // 4, MAX_WORKERS))
+        batch_memory = batch * per_sample
+
+    # The RAM cache holds the images decoded and resized to imgsz (uint8 HWC). The disk cache isn't picked
+    # automatically: it writes the full resolution decoded images as .npy files next to the dataset images,
+    # which can't be sized without decoding them (about 36 MB for a 4000x3000 photo).
+    cache_size = num_images * imgsz * imgsz * 3
+    if ram_available and cache_size * 1.5 < ram_available - batch_memory:
+        cache = "ram"
+    else:
+        cache = False
+
+    settings = {"batch": batch, "workers": workers, "device": device, "cache": cache, "amp": accelerator == "cuda"}
+    sources = dict.fromkeys(settings, "auto")
+    for key in TRAINING_OVERRIDES:
+        if key in training_config:
+            settings[key] = training_config[key]
+            sources[key] = "config"
+    return settings, sources
+
+
+def describe_host(host):
+    gib = 1024 ** 3
+    parts = [f"{host['cores']} cores"]
+    if host["ram_total"]:
+        parts.append(f"{host['ram_available'] / gib:.1f}/{host['ram_total'] / gib:.1f} GiB RAM available")
+    parts.append(f"{host['disk_free'] / gib:.1f} GiB disk free")
+    if host["gpus"]:
+        parts.append(", ".join(f"{gpu['name']} ({gpu['memory'] / gib:.1f} GiB)" for gpu in host["gpus"]))
+    else:
+        parts.append(host["accelerator"])
+    return ", ".join(parts)
@@ -0,0 +1,166 @@
+import random
+import hashlib
+import numpy as np
+
+SPLIT_MODES = ("random", "seeded", "hash")
+
+
+def split_items(names, train_ratio=0.8, mode="hash", seed=0, label_paths=None, stratify=False, nc=None,
+                placed=None):
+    """
+    Assign every name to "train" or "val" and return a dict name -> split.
+
+    - "random": unseeded shuffle, a different split on every call.
+    - "seeded": shuffle with a fixed seed, reproducible for the same set of names.
+    - "hash": a name goes to train when the hash of (seed, name) falls under `train_ratio`,
+      so it keeps its split as the dataset grows.
+
+    With `stratify`, names are grouped by the rarest class found in their YOLO label file
+    (`label_paths` maps name -> label path or None) and each group is split on its own.
+    `placed` maps the names already in the dataset to their split: they count towards the train/val
+    quota of their group (and towards the class frequencies), so that a few names added to a large
+    dataset are still split by `train_ratio` overall. Their label paths are read from `label_paths` too.
+    """
+    if mode not in SPLIT_MODES:
+        raise ValueError(f"Unknown split mode '{mode}', expected one of {SPLIT_MODES}")
+    names = sorted(names)
+    if not names:
+        return {}
+    new_names = set(names)
+    placed = {name: split for name, split in (placed or {}).items() if name not in new_names}
+
+    if not stratify:
+        return _split_group(names, train_ratio, mode, seed, placed_train=_count_train(placed.values()),
+                            placed_total=len(placed))
+
+    placed_names = sorted(placed)
+    counts = class_count_matrix([(label_paths or {}).get(name) for name in names + placed_names], nc)
+    # The rarest class is taken over the whole dataset, new and placed names alike.
+    strata = stratum_keys(counts)
+    new_strata, placed_strata = strata[:len(names)], strata[len(names):]
+    assignments = {}
+    for key in np.unique(new_strata):
+        group = [names[i] for i in np.flatnonzero(new_strata == key)]
+        placed_splits = [placed[placed_names[i]] for i in np.flatnonzero(placed_strata == key)]
+        assignments.update(_split_group(group, train_ratio, mode, seed, quota=True,
+                                        placed_train=_count_train(placed_splits), placed_total=len(placed_splits)))
+    return assignments
+
+
+def _count_train(splits):
+    return sum(1 for split in splits if split == "train")
+
+
+def _split_group(names, train_ratio, mode, seed, quota=False, placed_train=0, placed_total=0):
+    if mode == "hash" and not quota:
+        return {name: "train" if hash_fraction(name, seed) < train_ratio else "val" for name in names}
+    if mode == "hash":
+        ordered = sorted(names, key=lambda name: hash_fraction(name, seed))
+    else:
+        ordered = list(names)
+        (random.Random(seed) if mode == "seeded" else random).shuffle(ordered)
+    # Fill the train quota of the whole group, including the names that are already placed.
+    split_index = int(round((len(ordered) + placed_total) * train_ratio)) - placed_train
+    split_index = min(max(split_index, 0), len(ordered))
+    return {name: "train" if i < split_index else "val" for i, name in enumerate(ordered)}
+
+
+def group_splits(splits, groups, established=(), fixed=()):
+    """
+    Move every member of a group (e.g. near-duplicate images) into a single split, so that no group is shared
+    between train and val. `splits` maps name -> split. A group follows its first member (in name order)
+    that is `fixed`, else the first one whose split is `established`, else its first member; fixed members
+    are never moved. Returns a dict name -> new split of the members that have to move.
+    """
+    changes = {}
+    for group in groups:
+        members = sorted(name for name in group if name in splits)
+        if len(members) < 2:
+            continue
+        anchors = [name for name in members if name in fixed] or [name for name in members if name in established]
+        split = splits[(anchors or members)[0]]
+        for name in members:
+            if name not in fixed and splits[name] != split:
+                changes[name] = split
+    return changes
+
+
+def hash_fraction(name, seed=0):
+    """
+    Map a name to a stable pseudo-random number in [0, 1).
+    """
+    digest = hashlib.sha1(f"{seed}:{name}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64
+
+
+def read_label_classes(label_paths):
+    """
+    Read the class id column of YOLO label files, one file at a time.
+    Returns (owners, classes): for every label row, the index of its file in `label_paths` and its class id.
+    An entry may also be an array of class ids (e.g. read from a packed dataset) instead of a path.
+    Missing files (None) and files with a non-numeric class id contribute no rows; validate_labels reports them.
+    """
+    owners, classes = [], []
+    for i, path in enumerate(label_paths):
+        if path is None or (isinstance(path, str) and not path):
+            continue
+        if isinstance(path, np.ndarray):
+            ids = path.astype(np.int64)
+        else:
+            with open(path, "r") as f:
+                first = [line.split(None, 1)[0] for line in f.read().splitlines() if line.strip()]
+            try:
+                ids = np.asarray(first, dtype=np.float64).astype(np.int64)
+            except ValueError:
+                continue
+        classes.append(ids)
+        owners.append(np.full(len(ids), i, dtype=np.int64))
+    if not classes:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(owners), np.concatenate(classes)
+
+
+def class_count_matrix(label_paths, nc=None):
+    """
+    Return an (n_files, nc) matrix with the number of instances of each class per label file.
+    Class ids outside [0, nc) are ignored.
+    """
+    owners, classes = read_label_classes(label_paths)
+    if nc is None:
+        nc = int(classes.max()) + 1 if classes.size else 0
+    valid = (classes >= 0) & (classes < nc)
+    flat = owners[valid] * nc + classes[valid]
+    return np.bincount(flat, minlength=len(label_paths) * nc).reshape(len(label_paths), nc)
+
+
+def stratum_keys(counts):
+    """
+    Return, for every row of a class count matrix, the globally rarest class it contains (-1 for background).
+    """
+    if counts.shape[1] == 0:
+        return np.full(counts.shape[0], -1, dtype=np.int64)
+    totals = counts.sum(axis=0)
+    # Rank classes by frequency so that argmin over the present classes picks the rarest one.
+    rank = np.empty_like(totals)
+    rank[np.argsort(totals, kind="stable")] = np.arange(len(totals))
+    ranked = np.where(counts > 0, rank[np.newaxis, :], len(totals))
+    keys = np.argmin(ranked, axis=1)
+    return np.where(counts.any(axis=1), keys, -1)
+
+
+def split_class_report(label_paths_by_split, names):
+    """
+    Print and return the number of instances of each class for every split.
+    `label_paths_by_split` maps split name -> list of label paths.
+    """
+    nc = len(names)
+    report = {}
+    for split, paths in label_paths_by_split.items():
+        totals = class_count_matrix(paths, nc).sum(axis=0)
+        report[split] = {name: int(count) for name, count in zip(names, totals)}
+    width = max([len(name) for name in names] + [5])
+    print("Instances per class:")
+    print(f"  {'class':<{width}} " + " ".join(f"{split:>8}" for split in report))
+    for name in names:
+        print(f"  {name:<{width}} " + " ".join(f"{report[split][name]:>8}" for split in report))
+    return report
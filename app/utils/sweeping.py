@@ -0,0 +1,128 @@
+import os
+import json
+import random
+import itertools
+import statistics
+
+# Validation metrics of ultralytics usable as the objective of a sweep.
+METRIC_KEYS = {"map": "metrics/mAP50-95(B)", "map50": "metrics/mAP50(B)"}
+PROGRESS_DIRNAME = "progress"
+
+
+def search_space(config):
+    """
+    Return the search space of a configuration: the "search_space" of its "sweep" block, mapping training keys
+    to lists of candidate values. Lists in the training block itself (e.g. "device": [0, 1]) are plain values.
+    """
+    space = config.get("sweep", {}).get("search_space", {})
+    for key, values in space.items():
+        if not isinstance(values, list) or not values:
+            raise Exception(f"sweep.search_space.{key} must be a non-empty list of candidate values.")
+    return space
+
+
+def expand_trials(space, max_trials=None, seed=0):
+    """
+    List the combinations of a search space (grid search) as override dicts, in a stable order.
+    When the grid is larger than `max_trials`, a reproducible random sample of it is returned instead.
+    """
+    keys = sorted(space)
+    trials = [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+    if max_trials and len(trials) > max_trials:
+        picked = sorted(random.Random(seed).sample(range(len(trials)), max_trials))
+        trials = [trials[i] for i in picked]
+    return trials
+
+
+def progress_path(sweep_dir, trial_name):
+    return os.path.join(sweep_dir, PROGRESS_DIRNAME, f"{trial_name}.json")
+
+
+def load_progress(path):
+    if not os.path.exists(path):
+        return {"values": [], "stopped_at": None}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_progress(path, progress):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+
+def median_stopping_callbacks(sweep_dir, trial_name, metric="map", grace_epochs=5, min_trials=3):
+    """
+    Ultralytics callbacks implementing the median stopping rule across the trials of a sweep.
+    Every epoch, the trial appends its validation metric to <sweep_dir>/progress/<trial_name>.json.
+    After `grace_epochs`, a trial stops once its best value so far is below the median of the best
+    values the other trials had reached at the same epoch, provided at least `min_trials` of them got there.
+    Trials running in parallel see each other's progress through these files.
+    """
+    key = METRIC_KEYS[metric]
+    path = progress_path(sweep_dir, trial_name)
+
+    def on_train_start(trainer):
+        # A fresh run forgets the history of a previous attempt; a resumed one keeps it.
+        progress = load_progress(path)
+        progress["values"] = progress["values"][:trainer.start_epoch]
+        progress["stopped_at"] = None
+        save_progress(path, progress)
+
+    def on_fit_epoch_end(trainer):
+        progress = load_progress(path)
+        progress["values"].append(float((trainer.metrics or {}).get(key, 0.0)))
+        epoch = len(progress["values"])
+        if epoch > grace_epochs:
+            peers = []
+            for name in os.listdir(os.path.dirname(path)):
+                if not name.endswith(".json") or name == os.path.basename(path):
+                    continue
+                values = load_progress(os.path.join(os.path.dirname(path), name))["values"]
+                if len(values) >= epoch:
+                    peers.append(max(values[:epoch]))
+            if len(peers) >= min_trials and max(progress["values"]) < statistics.median(peers):
+                print(f"{trial_name}: best {metric} {max(progress['values']):.4f} after {epoch} epochs is below "
+                      f"the median {statistics.median(peers):.4f} of {len(peers)} other trials, stopping early.")
+                progress["stopped_at"] = epoch
+                trainer.stop = True
+        save_progress(path, progress)
+
+    return {"on_train_start": on_train_start, "on_fit_epoch_end": on_fit_epoch_end}
+
+
+def pareto_front(rows, accuracy_key="accuracy", latency_key="p50_ms"):
+    """
+    Mark the rows that no other row beats on both accuracy (higher) and latency (lower).
+    """
+    for row in rows:
+        row["pareto"] = row[accuracy_key] is not None and row[latency_key] is not None and not any(
+            other is not row and other[accuracy_key] is not None and other[latency_key] is not None
+            and other[accuracy_key] >= row[accuracy_key] and other[latency_key] <= row[latency_key]
+            and (other[accuracy_key] > row[accuracy_key] or other[latency_key] < row[latency_key])
+            for other in rows
+        )
+    return rows
+
+
+def rank_trials(rows, min_accuracy=None, accuracy_key="accuracy", latency_key="p50_ms"):
+    """
+    Order the trials for picking a model: the timed trials meeting `min_accuracy` come first, fastest first,
+    then the others by decreasing accuracy. Without a bar, all trials are ranked by accuracy.
+    Trials without accuracy come last.
+    """
+    def sort_key(row):
+        accuracy, latency = row[accuracy_key], row[latency_key]
+        if accuracy is None:
+            return (2, 0.0)
+        if min_accuracy is not None and accuracy >= min_accuracy and latency is not None:
+            return (0, latency)
+        return (1, -accuracy)
+
+    ranked = sorted(rows, key=sort_key)
+    for rank, row in enumerate(ranked, 1):
+        row["rank"] = rank
+        row["meets_bar"] = min_accuracy is not None and row[accuracy_key] is not None and row[accuracy_key] >= min_accuracy
+    return ranked
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scripts in app/ import their helpers as `utils.<module>`.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app"))
@@ -0,0 +1,55 @@
+import os
+import pytest
+from utils.checkpoints import archive_run, checkpoint_state, fingerprint_changes, save_fingerprint, training_fingerprint
+from utils.manifest import MANIFEST_VERSION, save_manifest
+
+
+def write_manifest(output_dir, files):
+    save_manifest({"version": MANIFEST_VERSION, "files": files}, output_dir)
+
+
+def config_for(output_dir, **training):
+    return {"output_dataset_dir": output_dir, "tags": ["car"], "training": dict({"epochs": 10}, **training)}
+
+
+def test_fingerprint_follows_the_dataset_and_ignores_runtime_keys(tmp_path):
+    output_dir = str(tmp_path)
+    assert training_fingerprint(config_for(output_dir))["dataset"] is None
+
+    write_manifest(output_dir, {"a.jpg": {"image": "1", "split": "train"}})
+    fingerprint = training_fingerprint(config_for(output_dir))
+    assert fingerprint["digest"] == training_fingerprint(config_for(output_dir, workers=2, device="cpu"))["digest"]
+    assert fingerprint["digest"] != training_fingerprint(config_for(output_dir, epochs=20))["digest"]
+
+    write_manifest(output_dir, {"a.jpg": {"image": "2", "split": "train"}})
+    assert training_fingerprint(config_for(output_dir))["dataset"] != fingerprint["dataset"]
+
+
+def test_fingerprint_changes_lists_what_differs(tmp_path):
+    write_manifest(str(tmp_path), {})
+    previous = training_fingerprint(config_for(str(tmp_path), lr0=0.01))
+    current = training_fingerprint(dict(config_for(str(tmp_path), epochs=20), label_validation="fix"))
+    assert fingerprint_changes(previous, previous) == []
+    assert fingerprint_changes(None, current) == ["no fingerprint recorded for the previous run"]
+    assert fingerprint_changes(previous, current) == [
+        "label classes or validation", "training.epochs: 10 -> 20", "training.lr0: 0.01 -> None"
+    ]
+
+
+def test_archived_runs_are_named_after_their_fingerprint(tmp_path):
+    run_dir = str(tmp_path / "exp")
+    save_fingerprint(run_dir, {"digest": "abcdef0123"})
+    assert archive_run(run_dir) == f"{run_dir}_abcdef01"
+    save_fingerprint(run_dir, {"digest": "abcdef0123"})
+    assert archive_run(run_dir) == f"{run_dir}_abcdef01_2"
+    os.makedirs(run_dir)
+    assert archive_run(run_dir) == f"{run_dir}_previous"
+
+
+def test_checkpoint_state(tmp_path):
+    assert checkpoint_state(str(tmp_path / "last.pt")) == "missing"
+    torch = pytest.importorskip("torch")
+    torch.save({"epoch": 3, "optimizer": {"state": {}}}, str(tmp_path / "last.pt"))
+    assert checkpoint_state(str(tmp_path / "last.pt")) == "interrupted"
+    torch.save({"epoch": -1, "optimizer": None}, str(tmp_path / "last.pt"))
+    assert checkpoint_state(str(tmp_path / "last.pt")) == "finished"
@@ -0,0 +1,206 @@
+import errno
+import os
+import shutil
+import pytest
+from utils import dataset_preparation
+from utils.dataset_preparation import index_extracted_export, merge_indices, place_file, sync_dataset
+from utils.manifest import load_manifest
+from utils.splitting import group_splits
+
+
+def item(project):
+    return {"image": f"/exports/{project}/img.jpg", "label": None, "project": project}
+
+
+def test_merge_indices_renames_name_collisions():
+    merged, renamed = merge_indices([
+        (1, {"img.jpg": item(1), "other.jpg": item(1)}),
+        (2, {"img.jpg": item(2), "img.png": item(2)}),
+    ], reserved={"other.png": {}})
+    assert merged == {
+        "img.jpg": item(1),
+        "other_p1.jpg": item(1),
+        "img_p2.jpg": item(2),
+        "img_p2_2.png": item(2),
+    }
+    assert renamed == [
+        {"name": "other.jpg", "project": 1, "renamed_to": "other_p1.jpg"},
+        {"name": "img.jpg", "project": 2, "renamed_to": "img_p2.jpg"},
+        {"name": "img.png", "project": 2, "renamed_to": "img_p2_2.png"},
+    ]
+
+
+def test_merge_indices_keeps_the_names_held_in_the_dataset():
+    owners = {"img.jpg": 1, "img_p2.jpg": 2}
+    # Project order swapped: each project still gets the name it holds.
+    merged, renamed = merge_indices([(2, {"img.jpg": item(2)}), (1, {"img.jpg": item(1)})], owners=owners)
+    assert merged == {"img_p2.jpg": item(2), "img.jpg": item(1)}
+    assert renamed == [{"name": "img.jpg", "project": 2, "renamed_to": "img_p2.jpg"}]
+    # Project 1 dropped its image: project 2 keeps its renamed name instead of taking the plain one.
+    merged, _ = merge_indices([(1, {}), (2, {"img.jpg": item(2)})], owners=owners)
+    assert merged == {"img_p2.jpg": item(2)}
+    # A project that doesn't hold a name in the dataset doesn't get it.
+    merged, _ = merge_indices([(3, {"img.jpg": item(3)})], reserved={"img.jpg": {}}, owners=owners)
+    assert merged == {"img_p3.jpg": item(3)}
+
+
+def test_group_splits_moves_groups_to_a_single_split():
+    splits = {"a": "val", "b": "train", "c": "train", "d": "val", "e": "train", "f": "val", "g": "train"}
+    groups = [
+        ["b", "a"],         # follows its first member
+        ["c", "d"],         # follows its established member
+        ["e", "f", "g"],    # follows its fixed member, which never moves
+        ["x", "g"],         # members outside `splits` are ignored
+    ]
+    changes = group_splits(splits, groups, established={"d"}, fixed={"f"})
+    assert changes == {"b": "val", "c": "val", "e": "val", "g": "val"}
+
+
+def write_export(export_dir, labels):
+    """
+    Write an extracted export: `labels` maps image name -> label file content.
+    """
+    (export_dir / "images").mkdir(parents=True, exist_ok=True)
+    (export_dir / "labels").mkdir(parents=True, exist_ok=True)
+    for name, content in labels.items():
+        (export_dir / "images" / name).write_bytes(name.encode())
+        (export_dir / "labels" / (os.path.splitext(name)[0] + ".txt")).write_text(content)
+
+
+def dataset_files(output_dir):
+    return {split: sorted(os.listdir(os.path.join(output_dir, split, "images"))) for split in ("train", "val")}
+
+
+def test_sync_dataset_only_touches_changed_items(tmp_path):
+    export_dir, output_dir = tmp_path / "export", str(tmp_path / "dataset")
+    write_export(export_dir, {f"img_{i}.jpg": "0 0.5 0.5 0.1 0.1\n" for i in range(6)})
+    summary = sync_dataset(index_extracted_export(str(export_dir), project_id=1), output_dir, 0.5)
+    assert (summary["added"], summary["train"] + summary["val"]) == (6, 6)
+    splits = {name: entry["split"] for name, entry in load_manifest(output_dir)["files"].items()}
+    placed_at = {name: os.stat(os.path.join(output_dir, split, "images", name)).st_mtime_ns
+                 for name, split in splits.items()}
+
+    os.remove(export_dir / "images" / "img_0.jpg")
+    (export_dir / "labels" / "img_1.txt").write_text("0 0.4 0.4 0.1 0.1\n")
+    write_export(export_dir, {"img_6.jpg": "0 0.5 0.5 0.1 0.1\n"})
+    summary = sync_dataset(index_extracted_export(str(export_dir), project_id=1), output_dir, 0.5)
+
+    assert {key: summary[key] for key in ("added", "updated", "removed", "unchanged")} == \
+        {"added": 1, "updated": 1, "removed": 1, "unchanged": 4}
+    files = load_manifest(output_dir)["files"]
+    assert sorted(files) == [f"img_{i}.jpg" for i in range(1, 7)]
+    for name in files:
+        if name in splits:
+            assert files[name]["split"] == splits[name]
+    for name in ("img_2.jpg", "img_3.jpg"):
+        path = os.path.join(output_dir, splits[name], "images", name)
+        assert os.stat(path).st_mtime_ns == placed_at[name]
+    with open(os.path.join(output_dir, splits["img_1.jpg"], "labels", "img_1.txt")) as f:
+        assert f.read() == "0 0.4 0.4 0.1 0.1\n"
+    on_disk = dataset_files(output_dir)
+    assert sorted(on_disk["train"] + on_disk["val"]) == sorted(files)
+    assert not any(os.path.exists(os.path.join(output_dir, split, "images", "img_0.jpg")) for split in on_disk)
+
+
+def test_sync_dataset_keeps_items_of_kept_projects(tmp_path):
+    first, second, output_dir = tmp_path / "first", tmp_path / "second", str(tmp_path / "dataset")
+    write_export(first, {"a.jpg": "0 0.5 0.5 0.1 0.1\n"})
+    write_export(second, {"b.jpg": "0 0.5 0.5 0.1 0.1\n"})
+    index, _ = merge_indices([(1, index_extracted_export(str(first), project_id=1)),
+                              (2, index_extracted_export(str(second), project_id=2))])
+    sync_dataset(index, output_dir, 0.5)
+
+    # Project 1 failed to export this time: its items stay, project 2's missing items go.
+    summary = sync_dataset({}, output_dir, 0.5, keep_projects=[1])
+    assert (summary["removed"], summary["train"] + summary["val"]) == (1, 1)
+    assert sorted(load_manifest(output_dir)["files"]) == ["a.jpg"]
+
+
+def test_symlinked_items_follow_a_new_export_directory(tmp_path):
+    first, second, output_dir = tmp_path / "export_1", tmp_path / "export_2", str(tmp_path / "dataset")
+    write_export(first, {"a.jpg": "0 0.5 0.5 0.1 0.1\n", "b.jpg": "0 0.5 0.5 0.1 0.1\n"})
+    sync_dataset(index_extracted_export(str(first), project_id=1), output_dir, 0.5, mode="symlink")
+    write_export(second, {"a.jpg": "0 0.5 0.5 0.1 0.1\n", "b.jpg": "1 0.5 0.5 0.1 0.1\n"})
+
+    summary = sync_dataset(index_extracted_export(str(second), project_id=1), output_dir, 0.5, mode="symlink")
+    assert (summary["unchanged"], summary["updated"]) == (1, 1)
+    shutil.rmtree(first)
+    for name, entry in load_manifest(output_dir)["files"].items():
+        image = os.path.join(output_dir, entry["split"], "images", name)
+        label = os.path.join(output_dir, entry["split"], "labels", os.path.splitext(name)[0] + ".txt")
+        assert os.readlink(image) == str(second / "images" / name)
+        assert os.path.exists(image) and os.path.exists(label)
+
+
+def test_unsupported_links_fall_back_to_copies_for_the_rest_of_the_run(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_preparation, "_unsupported_modes", set())
+    links = []
+
+    def cross_device_link(src, dst):
+        links.append(dst)
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+    monkeypatch.setattr(os, "link", cross_device_link)
+
+    src = tmp_path / "a.jpg"
+    src.write_bytes(b"image")
+    assert place_file(str(src), str(tmp_path / "b.jpg"), "hardlink") == "copy"
+    assert place_file(str(src), str(tmp_path / "c.jpg"), "hardlink") == "copy"
+    assert len(links) == 1
+    assert (tmp_path / "c.jpg").read_bytes() == b"image" and os.stat(tmp_path / "c.jpg").st_nlink == 1
+
+    def reflink_unsupported(src, dst):
+        open(dst, "wb").close()
+        raise OSError(errno.EOPNOTSUPP, "Operation not supported")
+    monkeypatch.setattr(dataset_preparation, "_reflink", reflink_unsupported)
+    assert place_file(str(src), str(tmp_path / "d.jpg"), "reflink") == "copy"
+    assert (tmp_path / "d.jpg").read_bytes() == b"image"
+
+
+def test_other_placement_errors_are_raised(tmp_path, monkeypatch):
+    monkeypatch.setattr(dataset_preparation, "_unsupported_modes", set())
+    with pytest.raises(FileNotFoundError):
+        place_file(str(tmp_path / "missing.jpg"), str(tmp_path / "b.jpg"), "hardlink")
+    with pytest.raises(ValueError):
+        place_file(str(tmp_path / "a.jpg"), str(tmp_path / "b.jpg"), "clone")
+
+
+def write_labelled_split(output_dir, labels):
+    for split in ("images", "labels"):
+        os.makedirs(os.path.join(output_dir, "train", split), exist_ok=True)
+    for stem, text in labels.items():
+        with open(os.path.join(output_dir, "train", "images", f"{stem}.jpg"), "wb") as f:
+            f.write(stem.encode())
+        with open(os.path.join(output_dir, "train", "labels", f"{stem}.txt"), "w") as f:
+            f.write(text)
+
+
+def test_validate_labels_reports_then_fixes_bad_rows(tmp_path):
+    output_dir = str(tmp_path / "dataset")
+    rows = ["0 0.5 0.5 0.2 0.2", "0 0.5 0.5 1.4 0.2", "5 0.5 0.5 0.1 0.1", "0 0.5 0.5 0.2 0.2", "0 0.5 0.5",
+            "1 0.3 0.3 0 0.1"]
+    write_labelled_split(output_dir, {"a": "\n".join(rows) + "\n", "b": "1 0.2 0.2 0.1 0.1\n"})
+    labels_dir = os.path.join(output_dir, "train", "labels")
+    # a.txt is hardlinked from the export, which fixing it must leave untouched.
+    source = str(tmp_path / "a.txt")
+    os.link(os.path.join(labels_dir, "a.txt"), source)
+    with open(os.path.join(labels_dir, "c.txt"), "w") as f:
+        f.write("0 0.5 0.5 0.1 0.1\n")
+    b_inode = os.stat(os.path.join(labels_dir, "b.txt")).st_ino
+
+    report = dataset_preparation.validate_labels(output_dir, ["car", "truck"])
+    assert report["issues"] == {"malformed": 1, "non_numeric": 0, "bad_class": 1, "out_of_range": 1,
+                                "degenerate": 1, "duplicate": 1}
+    assert list(report["files_with_issues"]) == [os.path.join("train", "labels", "a.txt")]
+    assert report["splits"]["train"]["orphaned_labels"] == ["c.txt"]
+    assert report["splits"]["train"]["classes"]["car"]["instances"] == 1
+    assert sorted(os.listdir(labels_dir)) == ["a.txt", "b.txt", "c.txt"]
+
+    report = dataset_preparation.validate_labels(output_dir, ["car", "truck"], fix=True)
+    assert report["fixed"] and report["splits"]["train"]["classes"]["car"]["instances"] == 2
+    with open(os.path.join(labels_dir, "a.txt")) as f:
+        assert f.read().splitlines() == ["0 0.5 0.5 0.2 0.2", "0 0.5 0.5 1 0.2"]
+    with open(source) as f:
+        assert f.read() == "\n".join(rows) + "\n"
+    assert sorted(os.listdir(labels_dir)) == ["a.txt", "b.txt"]
+    assert os.stat(os.path.join(labels_dir, "b.txt")).st_ino == b_inode
+    assert sum(dataset_preparation.validate_labels(output_dir, ["car", "truck"])["issues"].values()) == 0
@@ -0,0 +1,60 @@
+import os
+import json
+import numpy as np
+from PIL import Image
+from utils.dedup import DEDUP_REPORT_FILENAME, find_duplicates, near_duplicate_components
+from utils.manifest import hash_file
+
+
+def gradient(path, shift=0):
+    """
+    Save a horizontal gradient; a small `shift` of the intensities keeps the perceptual hash.
+    """
+    pixels = np.clip(np.tile(np.arange(0, 256, 4, dtype=np.int16), (48, 1)) + shift, 0, 255).astype(np.uint8)
+    Image.fromarray(pixels).convert("RGB").save(path)
+    return path
+
+
+def checkerboard(path):
+    pixels = (np.indices((48, 64)).sum(axis=0) // 8 % 2 * 255).astype(np.uint8)
+    Image.fromarray(pixels).convert("RGB").save(path)
+    return path
+
+
+def test_near_duplicate_components_groups_transitively():
+    base = 0x0123456789ABCDEF
+    hashes = np.array([
+        base,
+        base ^ 0b111,           # 3 bits from base
+        base ^ 0b111111,        # 3 bits from the previous one, 6 from base
+        ~base & 0xFFFFFFFFFFFFFFFF,
+        base,                   # identical to the first
+    ], dtype=np.uint64)
+    components = near_duplicate_components(hashes, max_distance=3)
+    assert components[0] == components[1] == components[2] == components[4]
+    assert components[3] != components[0]
+    assert len(set(near_duplicate_components(hashes, max_distance=2).tolist())) == 4
+
+
+def test_kept_images_missing_from_cache_are_read_from_dataset(tmp_path):
+    output_dir = str(tmp_path / "dataset")
+    export_images = tmp_path / "export" / "images"
+    os.makedirs(export_images)
+    os.makedirs(os.path.join(output_dir, "val", "images"))
+    index = {
+        "new.png": {"image": gradient(str(export_images / "new.png"), shift=2), "label": None, "project": 2},
+        "other.png": {"image": checkerboard(str(export_images / "other.png")), "label": None, "project": 2},
+    }
+    kept_path = gradient(os.path.join(output_dir, "val", "images", "kept.png"))
+    kept = {
+        "kept.png": {"image_hash": hash_file(kept_path), "project": 1, "split": "val"},
+        "gone.png": {"image_hash": "0" * 40, "project": 1, "split": "train"},
+    }
+
+    duplicates = find_duplicates(index, output_dir, kept=kept, workers=1, io_workers=2)
+
+    assert duplicates["groups"] == [["kept.png", "new.png"]]
+    with open(os.path.join(output_dir, DEDUP_REPORT_FILENAME)) as f:
+        report = json.load(f)
+    assert report["unhashed"] == ["gone.png"]
+    assert report["unreadable"] == []
@@ -0,0 +1,32 @@
+import pytest
+from utils.export_targets import plan_export_groups, target_name
+
+
+def test_target_name_adds_the_image_size_only_when_it_differs():
+    assert target_name({"format": "tflite", "int8": True}) == "tflite_int8"
+    assert target_name({"format": "tfjs", "half": True, "imgsz": 640}, 640) == "tfjs_fp16"
+    assert target_name({"format": "onnx", "imgsz": 320}, 640) == "onnx_320"
+    assert target_name({"format": "onnx", "imgsz": 320, "name": "small"}, 640) == "small"
+
+
+def test_tensorflow_formats_share_one_conversion_with_a_plain_onnx_target():
+    targets = [{"format": "tfjs"}, {"format": "tflite"}, {"format": "onnx"}, {"format": "tflite", "int8": True}]
+    groups = plan_export_groups(targets, 640)
+    assert sorted(groups) == ["tf_imgsz640", "tf_imgsz640_int8"]
+    assert groups["tf_imgsz640"]["format"] == "tfjs"
+    assert [target["name"] for target in groups["tf_imgsz640"]["targets"]] == ["tfjs", "tflite", "onnx"]
+    assert groups["tf_imgsz640_int8"]["options"] == {"imgsz": 640, "int8": True}
+
+
+def test_targets_at_other_image_sizes_get_their_own_groups_and_names():
+    groups = plan_export_groups([{"format": "onnx", "dynamic": True}, {"format": "onnx", "imgsz": 320}], 640)
+    assert sorted(groups) == ["onnx_320_imgsz320", "onnx_imgsz640"]
+    assert groups["onnx_imgsz640"]["options"] == {"imgsz": 640, "dynamic": True}
+    assert groups["onnx_320_imgsz320"]["targets"][0]["name"] == "onnx_320"
+
+
+def test_duplicate_target_names_are_rejected():
+    with pytest.raises(Exception, match="onnx"):
+        plan_export_groups([{"format": "onnx"}, {"format": "onnx", "dynamic": True}], 640)
+    with pytest.raises(Exception, match="fast"):
+        plan_export_groups([{"format": "onnx", "name": "fast"}, {"format": "tflite", "name": "fast"}], 640)
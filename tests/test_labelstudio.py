@@ -0,0 +1,220 @@
+import io
+import json
+import os
+import threading
+import zipfile
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+import prepare
+from utils import labelstudio_export
+from utils.dataset_preparation import index_extracted_export, sync_dataset
+from utils.labelstudio_client import LabelStudioClient, LabelStudioHTTPError
+from utils.labelstudio_export import export_snapshot, find_reusable_snapshot
+
+DETAIL = {"id": 1, "task_number": 2, "total_annotations_number": 2, "total_predictions_number": 0,
+          "updated_at": "2024-01-01T00:00:00Z"}
+
+
+def export_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("images/a.jpg", b"image")
+        z.writestr("labels/a.txt", "0 0.5 0.5 0.1 0.1\n")
+    return buffer.getvalue()
+
+
+class FakeLabelStudio:
+    """
+    Minimal Label Studio API: project 1 exports through a snapshot whose first poll fails with a 503,
+    project 2 always answers 503 and project 3 doesn't exist. The project list has three pages of two
+    projects and its second page is rate limited once.
+    """
+
+    def __init__(self):
+        self.calls = Counter()
+        self.snapshots = []
+        self.polls = 0
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, status, payload=None, body=None):
+                body = body if body is not None else json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                path = url.path
+                fake.calls["GET " + path] += 1
+                if path == "/api/projects":
+                    query = parse_qs(url.query)
+                    page = int(query.get("page", ["1"])[0])
+                    fake.calls[f"page {page}"] += 1
+                    if page == 2 and fake.calls["page 2"] == 1:
+                        self.send_response(429)
+                        self.send_header("Retry-After", "0")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    page_size = int(query["page_size"][0])
+                    self._send(200, {
+                        "count": 6,
+                        "results": [{"id": i} for i in range((page - 1) * 2 + 1, page * 2 + 1)],
+                        "next": f"{fake.url}/api/projects?page={page + 1}&page_size={page_size}" if page < 3 else None,
+                    })
+                elif path == "/api/projects/1":
+                    self._send(200, DETAIL)
+                elif path.startswith("/api/projects/2"):
+                    self._send(503, {"detail": "unavailable"})
+                elif path == "/api/projects/1/exports":
+                    self._send(200, fake.snapshots)
+                elif path == "/api/projects/1/exports/7":
+                    fake.polls += 1
+                    if fake.polls == 1:
+                        self._send(503, {"detail": "unavailable"})
+                    else:
+                        self._send(200, fake.snapshots[0] if fake.polls > 2 else dict(fake.snapshots[0],
+                                                                                          status="in_progress"))
+                elif path == "/api/projects/1/exports/7/download":
+                    self._send(200, body=export_zip())
+                else:
+                    self._send(404, {"detail": "not found"})
+
+            def do_POST(self):
+                path = urlparse(self.path).path
+                fake.calls["POST " + path] += 1
+                self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if path == "/api/projects/1/exports":
+                    fake.snapshots.append({
+                        "id": 7, "status": "completed", "created_at": "2099-01-01T00:00:00Z",
+                        "counters": {"task_number": 2, "annotation_number": 2, "prediction_number": 0},
+                        "converted_formats": [{"export_type": "YOLO", "status": "completed"}],
+                    })
+                    self._send(201, {"id": 7, "status": "created"})
+                elif path == "/api/projects/1/exports/7/convert":
+                    self._send(200, {"converted_formats": fake.snapshots[0]["converted_formats"]})
+                else:
+                    self._send(404, {"detail": "not found"})
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def server(monkeypatch):
+    fake = FakeLabelStudio()
+    monkeypatch.setattr(labelstudio_export, "POLL_INTERVAL", 0.01)
+    yield fake
+    fake.server.shutdown()
+
+
+def test_snapshot_export_polls_downloads_and_reuses(server, tmp_path):
+    client = LabelStudioClient("key", server.url, retries=2, backoff=0)
+    extract_dir = export_snapshot(1, "key", "YOLO", client=client, extract_dir=str(tmp_path / "first"))
+    assert sorted(os.listdir(os.path.join(extract_dir, "images"))) == ["a.jpg"]
+    assert server.calls["POST /api/projects/1/exports"] == 1
+    # The 503 while polling only delays the next poll.
+    assert server.polls == 3
+
+    # Same counters and newer than the project: the snapshot is downloaded again instead of rebuilt.
+    export_snapshot(1, "key", "YOLO", client=client, extract_dir=str(tmp_path / "second"))
+    assert server.calls["POST /api/projects/1/exports"] == 1
+    assert server.calls["GET /api/projects/1/exports/7/download"] == 2
+
+
+def test_metadata_requests_are_retried_once_per_layer(server):
+    client = LabelStudioClient("key", server.url, retries=2, backoff=0)
+    with pytest.raises(LabelStudioHTTPError) as error:
+        client.get_project(2)
+    assert error.value.status_code == 503
+    assert server.calls["GET /api/projects/2"] == 3
+
+
+def test_project_list_follows_every_page_and_retries_rate_limits(server):
+    client = LabelStudioClient("key", server.url, retries=2, backoff=0)
+    assert [project["id"] for project in client.list_projects()] == [1, 2, 3, 4, 5, 6]
+    assert (server.calls["page 1"], server.calls["page 2"], server.calls["page 3"]) == (1, 2, 1)
+
+
+def test_exports_are_only_retried_by_export_with_retry(server):
+    client = LabelStudioClient("key", server.url, retries=2, backoff=0)
+    with pytest.raises(LabelStudioHTTPError):
+        prepare.export_with_retry(2, "key", "YOLO", client, retries=1, backoff=0)
+    assert server.calls["GET /api/projects/2/export"] == 2
+
+    # Client errors are not retried at all.
+    with pytest.raises(LabelStudioHTTPError) as error:
+        prepare.export_with_retry(3, "key", "YOLO", client, retries=3, backoff=0)
+    assert error.value.status_code == 404
+    assert server.calls["GET /api/projects/3/export"] == 1
+
+
+def test_find_reusable_snapshot_rejects_changed_or_old_snapshots():
+    snapshot = {"id": 1, "status": "completed", "created_at": "2024-02-01T00:00:00Z",
+                "counters": {"task_number": 2, "annotation_number": 2, "prediction_number": 0}}
+    assert find_reusable_snapshot([snapshot], DETAIL) == snapshot
+    assert find_reusable_snapshot([snapshot], dict(DETAIL, total_annotations_number=3)) is None
+    assert find_reusable_snapshot([snapshot], dict(DETAIL, updated_at="2024-03-01T00:00:00Z")) is None
+    assert find_reusable_snapshot([snapshot], DETAIL, max_age=3600) is None
+
+
+def archive(names):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        for name in names:
+            z.writestr(f"images/{name}.jpg", name.encode())
+            z.writestr(f"labels/{name}.txt", "0 0.5 0.5 0.1 0.1\n")
+    buffer.seek(0)
+    return buffer
+
+
+def test_tasks_deleted_from_an_export_leave_the_dataset(tmp_path):
+    extract_dir, output_dir = str(tmp_path / "exports" / "project_1"), str(tmp_path / "dataset")
+    labelstudio_export.extract_zip_stream(archive(["a", "b", "c"]), extract_dir)
+    sync_dataset(index_extracted_export(extract_dir, project_id=1), output_dir, mode="symlink")
+
+    assert labelstudio_export.extract_zip_stream(archive(["a", "b"]), extract_dir) == 4
+    assert sorted(os.listdir(os.path.join(extract_dir, "images"))) == ["a.jpg", "b.jpg"]
+    summary = sync_dataset(index_extracted_export(extract_dir, project_id=1), output_dir, mode="symlink")
+    assert (summary["removed"], summary["unchanged"]) == (1, 2)
+    assert os.listdir(tmp_path / "exports") == ["project_1"]
+
+
+def test_failed_extraction_keeps_the_previous_export(tmp_path):
+    extract_dir = str(tmp_path / "project_1")
+    labelstudio_export.extract_zip_stream(archive(["a"]), extract_dir)
+    with pytest.raises(Exception):
+        labelstudio_export.extract_zip_stream(io.BytesIO(archive(["b"]).getvalue()[:-40]), extract_dir)
+    assert os.listdir(os.path.join(extract_dir, "images")) == ["a.jpg"]
+    assert os.listdir(tmp_path) == ["project_1"]
+
+
+def test_extraction_counts_files_and_rejects_paths_outside_the_directory(tmp_path):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("images/", b"")
+        z.writestr("images/a.jpg", b"image" * 1000)
+        z.writestr("classes.txt", "car\n")
+    buffer.seek(0)
+    extract_dir = str(tmp_path / "export")
+    assert labelstudio_export.extract_zip_stream(buffer, extract_dir) == 2
+    assert (tmp_path / "export" / "images" / "a.jpg").read_bytes() == b"image" * 1000
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("images/b.jpg", b"image")
+        z.writestr("../evil.txt", "evil")
+    buffer.seek(0)
+    with pytest.raises(Exception, match="Refusing"):
+        labelstudio_export.extract_zip_stream(buffer, extract_dir)
+    assert not (tmp_path / "evil.txt").exists()
+    assert sorted(os.listdir(extract_dir)) == ["classes.txt", "images"]
+    assert os.listdir(tmp_path) == ["export"]
@@ -0,0 +1,91 @@
+import io
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+import requests
+from PIL import Image
+from ml_backend import PredictionService, make_handler
+from utils.prediction import StubPredictor, decode_image
+
+LABEL_CONFIG = """
+<View>
+  <Image name="img" value="$image"/>
+  <RectangleLabels name="box" toName="img">
+    <Label value="car"/>
+    <Label value="person"/>
+  </RectangleLabels>
+</View>
+"""
+
+
+def jpeg_bytes(width, height, orientation=None):
+    buffer = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    Image.new("RGB", (width, height), (200, 30, 30)).save(buffer, "JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def serve(handler):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture
+def backend():
+    images = {"/landscape.jpg": jpeg_bytes(80, 40), "/rotated.jpg": jpeg_bytes(80, 40, orientation=6)}
+
+    class ImageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = images[self.path]
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    image_server, image_url = serve(ImageHandler)
+    service = PredictionService(StubPredictor(), ["car", "person"], max_batch_size=4, max_wait_ms=5)
+    backend_server, backend_url = serve(make_handler(service))
+    yield backend_url, image_url, service
+    backend_server.shutdown()
+    image_server.shutdown()
+
+
+def test_setup_returns_model_version(backend):
+    backend_url, _, _ = backend
+    response = requests.post(f"{backend_url}/setup", json={"project": "1", "schema": LABEL_CONFIG})
+    assert response.status_code == 200
+    assert response.json() == {"model_version": "stub"}
+
+
+def test_predict_returns_labelstudio_results(backend):
+    backend_url, image_url, service = backend
+    tasks = [{"id": 1, "data": {"image": f"{image_url}/landscape.jpg"}},
+             {"id": 2, "data": {"image": f"{image_url}/rotated.jpg"}}]
+    response = requests.post(f"{backend_url}/predict", json={"tasks": tasks, "label_config": LABEL_CONFIG})
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["model_version"] == "stub"
+    assert len(payload["results"]) == 2
+    landscape, rotated = (prediction["result"][0] for prediction in payload["results"])
+    assert (landscape["from_name"], landscape["to_name"]) == ("box", "img")
+    assert landscape["value"]["rectanglelabels"] == ["car"]
+    assert (landscape["original_width"], landscape["original_height"]) == (80, 40)
+    # EXIF orientation 6 (rotated 90 degrees) is applied, as Label Studio displays the image.
+    assert (rotated["original_width"], rotated["original_height"]) == (40, 80)
+
+    # The same images are served from the cache on the next request.
+    requests.post(f"{backend_url}/predict", json={"tasks": tasks, "label_config": LABEL_CONFIG})
+    assert service.metrics()["cache"]["hits"] == 2
+    assert json.loads(requests.get(f"{backend_url}/metrics").text)["tasks"] == 4
+
+
+def test_decode_image_applies_exif_orientation():
+    assert decode_image(jpeg_bytes(80, 40)).size == (80, 40)
+    assert decode_image(jpeg_bytes(80, 40, orientation=6)).size == (40, 80)
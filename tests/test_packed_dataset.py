@@ -0,0 +1,121 @@
+import io
+import os
+import numpy as np
+import pytest
+from PIL import Image
+from utils.dataset_preparation import index_extracted_export
+from utils.packed_dataset import PackedDataset, packed_dir, sync_packed_dataset, unpack_split
+from utils.quantization import build_calibration_set
+
+NAMES = ["car", "person"]
+
+
+def write_export(export_dir, items):
+    """
+    Write an extracted export: `items` maps image name -> (color, label lines).
+    """
+    os.makedirs(os.path.join(export_dir, "images"), exist_ok=True)
+    os.makedirs(os.path.join(export_dir, "labels"), exist_ok=True)
+    for name, (color, lines) in items.items():
+        Image.new("RGB", (32, 24), color).save(os.path.join(export_dir, "images", name))
+        with open(os.path.join(export_dir, "labels", os.path.splitext(name)[0] + ".txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def items(count, start=0):
+    return {
+        f"img_{i:03d}.png": ((i, 2 * i, 3 * i), [f"{i % 2} 0.5 0.5 0.25 0.25"]) for i in range(start, start + count)
+    }
+
+
+def locations(pack):
+    return {name: (int(row["shard"]), int(row["offset"]), int(row["split"])) for name, row in zip(pack.names, pack.index)}
+
+
+def sync(export_dir, output_dir):
+    index = index_extracted_export(export_dir, project_id=1)
+    return sync_packed_dataset(index, output_dir, train_ratio=0.75, split_options={"names": NAMES})
+
+
+@pytest.fixture
+def packed(tmp_path):
+    export_dir, output_dir = str(tmp_path / "export"), str(tmp_path / "dataset")
+    write_export(export_dir, items(8))
+    sync(export_dir, output_dir)
+    return export_dir, output_dir
+
+
+def test_pack_round_trip(packed):
+    export_dir, output_dir = packed
+    pack = PackedDataset(packed_dir(output_dir))
+    try:
+        assert sorted(pack.names) == sorted(items(8))
+        assert len(pack.split_indices("train")) + len(pack.split_indices("val")) == 8
+        for i, name in enumerate(pack.names):
+            with open(os.path.join(export_dir, "images", name), "rb") as f:
+                assert bytes(pack.image_bytes(i)) == f.read()
+            assert Image.open(io.BytesIO(pack.image_bytes(i))).size == pack[i]["size"] == (32, 24)
+            number = int(name[4:7])
+            np.testing.assert_allclose(pack.image_labels(i), [[number % 2, 0.5, 0.5, 0.25, 0.25]])
+    finally:
+        pack.close()
+
+
+def test_sync_appends_without_moving_unchanged_images(packed):
+    export_dir, output_dir = packed
+    pack = PackedDataset(packed_dir(output_dir))
+    before = locations(pack)
+    pack.close()
+
+    os.remove(os.path.join(export_dir, "images", "img_000.png"))
+    write_export(export_dir, items(2, start=8))
+    sync(export_dir, output_dir)
+
+    pack = PackedDataset(packed_dir(output_dir))
+    try:
+        after = locations(pack)
+        assert sorted(after) == sorted(set(items(10)) - {"img_000.png"})
+        for name in set(before) & set(after):
+            assert after[name] == before[name]
+        for i, name in enumerate(pack.names):
+            with open(os.path.join(export_dir, "images", name), "rb") as f:
+                assert bytes(pack.image_bytes(i)) == f.read()
+    finally:
+        pack.close()
+
+
+def test_unpack_split_writes_files_dataset(packed):
+    _, output_dir = packed
+    data_yaml = unpack_split(output_dir, NAMES)
+    pack = PackedDataset(packed_dir(output_dir))
+    try:
+        val_names = sorted(pack.names[i] for i in pack.split_indices("val"))
+    finally:
+        pack.close()
+    val_dir = os.path.join(os.path.dirname(data_yaml), "val")
+    assert sorted(os.listdir(os.path.join(val_dir, "images"))) == val_names
+    for name in val_names:
+        with open(os.path.join(val_dir, "labels", os.path.splitext(name)[0] + ".txt")) as f:
+            assert f.read() == f"{int(name[4:7]) % 2} 0.500000 0.500000 0.250000 0.250000\n"
+    with open(data_yaml) as f:
+        assert f'val: "{os.path.abspath(os.path.join(val_dir, "images"))}"' in f.read()
+
+
+def test_packed_calibration_set_samples_train_split(packed):
+    _, output_dir = packed
+    _, image_paths = build_calibration_set(output_dir, NAMES, size=3, packed=True)
+    pack = PackedDataset(packed_dir(output_dir))
+    try:
+        train_names = {pack.names[i] for i in pack.split_indices("train")}
+    finally:
+        pack.close()
+    assert len(image_paths) == 3
+    assert {os.path.basename(path) for path in image_paths} <= train_names
+    # Both classes are represented by the stratified sample.
+    classes = set()
+    for path in image_paths:
+        label_path = os.path.join(os.path.dirname(os.path.dirname(path)), "labels",
+                                  os.path.splitext(os.path.basename(path))[0] + ".txt")
+        with open(label_path) as f:
+            classes.add(f.read().split()[0])
+    assert classes == {"0", "1"}
@@ -0,0 +1,91 @@
+import json
+import os
+import types
+import pipeline
+
+
+def write_config(tmp_path):
+    config = {
+        "output_dataset_dir": str(tmp_path / "dataset"),
+        "training": {"project": str(tmp_path / "runs"), "experiment_name": "exp"},
+    }
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    return str(path), config
+
+
+def fake_stages(monkeypatch, config):
+    """
+    Replace the stage modules with ones that record their calls and write the outputs of the real stages.
+    """
+    calls = []
+    run_dir = pipeline.run_dir_of(config)
+
+    def module(stage):
+        def main(config_path, **kwargs):
+            calls.append((stage, kwargs))
+            if stage == "train":
+                os.makedirs(os.path.join(run_dir, "weights"), exist_ok=True)
+                with open(os.path.join(run_dir, "weights", "best.pt"), "wb") as f:
+                    f.write(b"weights")
+            if stage == "export":
+                os.makedirs(os.path.join(run_dir, "exports"), exist_ok=True)
+                with open(os.path.join(run_dir, "exports", pipeline.EXPORT_INDEX_FILENAME), "w") as f:
+                    f.write("{}")
+        return types.SimpleNamespace(main=main)
+
+    monkeypatch.setattr(pipeline.importlib, "import_module", module)
+    monkeypatch.setattr(pipeline, "training_fingerprint", lambda config: {"dataset": "d", "digest": "manifest-1"})
+    return calls
+
+
+def test_unchanged_stages_are_skipped_except_prepare(tmp_path, monkeypatch):
+    config_path, config = write_config(tmp_path)
+    calls = fake_stages(monkeypatch, config)
+
+    rows = pipeline.run_config(config_path, pipeline.STAGES)
+    assert [status for _, status, _ in rows] == ["ran", "ran", "ran"]
+
+    calls.clear()
+    rows = pipeline.run_config(config_path, pipeline.STAGES)
+    assert [status for _, status, _ in rows] == ["ran", "skipped", "skipped"]
+    assert calls == [("prepare", {})]
+
+    # A new dataset manifest retrains, and the export follows only if best.pt changed.
+    monkeypatch.setattr(pipeline, "training_fingerprint", lambda config: {"dataset": "d", "digest": "manifest-2"})
+    rows = pipeline.run_config(config_path, ["train", "export"])
+    assert [status for _, status, _ in rows] == ["ran", "skipped"]
+
+
+def test_missing_outputs_rerun_the_stage(tmp_path, monkeypatch):
+    config_path, config = write_config(tmp_path)
+    fake_stages(monkeypatch, config)
+    pipeline.run_config(config_path, pipeline.STAGES)
+
+    os.remove(os.path.join(pipeline.run_dir_of(config), "exports", pipeline.EXPORT_INDEX_FILENAME))
+    rows = pipeline.run_config(config_path, ["train", "export"])
+    assert [status for _, status, _ in rows] == ["skipped", "ran"]
+
+
+def test_force_runs_every_stage_and_reexports_every_project(tmp_path, monkeypatch):
+    config_path, config = write_config(tmp_path)
+    calls = fake_stages(monkeypatch, config)
+    pipeline.run_config(config_path, pipeline.STAGES)
+
+    calls.clear()
+    rows = pipeline.run_config(config_path, pipeline.STAGES, force=True)
+    assert [status for _, status, _ in rows] == ["ran", "ran", "ran"]
+    assert calls == [("prepare", {"force_export": True}), ("train", {}), ("export", {})]
+
+
+def test_failing_stage_stops_the_configuration(tmp_path, monkeypatch):
+    config_path, config = write_config(tmp_path)
+    fake_stages(monkeypatch, config)
+
+    def fail(config_path):
+        raise Exception("no dataset")
+    monkeypatch.setattr(pipeline.importlib, "import_module", lambda stage: types.SimpleNamespace(main=fail))
+
+    rows = pipeline.run_config(config_path, pipeline.STAGES)
+    assert [(stage, status) for stage, status, _ in rows] == [("prepare", "failed")]
+    assert pipeline.load_state(pipeline.run_dir_of(config)) == {}
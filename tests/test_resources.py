@@ -0,0 +1,38 @@
+from utils.resources import CPU_BYTES_PER_SAMPLE_640, MAX_CPU_BATCH, choose_training_settings
+
+GIB = 1024 ** 3
+
+
+def host(accelerator="cpu", gpus=0, cores=16, ram_available=32 * GIB, disk_free=1024 * GIB):
+    return {"accelerator": accelerator, "gpus": [{"name": "gpu", "memory": 16 * GIB}] * gpus, "cores": cores,
+            "ram_total": ram_available, "ram_available": ram_available, "disk_free": disk_free}
+
+
+def test_cpu_batch_follows_available_memory():
+    settings, sources = choose_training_settings(host(ram_available=8 * GIB), 1000, 640)
+    assert settings["batch"] == 32
+    assert settings["batch"] * CPU_BYTES_PER_SAMPLE_640 <= 8 * GIB * 0.25
+    assert (settings["device"], settings["amp"], settings["workers"]) == ("cpu", False, 4)
+    assert set(sources.values()) == {"auto"}
+    assert choose_training_settings(host(ram_available=1024 * GIB), 10, 640)[0]["batch"] == MAX_CPU_BATCH
+    assert choose_training_settings(host(ram_available=0), 10, 640)[0]["batch"] == 8
+
+
+def test_cuda_uses_autobatch_on_one_gpu_and_a_fixed_batch_on_several():
+    single, _ = choose_training_settings(host("cuda", gpus=1), 1000, 640)
+    multi, _ = choose_training_settings(host("cuda", gpus=4), 1000, 640)
+    assert (single["batch"], single["device"], single["amp"]) == (-1, "0", True)
+    assert (multi["batch"], multi["device"], multi["workers"]) == (64, "0,1,2,3", 4)
+
+
+def test_images_are_cached_in_ram_when_they_fit_and_never_on_disk_automatically():
+    assert choose_training_settings(host(), 1000, 640)[0]["cache"] == "ram"
+    # 100k images at 640 need about 123 GB: too much for the RAM, and the disk cache stays opt-in.
+    assert choose_training_settings(host(), 100000, 640)[0]["cache"] is False
+
+
+def test_training_block_overrides_the_automatic_choice():
+    settings, sources = choose_training_settings(host(), 100000, 640, {"cache": "disk", "batch": 4, "epochs": 3})
+    assert (settings["cache"], settings["batch"]) == ("disk", 4)
+    assert (sources["cache"], sources["batch"], sources["workers"]) == ("config", "config", "auto")
+    assert "epochs" not in settings
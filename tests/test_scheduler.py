@@ -0,0 +1,55 @@
+import os
+import subprocess
+import sys
+from scheduler import finish_stage, plan_slots, recover_jobs
+from utils.job_queue import submit_job
+from utils.resources import CONCURRENT_RUNS_ENV
+
+HOST = {"cores": 16, "accelerator": "cpu", "gpus": []}
+
+
+def test_cpu_host_is_split_into_compute_and_io_slots(monkeypatch):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(16)), raising=False)
+    slots = plan_slots(HOST, io_slots=1)
+    assert [(slot["name"], slot["kind"]) for slot in slots] == [("cpu0", "compute"), ("cpu1", "compute"), ("io0", "io")]
+    assert slots[0]["cpus"] == list(range(8)) and slots[1]["cpus"] == list(range(8, 16))
+    assert slots[0]["env"] == {"OMP_NUM_THREADS": "8", CONCURRENT_RUNS_ENV: "2"}
+    assert slots[2]["env"] == {}
+    assert len(plan_slots(HOST, cpu_slots=4, io_slots=0)) == 4
+
+
+def test_gpu_host_gets_one_slot_per_gpu(monkeypatch):
+    monkeypatch.setattr(os, "sched_getaffinity", lambda pid: set(range(8)), raising=False)
+    host = {"cores": 8, "accelerator": "cuda", "gpus": [{"name": "a"}, {"name": "b"}, {"name": "c"}]}
+    slots = plan_slots(host, io_slots=0)
+    assert [slot["env"]["CUDA_VISIBLE_DEVICES"] for slot in slots] == ["0", "1", "2"]
+    assert {slot["env"][CONCURRENT_RUNS_ENV] for slot in slots} == {"3"}
+
+
+def test_recover_jobs_adopts_live_stages_and_requeues_dead_ones():
+    queue = {"next_id": 1, "jobs": []}
+    alive, dead, done = (submit_job(queue, f"configs/{name}.json", ["prepare", "train"]) for name in "abc")
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    alive.update(status="running", slot="cpu0", pid=os.getpid())
+    dead.update(status="running", slot="io0", pid=process.pid)
+    done.update(status="done")
+
+    assert recover_jobs(queue) == {alive["id"]: os.getpid()}
+    assert (alive["status"], dead["status"], dead["slot"], dead["pid"]) == ("running", "queued", None, None)
+    assert done["status"] == "done"
+
+
+def test_finish_stage_advances_or_fails_the_job():
+    queue = {"next_id": 1, "jobs": []}
+    job = submit_job(queue, "configs/a.json", ["prepare", "train"])
+    job.update(status="running", slot="io0", pid=1)
+    finish_stage(job, 0, 1.0)
+    assert (job["status"], job["stage_index"], job["slot"]) == ("queued", 1, None)
+    job.update(status="running", slot="cpu0", pid=2)
+    finish_stage(job, None, 1.0)
+    assert (job["status"], job["stage_index"]) == ("queued", 1)
+    job.update(status="running", slot="cpu0", pid=3)
+    finish_stage(job, 1, 1.0)
+    assert job["status"] == "failed"
+    assert [entry["stage"] for entry in job["history"]] == ["prepare", "train", "train"]
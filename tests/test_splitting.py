@@ -0,0 +1,66 @@
+import pytest
+from utils.splitting import split_items
+
+
+def write_labels(tmp_path, classes):
+    """
+    Write one YOLO label file per name: `classes` maps name -> list of class ids.
+    """
+    paths = {}
+    for name, ids in classes.items():
+        path = tmp_path / f"{name}.txt"
+        path.write_text("".join(f"{class_id} 0.5 0.5 0.1 0.1\n" for class_id in ids))
+        paths[name] = str(path)
+    return paths
+
+
+def test_hash_split_is_stable_as_the_dataset_grows():
+    names = [f"img_{i:03d}.jpg" for i in range(200)]
+    first = split_items(names[:100], 0.8, mode="hash", seed=3)
+    second = split_items(names, 0.8, mode="hash", seed=3)
+    assert {name: second[name] for name in first} == first
+    assert 140 <= sum(split == "train" for split in second.values()) <= 180
+
+
+def test_seeded_split_is_reproducible():
+    names = [f"img_{i}.jpg" for i in range(50)]
+    assert split_items(names, 0.7, mode="seeded", seed=1) == split_items(list(reversed(names)), 0.7, mode="seeded", seed=1)
+    assert sum(split == "train" for split in split_items(names, 0.7, mode="seeded").values()) == 35
+
+
+def test_placed_names_count_towards_the_quota():
+    placed = {f"old_{i}.jpg": "train" for i in range(10)}
+    new = [f"new_{i}.jpg" for i in range(5)]
+    # 15 items at 0.8 make 12 training items: 10 are there already, so 2 of the new ones go to train.
+    splits = split_items(new, 0.8, mode="seeded", placed=placed)
+    assert sorted(splits) == sorted(new)
+    assert sum(split == "train" for split in splits.values()) == 2
+
+
+def test_stratified_split_uses_the_rarest_class_of_the_whole_dataset(tmp_path):
+    # Among the new names class 0 is the rarer one, but over the whole dataset class 1 is.
+    classes = {f"old_{i}": [0] for i in range(20)}
+    classes.update({f"both_{i}": [0, 1] for i in range(4)})
+    classes.update({f"one_{i}": [1] for i in range(6)})
+    label_paths = write_labels(tmp_path, classes)
+    placed = {f"old_{i}": "train" if i < 16 else "val" for i in range(20)}
+    new = [name for name in classes if not name.startswith("old_")]
+
+    splits = split_items(new, 0.5, mode="seeded", label_paths=label_paths, stratify=True, placed=placed)
+    # All new names share the class 1 group, which has no placed members and is split in half. Grouped with
+    # the class 0 images (16 of 24 in train), the "both" names would all have gone to val instead.
+    assert sorted(splits) == sorted(new)
+    assert sum(split == "train" for split in splits.values()) == 5
+
+
+def test_unparsable_label_files_are_background(tmp_path):
+    label_paths = write_labels(tmp_path, {"a": [0], "b": [1]})
+    (tmp_path / "c.txt").write_text("car 0.5 0.5 0.1 0.1\n")
+    label_paths["c"] = str(tmp_path / "c.txt")
+    splits = split_items(["a", "b", "c"], 0.5, mode="hash", label_paths=label_paths, stratify=True, nc=2)
+    assert sorted(splits) == ["a", "b", "c"]
+
+
+def test_unknown_mode_raises():
+    with pytest.raises(ValueError):
+        split_items(["a"], mode="alphabetical")
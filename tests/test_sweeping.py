@@ -0,0 +1,65 @@
+import types
+import pytest
+from utils.sweeping import (
+    expand_trials, load_progress, median_stopping_callbacks, pareto_front, progress_path, rank_trials, save_progress,
+    search_space,
+)
+
+KEY = "metrics/mAP50-95(B)"
+
+
+def run_epochs(callbacks, values, start_epoch=0):
+    trainer = types.SimpleNamespace(start_epoch=start_epoch, metrics={}, stop=False)
+    callbacks["on_train_start"](trainer)
+    for epoch, value in enumerate(values, 1):
+        trainer.metrics = {KEY: value}
+        callbacks["on_fit_epoch_end"](trainer)
+        if trainer.stop:
+            return epoch
+    return None
+
+
+def test_trials_below_the_median_of_their_peers_stop_after_the_grace_period(tmp_path):
+    sweep_dir = str(tmp_path)
+    for name, values in (("a", [0.1, 0.5, 0.6]), ("b", [0.2, 0.4, 0.5])):
+        save_progress(progress_path(sweep_dir, name), {"values": values, "stopped_at": None})
+    callbacks = median_stopping_callbacks(sweep_dir, "slow", grace_epochs=2, min_trials=3)
+    # Only two peers reached epoch 3: not enough to judge.
+    assert run_epochs(callbacks, [0.1, 0.2, 0.25, 0.25]) is None
+
+    save_progress(progress_path(sweep_dir, "c"), {"values": [0.3, 0.3, 0.3], "stopped_at": None})
+    assert run_epochs(callbacks, [0.1, 0.2, 0.25, 0.25]) == 3
+    assert load_progress(progress_path(sweep_dir, "slow")) == {"values": [0.1, 0.2, 0.25], "stopped_at": 3}
+
+    # A trial as good as the median keeps going, and a resumed one keeps its earlier epochs.
+    callbacks = median_stopping_callbacks(sweep_dir, "good", grace_epochs=2, min_trials=3)
+    assert run_epochs(callbacks, [0.5, 0.5, 0.5]) is None
+    run_epochs(callbacks, [0.55], start_epoch=2)
+    assert load_progress(progress_path(sweep_dir, "good"))["values"] == [0.5, 0.5, 0.55]
+
+
+def test_pareto_front_and_ranking():
+    rows = [
+        {"name": "a", "accuracy": 0.6, "p50_ms": 30.0},
+        {"name": "b", "accuracy": 0.5, "p50_ms": 10.0},
+        {"name": "c", "accuracy": 0.5, "p50_ms": 20.0},
+        {"name": "d", "accuracy": 0.7, "p50_ms": None},
+        {"name": "e", "accuracy": None, "p50_ms": 5.0},
+    ]
+    pareto_front(rows)
+    assert [row["name"] for row in rows if row["pareto"]] == ["a", "b"]
+
+    assert [row["name"] for row in rank_trials(rows, min_accuracy=0.5)] == ["b", "c", "a", "d", "e"]
+    assert [row["meets_bar"] for row in rows] == [True, True, True, True, False]
+    assert [row["name"] for row in rank_trials(rows, min_accuracy=0.65)] == ["d", "a", "b", "c", "e"]
+    assert [row["name"] for row in rank_trials(rows)] == ["d", "a", "b", "c", "e"]
+
+
+def test_search_space_grid_and_sampling():
+    space = search_space({"sweep": {"search_space": {"lr0": [0.01, 0.001], "imgsz": [320, 640]}}})
+    assert expand_trials(space) == [{"imgsz": 320, "lr0": 0.01}, {"imgsz": 320, "lr0": 0.001},
+                                    {"imgsz": 640, "lr0": 0.01}, {"imgsz": 640, "lr0": 0.001}]
+    sample = expand_trials(space, max_trials=2, seed=1)
+    assert len(sample) == 2 and sample == expand_trials(space, max_trials=2, seed=1)
+    with pytest.raises(Exception):
+        search_space({"sweep": {"search_space": {"lr0": 0.01}}})